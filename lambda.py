@@ -36,14 +36,31 @@ if "AWS_EXECUTION_ENV" in os.environ:
 
 django.setup()
 
+from rdrf.db.filestorage import update_scan_statuses  # noqa: E402
 from rdrf.services.io.notifications.longitudinal_followups import (  # noqa: E402
     send_longitudinal_followups,
 )
+from rdrf.services.io.notifications.outbox import (  # noqa: E402
+    send_queued_emails,
+)
+from useraudit.retention import rollup_login_logs  # noqa: E402
 
 
 def longitudinal_followup_handler(_event, _context):
     send_longitudinal_followups()
 
 
+def virus_scan_status_handler(_event, _context):
+    update_scan_statuses()
+
+
+def queued_emails_handler(_event, _context):
+    send_queued_emails()
+
+
+def login_log_retention_handler(_event, _context):
+    rollup_login_logs()
+
+
 if __name__ == "__main__":
     longitudinal_followup_handler(None, None)
@@ -35,6 +35,7 @@ from rdrf.exporter_utils import (
     export_registries,
     export_registry_dashboards,
 )
+from rdrf.helpers.definition_version import bump_definition_version
 from rdrf.models.definition.models import (
     CDEFile,
     CDEPermittedValue,
@@ -98,6 +99,12 @@ def export_registry_action(modeladmin, request, registries):
     return export_wrapper(request, partial(export_registries, registries))
 
 
+@admin.action(description="Clear cached report schema")
+def clear_definition_cache_action(modeladmin, request, registries):
+    bump_definition_version()
+    messages.success(request, _("Cached report schema cleared"))
+
+
 @admin.action(description="Export")
 def export_context_form_group_action(modeladmin, request, context_form_groups):
     return export_wrapper(
@@ -170,7 +177,7 @@ class RegistryFormAdmin(admin.ModelAdmin):
 
 
 class RegistryAdmin(admin.ModelAdmin):
-    actions = [export_registry_action]
+    actions = [export_registry_action, clear_definition_cache_action]
 
     def get_queryset(self, request):
         if not request.user.is_superuser:
@@ -0,0 +1,91 @@
+import functools
+import mmap
+import struct
+
+# A sorted array of (sha1 digest, breach count) records after the header,
+# so a hash can be found with a binary search of the memory mapped file
+INDEX_HEADER = b"PWNIDX01"
+INDEX_RECORD = struct.Struct(">20sI")
+MAX_COUNT = 2**32 - 1
+
+
+class BreachedPasswordIndexError(Exception):
+    pass
+
+
+class BreachedPasswordIndex:
+    def __init__(self, path):
+        with open(path, "rb") as index_file:
+            self._map = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        if self._map[: len(INDEX_HEADER)] != INDEX_HEADER:
+            self._map.close()
+            raise BreachedPasswordIndexError(
+                "%s is not a breached password index" % path
+            )
+        self.size = (len(self._map) - len(INDEX_HEADER)) // INDEX_RECORD.size
+
+    def _offset(self, position):
+        return len(INDEX_HEADER) + position * INDEX_RECORD.size
+
+    def count(self, sha1_hex):
+        """
+        Returns the number of breaches of the password with the given
+        sha1 hex digest, 0 if it isn't in the index.
+        """
+        digest = bytes.fromhex(sha1_hex)
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            offset = self._offset(middle)
+            found = self._map[offset : offset + len(digest)]
+            if found < digest:
+                low = middle + 1
+            elif found > digest:
+                high = middle
+            else:
+                return INDEX_RECORD.unpack_from(self._map, offset)[1]
+        return 0
+
+
+def write_index(lines, index_file, min_count=0):
+    """
+    Writes an index from the "SHA1:COUNT" lines of a breached passwords
+    dump (ordered by hash), skipping the hashes breached min_count times
+    or less. Returns the number of hashes written.
+    """
+    index_file.write(INDEX_HEADER)
+    previous = b""
+    written = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            sha1_hex, count = line.split(":")
+            digest = bytes.fromhex(sha1_hex)
+            count = int(count)
+        except ValueError:
+            raise BreachedPasswordIndexError(
+                "Line %s is not SHA1:COUNT" % line_number
+            )
+        if len(digest) != 20:
+            raise BreachedPasswordIndexError(
+                "Line %s is not a SHA1 hash" % line_number
+            )
+        if digest <= previous:
+            raise BreachedPasswordIndexError(
+                "Line %s is out of order, the dump must be ordered by hash"
+                % line_number
+            )
+        previous = digest
+        if count > min_count:
+            index_file.write(INDEX_RECORD.pack(digest, min(count, MAX_COUNT)))
+            written += 1
+    return written
+
+
+@functools.lru_cache(maxsize=None)
+def open_index(path):
+    return BreachedPasswordIndex(path)
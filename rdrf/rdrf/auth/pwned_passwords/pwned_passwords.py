@@ -1,21 +1,36 @@
+import functools
 import hashlib
 import logging
 
 import requests
 from django.conf import settings
 
+from rdrf.auth.pwned_passwords.local_index import open_index
+
 logger = logging.getLogger(__name__)
 
 
 def check_breaches(password):
-    api = PwnedPasswordsApi()
+    if settings.BREACHED_PASSWORD_INDEX:
+        index = open_index(settings.BREACHED_PASSWORD_INDEX)
+        return index.count(hashlib.sha1(password.encode("utf8")).hexdigest())
 
     prefix, suffix = _hashed_components(password)
-    result = api.range(prefix)
+    result = _cached_range(settings.BREACHED_PASSWORD_ENDPOINT, prefix)
 
     return _result_to_dict(result).get(suffix.upper(), 0)
 
 
+@functools.lru_cache(maxsize=256)
+def _cached_range(_base_url, prefix):
+    # The endpoint is only part of the cache key.
+    # Failed requests raise, so aren't cached.
+    result = PwnedPasswordsApi().range(prefix)
+    if result is None:
+        raise PwnedPasswordsApiError("No range returned for %s" % prefix)
+    return result
+
+
 def _hashed_components(password, slice_index=5):
     sha1_password = hashlib.sha1(password.encode("utf8")).hexdigest()
     return sha1_password[:slice_index], sha1_password[slice_index:]
@@ -29,6 +44,10 @@ def _result_to_dict(result):
     return dict(map(convert_password_tuple, result.splitlines()))
 
 
+class PwnedPasswordsApiError(Exception):
+    pass
+
+
 class PwnedPasswordsApi:
     RANGE_URI = "range"
 
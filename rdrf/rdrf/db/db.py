@@ -15,6 +15,8 @@ class RegistryRouter:
         ("rdrf", "formprogress"),
         ("rdrf", "modjgo"),
         ("rdrf", "clinicaldata"),
+        ("rdrf", "clinicaldatavalue"),
+        ("rdrf", "clinicalhistoryvalue"),
     )
 
     @classmethod
@@ -1,10 +1,12 @@
 import datetime
 import logging
+from collections import defaultdict
 from itertools import zip_longest
 from operator import itemgetter
 
 from aws_xray_sdk.core import xray_recorder
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import router, transaction
 
 from rdrf.db.filestorage import create_filestorage
 from rdrf.forms.file_upload import FileUpload, wrap_fs_data_for_form
@@ -17,7 +19,15 @@ from rdrf.helpers.utils import (
     mongo_key,
     silk_profile,
 )
-from rdrf.models.definition.models import ClinicalData
+from rdrf.models.definition.models import (
+    ClinicalData,
+    ClinicalDataValue,
+    ClinicalHistoryValue,
+    apply_cde_changes,
+    diff_cde_values,
+    iter_cde_values,
+    nest_cde_values,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -459,6 +469,9 @@ class DynamicDataWrapper(object):
 
     REGISTRY_SPECIFIC_PATIENT_DATA_COLLECTION = "registry_specific_patient_data"
 
+    # History records between full snapshots, the others only hold deltas
+    HISTORY_CHECKPOINT_INTERVAL = 50
+
     def __init__(self, obj, filestore_class=None, rdrf_context_id=None):
         # When set to True by integration tests, uses testing mongo database
         if rdrf_context_id == "add":
@@ -486,13 +499,14 @@ class DynamicDataWrapper(object):
             self.obj.pk,
         )
 
+    def _context_id_to_search_for(self):
+        return None if self.rdrf_context_id == "add" else self.rdrf_context_id
+
     def _get_record(self, registry, collection_name, filter_by_context=True):
         qs = ClinicalData.objects.collection(registry, collection_name)
-        context_id_to_search_for = (
-            None if self.rdrf_context_id == "add" else self.rdrf_context_id
-        )
         return qs.find(
-            self.obj, context_id_to_search_for if filter_by_context else None
+            self.obj,
+            self._context_id_to_search_for() if filter_by_context else None,
         )
 
     def soft_delete(self, registry, user_id):
@@ -547,13 +561,22 @@ class DynamicDataWrapper(object):
         cde_code,
         collection="cdes",
     ):
-        modjgo_queryset = self._get_record(registry_code, collection)
-        if modjgo_queryset:
-            # NB data is a ClinicalData queryset
-            modjgo_object = modjgo_queryset.first()
-            return modjgo_object.cde_val(form_name, section_code, cde_code)
-        else:
+        if collection == "cdes":
+            try:
+                return ClinicalDataValue.objects.lookup(
+                    registry_code,
+                    self.obj,
+                    form_name,
+                    section_code,
+                    cde_code,
+                    context_id=self._context_id_to_search_for(),
+                )
+            except KeyError:
+                return None
+        modjgo_object = self._get_record(registry_code, collection).first()
+        if modjgo_object is None:
             return None
+        return modjgo_object.cde_val(form_name, section_code, cde_code)
 
     def get_cde_history(
         self,
@@ -563,36 +586,20 @@ class DynamicDataWrapper(object):
         cde_code,
         formset_index=None,
     ):
-        from rdrf.helpers.utils import get_cde_value
-        from rdrf.models.definition.models import (
-            CommonDataElement,
-            Registry,
-            RegistryForm,
-            Section,
-        )
+        from rdrf.models.definition.models import Section
 
-        registry_model = Registry.objects.get(code=registry_code)
-        form_model = RegistryForm.objects.get(
-            registry=registry_model, name=form_name
-        )
         section_model = Section.objects.get(code=section_code)
-        cde_model = CommonDataElement.objects.get(code=cde_code)
-
-        def fmt(snapshot, snapshot_number):
-            return {
-                "timestamp": datetime.datetime.strptime(
-                    snapshot["timestamp"][:19], "%Y-%m-%d %H:%M:%S"
-                ),
-                "value": get_cde_value(
-                    form_model,
-                    section_model,
-                    cde_model,
-                    snapshot["record"],
-                    formset_index,
-                ),
-                "user": snapshot.get("username", ""),
-                "id": str(snapshot_number),
-            }
+
+        def value_at(values):
+            if not section_model.allow_multiple:
+                return values.get(None)
+            indexes = sorted(index for index in values if index is not None)
+            items = [values[index] for index in indexes]
+            if formset_index is None:
+                return items
+            if int(formset_index) >= len(items):
+                return None
+            return items[int(formset_index)]
 
         def collapse_same(snapshots):
             collapsed = snapshots[:1]
@@ -606,15 +613,85 @@ class DynamicDataWrapper(object):
                     collapsed.append(snap)
             return collapsed
 
-        record_query = self._get_record(
-            registry_code, "history", filter_by_context=True
+        records = (
+            self._get_record(registry_code, "history", filter_by_context=True)
+            .find(record_type__in=["snapshot", "delta"])
+            .values_list("pk", "data__timestamp", "data__username")
         )
-        record_query = record_query.find(record_type="snapshot")
-        data = [
-            fmt(snapshot, i) for i, snapshot in enumerate(record_query.data())
-        ]
+        changes = defaultdict(list)
+        for history_id, item_index, value, removed in (
+            ClinicalHistoryValue.objects.for_object(
+                registry_code, self.obj, self._context_id_to_search_for()
+            )
+            .cde(form_name, section_code, cde_code)
+            .order_by("clinical_data_id", "item_index")
+            .values_list("clinical_data_id", "item_index", "value", "removed")
+        ):
+            changes[history_id].append((item_index, value, removed))
+
+        # Replay the indexed changes of the CDE instead of loading
+        # every history document
+        data = []
+        values = {}
+        for i, (history_id, timestamp, username) in enumerate(records):
+            for item_index, value, removed in changes[history_id]:
+                if removed:
+                    values.pop(item_index, None)
+                else:
+                    values[item_index] = value
+            data.append(
+                {
+                    "timestamp": datetime.datetime.strptime(
+                        timestamp[:19], "%Y-%m-%d %H:%M:%S"
+                    ),
+                    "value": value_at(values),
+                    "user": username or "",
+                    "id": str(i),
+                }
+            )
         return collapse_same(sorted(data, key=itemgetter("timestamp")))
 
+    def get_history_record(self, registry_code, timestamp):
+        """
+        Reconstructs the clinical data document as it was at the given
+        time, from the last full snapshot before it and the deltas saved
+        after that snapshot.
+        """
+        if isinstance(timestamp, str):
+            timestamp = datetime.datetime.fromisoformat(timestamp)
+        history = self._get_record(registry_code, "history")
+        record_ids = [
+            (history_id, record_type)
+            for history_id, record_type, saved_at in history.values_list(
+                "pk", "data__record_type", "data__timestamp"
+            )
+            if datetime.datetime.fromisoformat(saved_at) <= timestamp
+        ]
+        checkpoints = [
+            index
+            for index, (_, record_type) in enumerate(record_ids)
+            if record_type == "snapshot"
+        ]
+        if not checkpoints:
+            return None
+
+        records = list(
+            history.filter(
+                pk__in=[
+                    history_id
+                    for history_id, _ in record_ids[checkpoints[-1] :]
+                ]
+            ).data()
+        )
+        record = dict(records[0]["record"])
+        if len(records) > 1:
+            values = dict(iter_cde_values(record))
+            for delta in records[1:]:
+                apply_cde_changes(values, delta["changes"])
+                record = dict(delta["document"])
+            record["forms"] = nest_cde_values(values)
+        return record
+
     def load_registry_specific_data(self, registry_model=None):
         data = {}
         if registry_model is None:
@@ -839,7 +916,7 @@ class DynamicDataWrapper(object):
                 data=cdes_record,
             )
 
-        from rdrf.jsonb import _convert_datetime_to_str
+        from rdrf.forms.fields.jsonb import _convert_datetime_to_str
 
         # Not sure why I have to do this explicitly
         _convert_datetime_to_str(cdes_modjgo.data)
@@ -936,26 +1013,76 @@ class DynamicDataWrapper(object):
         record.data.update(nested_data)
         record.save()
 
+    def _needs_history_checkpoint(self, history):
+        last_snapshot_id = (
+            history.find(record_type="snapshot")
+            .order_by("-pk")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if last_snapshot_id is None:
+            return True
+        deltas = history.filter(pk__gt=last_snapshot_id).count()
+        return deltas >= self.HISTORY_CHECKPOINT_INTERVAL - 1
+
+    def _latest_history_values(self, history):
+        """
+        Returns the CDE values held after the last history record, replayed
+        from the last full snapshot. At most HISTORY_CHECKPOINT_INTERVAL
+        records are read, however long the history is.
+        """
+        last_snapshot = (
+            history.filter(data__has_key="record")
+            .order_by("-pk")
+            .values_list("pk", "data")
+            .first()
+        )
+        if last_snapshot is None:
+            return {}
+        snapshot_id, data = last_snapshot
+        values = dict(iter_cde_values(data["record"] or {}))
+        for delta in history.filter(pk__gt=snapshot_id).order_by("pk").data():
+            apply_cde_changes(values, delta.get("changes") or [])
+        return values
+
     def _save_longitudinal_snapshot(
         self, registry_code, record, form_name=None, form_user=None
     ):
         try:
             timestamp = str(datetime.datetime.now())
             patient_id = record.data["django_id"]
+            history = self._get_record(registry_code, "history")
+            changes = diff_cde_values(
+                self._latest_history_values(history),
+                dict(iter_cde_values(record.data)),
+            )
             snapshot = {
                 "django_id": patient_id,
                 "django_model": record.data.get("django_model", None),
                 "registry_code": registry_code,
-                "record_type": "snapshot",
                 "username": self.user.username if self.user else None,
                 "timestamp": timestamp,
                 "form_user": form_user,
                 "form_name": form_name,
-                "record": record.data,
             }
-
-            history = self._make_record(registry_code, "history", data=snapshot)
-            history.save()
+            if self._needs_history_checkpoint(history):
+                snapshot["record_type"] = "snapshot"
+                snapshot["record"] = record.data
+            else:
+                snapshot["record_type"] = "delta"
+                snapshot["document"] = {
+                    key: value
+                    for key, value in record.data.items()
+                    if key != "forms"
+                }
+                snapshot["changes"] = changes
+
+            with transaction.atomic(using=router.db_for_write(ClinicalData)):
+                history = self._make_record(
+                    registry_code, "history", data=snapshot
+                )
+                history.save()
+                ClinicalHistoryValue.objects.record(history, changes)
         except Exception as ex:
             logger.error(
                 "Couldn't add to history for patient %s: %s" % (patient_id, ex)
@@ -971,7 +1098,9 @@ class DynamicDataWrapper(object):
             )
 
     @silk_profile(name="Save Form Progress")
-    def save_form_progress(self, registry, context_model=None):
+    def save_form_progress(
+        self, registry, context_model=None, changed_cde_keys=None
+    ):
         from rdrf.forms.progress.form_progress import FormProgress
 
         xray_recorder.begin_subsegment("build_objects")
@@ -986,7 +1115,7 @@ class DynamicDataWrapper(object):
 
         xray_recorder.begin_subsegment("save_progress")
         progress = form_progress.save_progress(
-            self.obj, dynamic_data, context_model
+            self.obj, dynamic_data, context_model, changed_cde_keys
         )
         xray_recorder.end_subsegment()
         return progress
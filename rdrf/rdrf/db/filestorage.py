@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import re
 import uuid
@@ -19,15 +20,21 @@ __all__ = [
     "get_id",
     "delete_file_wrapper",
     "get_file",
+    "get_download_url",
+    "iter_file_range",
     "create_filestorage",
     "StorageFileInfo",
 ]
 
+# Files are hashed and streamed in chunks of this size rather than read
+# into memory at once
+FILE_CHUNK_SIZE = 64 * 1024
+
 
 StorageFileInfo = namedtuple(
     "StorageFileInfo",
-    "item filename uploaded_by patient mime_type",
-    defaults=(None, None, None, None, None),
+    "item filename uploaded_by patient mime_type size scan_status",
+    defaults=(None, None, None, None, None, None, None),
 )
 EMPTY_FILE_INFO = StorageFileInfo()
 
@@ -125,6 +132,24 @@ def delete_file_wrapper(file_ref):
     return None
 
 
+def file_digest(file_obj):
+    """
+    Reads the file in chunks, returning its sha256 hex digest, its size
+    and its first bytes (for sniffing the mime type).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    file_obj.seek(0)
+    for chunk in file_obj.chunks(FILE_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+        if len(head) < 2048:
+            head += chunk[: 2048 - len(head)]
+    file_obj.seek(0)
+    return digest.hexdigest(), size, head
+
+
 def store_file(
     registry_code,
     uploaded_by,
@@ -134,8 +159,8 @@ def store_file(
     form_name=None,
     section_code=None,
 ):
-    mime_type = magic.from_buffer(file_obj.read(2048), mime=True)
-    file_obj.seek(0)
+    content_hash, size, head = file_digest(file_obj)
+    mime_type = magic.from_buffer(head, mime=True)
     storage_filename = str(uuid.uuid4())
     original_filename = file_obj.name
     cde_file = CDEFile(
@@ -149,7 +174,27 @@ def store_file(
         original_filename=original_filename,
         filename=storage_filename,
         mime_type=mime_type,
+        content_hash=content_hash,
+        size=size,
+        scan_status=initial_scan_status(),
     )
+
+    duplicate = (
+        CDEFile.objects.filter(
+            registry_code=registry_code,
+            patient=patient,
+            content_hash=content_hash,
+            size=size,
+        )
+        .exclude(item="")
+        .first()
+    )
+    if duplicate is not None:
+        # The patient already has a file with the same content, share it
+        # rather than uploading another copy
+        cde_file.item = duplicate.item.name
+        cde_file.filename = duplicate.filename
+        cde_file.scan_status = duplicate.scan_status
     cde_file.save()
 
     return {"django_file_id": cde_file.id, "file_name": original_filename}
@@ -184,6 +229,8 @@ def get_file(file_id):
             uploaded_by=cde_file.uploaded_by,
             patient=cde_file.patient,
             mime_type=cde_file.mime_type,
+            size=cde_file.size,
+            scan_status=get_scan_status(cde_file),
         )
     except CDEFile.DoesNotExist:
         return EMPTY_FILE_INFO
@@ -191,6 +238,47 @@ def get_file(file_id):
         return EMPTY_FILE_INFO
 
 
+def get_download_url(file_info):
+    """
+    Returns a pre-signed url the client can download the file from
+    directly, or None if the file has to be streamed by the app (file
+    system storage, hand off disabled or the file isn't clean yet).
+    """
+    if not settings.FILE_DOWNLOAD_PRESIGNED_URLS:
+        return None
+    if not isinstance(default_storage, CustomS3Storage):
+        return None
+    if file_info.scan_status != VirusScanStatus.CLEAN:
+        return None
+    return default_storage.url(
+        file_info.item.name,
+        parameters={
+            "ResponseContentDisposition": 'filename="%s"' % file_info.filename,
+            "ResponseContentType": file_info.mime_type
+            or "application/octet-stream",
+        },
+        expire=settings.FILE_DOWNLOAD_PRESIGNED_URL_EXPIRY,
+    )
+
+
+def iter_file_range(file_obj, start, length, chunk_size=FILE_CHUNK_SIZE):
+    """
+    Yields length bytes of the open file from start, in chunks, closing
+    the file at the end.
+    """
+    try:
+        file_obj.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file_obj.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file_obj.close()
+
+
 class CustomS3Storage(S3Boto3Storage):
     def open(self, file_name, mode="rb"):
         try:
@@ -252,6 +340,9 @@ class VirusScanStatus:
     INFECTED = "infected"
     NOT_FOUND = "not found"
 
+    # The statuses which won't change any more
+    FINISHED = (CLEAN, INFECTED)
+
 
 class S3VirusChecker:
     def __init__(self, storage):
@@ -269,9 +360,77 @@ class S3VirusChecker:
         return VirusScanStatus.CLEAN
 
 
-def virus_checker_result(filename):
+def virus_checker_result(filename, storage=None):
     if not settings.VIRUS_CHECKING_ENABLED:
         return VirusScanStatus.CLEAN
-    if isinstance(default_storage, CustomS3Storage):
-        return S3VirusChecker(default_storage).check(filename)
+    storage = storage or default_storage
+    # Only storages scanning their files (e.g. CustomS3Storage) tag them
+    if hasattr(storage, "get_tags"):
+        return S3VirusChecker(storage).check(filename)
+    return VirusScanStatus.CLEAN
+
+
+def initial_scan_status():
+    if settings.VIRUS_CHECKING_ENABLED:
+        return ""
     return VirusScanStatus.CLEAN
+
+
+def _save_scan_status(cde_file, status):
+    cde_file.scan_status = status
+    # Identical uploads share the item, so share its status too
+    CDEFile.objects.filter(item=cde_file.item.name).update(scan_status=status)
+
+
+def get_scan_status(cde_file, refresh=False):
+    """
+    Returns the virus scan status saved on the file without asking the
+    storage, unless refresh is set and the scan hasn't finished yet.
+    """
+    if not settings.VIRUS_CHECKING_ENABLED:
+        return VirusScanStatus.CLEAN
+    if cde_file.scan_status in VirusScanStatus.FINISHED or not refresh:
+        return cde_file.scan_status or VirusScanStatus.SCANNING
+
+    status = virus_checker_result(cde_file.item.name, cde_file.item.storage)
+    if status != cde_file.scan_status:
+        _save_scan_status(cde_file, status)
+    return status
+
+
+def update_scan_statuses(batch_size=100):
+    """
+    Checks the files whose scan hasn't finished with the storage, one batch
+    at a time, saving the new statuses. Returns the number of files updated.
+    """
+    if not settings.VIRUS_CHECKING_ENABLED:
+        return 0
+
+    pending = CDEFile.objects.exclude(
+        scan_status__in=VirusScanStatus.FINISHED
+    ).order_by("pk")
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(pending.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        changed = []
+        for cde_file in batch:
+            try:
+                status = virus_checker_result(
+                    cde_file.item.name, cde_file.item.storage
+                )
+            except Exception:
+                logger.exception(
+                    "Couldn't check the scan status of CDEFile id=%s"
+                    % cde_file.pk
+                )
+                continue
+            if status != cde_file.scan_status:
+                cde_file.scan_status = status
+                changed.append(cde_file)
+        CDEFile.objects.bulk_update(changed, ["scan_status"])
+        updated += len(changed)
+    return updated
@@ -1,5 +1,5 @@
 import logging
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
 from registry.patients.models import Patient, PatientAddress
 
@@ -831,3 +831,217 @@ class GeneralisedFieldExpressionParser(object):
         return ClinicalFormExpression(
             self.registry_model, form_model, section_model, cde_model
         )
+
+
+FieldExpressionWriteError = namedtuple(
+    "FieldExpressionWriteError", "row patient_id field_expression message"
+)
+
+
+class FieldExpressionWriter(object):
+    """
+    Applies many (patient id, field expression, value) writes at once.
+
+    Each distinct expression is parsed once, the patients, their default
+    contexts and clinical data are loaded in bulk, and the writes of each
+    patient are applied to their clinical data document in order. Every
+    document and patient is then saved once, all in one transaction.
+    Rows which fail are reported rather than stopping the other writes.
+    """
+
+    def __init__(self, registry_model):
+        self.registry_model = registry_model
+        self.parser = GeneralisedFieldExpressionParser(registry_model)
+        self._expressions = {}
+
+    def _parse(self, field_expression):
+        if field_expression not in self._expressions:
+            self._expressions[field_expression] = self.parser.parse(
+                field_expression
+            )
+        return self._expressions[field_expression]
+
+    def _default_contexts(self, patients):
+        from django.contrib.contenttypes.models import ContentType
+
+        from django.db import transaction
+
+        from rdrf.db.contexts_api import RDRFContextError, RDRFContextManager
+        from rdrf.models.definition.models import RDRFContext
+
+        context_manager = RDRFContextManager(self.registry_model)
+        contexts = RDRFContext.objects.filter(
+            registry=self.registry_model,
+            content_type=ContentType.objects.get_for_model(Patient),
+            object_id__in=patients.keys(),
+        )
+        if context_manager.supports_contexts:
+            contexts = contexts.filter(
+                context_form_group__context_type="F",
+                context_form_group__is_default=True,
+            )
+        patient_contexts = {}
+        for context in contexts:
+            patient_contexts.setdefault(context.object_id, []).append(context)
+
+        default_contexts = {}
+        context_errors = {}
+        for patient_id, patient in patients.items():
+            found = patient_contexts.get(patient_id, [])
+            if len(found) == 1:
+                default_contexts[patient_id] = found[0]
+                continue
+            # Let the context manager create the missing contexts
+            # (or complain about ambiguous ones)
+            try:
+                with transaction.atomic():
+                    default_contexts[patient_id] = (
+                        context_manager.get_or_create_default_context(patient)
+                    )
+            except RDRFContextError as ex:
+                context_errors[patient_id] = str(ex)
+        return default_contexts, context_errors
+
+    def _apply(self, patient, mongo_data, context_id, writes, errors):
+        patient_changed = False
+        for row, field_expression, value in writes:
+            expression = self._parse(field_expression)
+            if isinstance(expression, BadColumnExpression):
+                errors.append(
+                    FieldExpressionWriteError(
+                        row, patient.pk, field_expression, "Parse error"
+                    )
+                )
+                continue
+            try:
+                patient, mongo_data = expression.set_value(
+                    patient, mongo_data, value, context_id=context_id
+                )
+            except NotImplementedError:
+                errors.append(
+                    FieldExpressionWriteError(
+                        row, patient.pk, field_expression, "Not Implemented"
+                    )
+                )
+                continue
+            except Exception as ex:
+                errors.append(
+                    FieldExpressionWriteError(
+                        row,
+                        patient.pk,
+                        field_expression,
+                        "Error setting value: %s" % ex,
+                    )
+                )
+                continue
+            patient_changed |= isinstance(expression, PatientFieldExpression)
+        return patient_changed, mongo_data
+
+    def write(self, rows, dry_run=False):
+        """
+        rows: iterable of (patient id, field expression, value)
+        dry_run: apply the writes but roll them back
+
+        Returns the errors of the rows which couldn't be written, with the
+        row numbers counted from 0.
+        """
+        from datetime import datetime
+
+        from django.db import router, transaction
+
+        from rdrf.forms.fields.jsonb import _convert_datetime_to_str
+        from rdrf.models.definition.models import ClinicalData
+
+        errors = []
+        writes = OrderedDict()
+        for row, (patient_id, field_expression, value) in enumerate(rows):
+            try:
+                patient_id = int(patient_id)
+            except (TypeError, ValueError):
+                errors.append(
+                    FieldExpressionWriteError(
+                        row, patient_id, field_expression, "Bad patient id"
+                    )
+                )
+                continue
+            writes.setdefault(patient_id, []).append(
+                (row, field_expression, value)
+            )
+
+        patients = Patient.objects.filter(
+            rdrf_registry=self.registry_model
+        ).in_bulk(writes.keys())
+        for patient_id in writes.keys() - patients.keys():
+            errors.extend(
+                FieldExpressionWriteError(
+                    row, patient_id, field_expression, "Patient not found"
+                )
+                for row, field_expression, __ in writes.pop(patient_id)
+            )
+
+        clinical_db = router.db_for_write(ClinicalData)
+        with transaction.atomic(), transaction.atomic(using=clinical_db):
+            contexts, context_errors = self._default_contexts(patients)
+            for patient_id, message in context_errors.items():
+                errors.extend(
+                    FieldExpressionWriteError(
+                        row,
+                        patient_id,
+                        field_expression,
+                        "No default context: %s" % message,
+                    )
+                    for row, field_expression, __ in writes.pop(patient_id)
+                )
+            records = {}
+            for record in ClinicalData.objects.collection(
+                self.registry_model.code, "cdes"
+            ).filter(
+                django_model="Patient",
+                django_id__in=patients.keys(),
+                context_id__in=[context.pk for context in contexts.values()],
+            ):
+                records.setdefault(
+                    (record.django_id, record.context_id), record
+                )
+
+            for patient_id, patient_writes in writes.items():
+                patient = patients[patient_id]
+                context_id = contexts[patient_id].pk
+                record = records.get((patient_id, context_id))
+                if record is None:
+                    record = ClinicalData.create(
+                        patient,
+                        registry_code=self.registry_model.code,
+                        collection="cdes",
+                        context_id=context_id,
+                        data={"context_id": context_id, "forms": []},
+                    )
+                patient_changed, record.data = self._apply(
+                    patient, record.data, context_id, patient_writes, errors
+                )
+                record.data["timestamp"] = datetime.now()
+                _convert_datetime_to_str(record.data)
+
+                try:
+                    with transaction.atomic(using=clinical_db):
+                        with transaction.atomic():
+                            if record.pk or record.data["forms"]:
+                                record.save()
+                            if patient_changed:
+                                patient.save()
+                except Exception as ex:
+                    errors.extend(
+                        FieldExpressionWriteError(
+                            row,
+                            patient_id,
+                            field_expression,
+                            "Failed to save: %s" % ex,
+                        )
+                        for row, field_expression, __ in patient_writes
+                    )
+
+            if dry_run:
+                transaction.set_rollback(True)
+                transaction.set_rollback(True, using=clinical_db)
+
+        return sorted(errors)
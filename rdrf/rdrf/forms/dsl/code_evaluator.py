@@ -1,7 +1,10 @@
 import logging
 import operator
+import threading
 from itertools import chain
 
+from rdrf.helpers.definition_version import get_definition_version
+
 from ..dynamic.value_fetcher import DynamicValueFetcher
 from .constants import HIDDEN, VISIBLE
 from .parse_operations import BooleanOp, Condition, parse_dsl, transform_tree
@@ -71,6 +74,168 @@ class ConditionEvaluator:
         )
 
 
+def _combine_checks(condition_checks, boolean_ops):
+    check_result = condition_checks[0]
+    for op, next_check in zip(boolean_ops, condition_checks[1:]):
+        if op == "and":
+            check_result = check_result and next_check
+        else:
+            check_result = check_result or next_check
+    return check_result
+
+
+class CompiledCondition:
+    def __init__(self, condition):
+        self.section = condition.cde.get_section()
+        self.cde = condition.cde.cde
+        self.operator = condition.operator
+        self.value = condition.actual_value
+        self.data_type = condition.cde.get_data_type()
+
+    def check(self, cde_values):
+        existing_value = cde_values.get((self.section, self.cde))
+        final_value = (
+            existing_value[0]
+            if existing_value and isinstance(existing_value, list)
+            else existing_value
+        )
+        evaluator = ConditionEvaluator(
+            self.operator, self.value, final_value, self.data_type
+        )
+        return evaluator.evaluate()
+
+
+class CompiledInstruction:
+    def __init__(self, hidden_when, target_cdes, conditions, boolean_ops):
+        self.hidden_when = hidden_when
+        self.target_cdes = target_cdes
+        self.conditions = conditions
+        self.boolean_ops = boolean_ops
+
+    def hidden_cdes(self, cde_values):
+        check_result = _combine_checks(
+            [c.check(cde_values) for c in self.conditions], self.boolean_ops
+        )
+        return (
+            self.target_cdes if bool(check_result) == self.hidden_when else []
+        )
+
+
+class CompiledRules:
+    """
+    The conditional rendering rules of a form, parsed and resolved against
+    the form definition once, so they can be evaluated against the data of
+    many patients without re-parsing the DSL.
+    """
+
+    def __init__(self, form):
+        self.form_name = form.name
+        self.instructions = []
+        cde_helper = CDEHelper(form)
+        try:
+            parse_tree = parse_dsl(form.conditional_rendering_rules)
+            transformed_tree = transform_tree(
+                parse_tree, cde_helper, SectionHelper(form)
+            )
+        except Exception:
+            logger.exception("Exception while parsing dsl")
+            return
+
+        for inst in transformed_tree.children:
+            target, action, *conditions = inst.children
+            cde_validation = target.invalid_cdes()
+            if cde_validation:
+                logger.error(
+                    f'Invalid CDEs specified: {" ".join([str(cde) for cde in cde_validation])}'
+                )
+                continue
+            if action.action not in (HIDDEN, VISIBLE):
+                # Enabling or disabling CDEs doesn't hide them
+                continue
+            if target.has_qualifier:
+                target_cdes = list(
+                    chain(
+                        *[
+                            cde_helper.get_cdes_for_section(s.cde)
+                            for s in target.target_cdes
+                        ]
+                    )
+                )
+            else:
+                target_cdes = [t.cde for t in target.target_cdes]
+            self.instructions.append(
+                CompiledInstruction(
+                    action.action == HIDDEN,
+                    target_cdes,
+                    [
+                        CompiledCondition(c)
+                        for c in conditions
+                        if isinstance(c, Condition)
+                    ],
+                    [
+                        op.operator
+                        for op in conditions
+                        if isinstance(op, BooleanOp)
+                    ],
+                )
+            )
+        self.condition_keys = {
+            (c.section, c.cde)
+            for inst in self.instructions
+            for c in inst.conditions
+        }
+
+    def _get_cde_values(self, dynamic_data):
+        # Only the first value of each CDE is compared, as the
+        # DynamicValueFetcher does for multisections
+        cde_values = {}
+        if not dynamic_data or not self.instructions:
+            return cde_values
+        for form_dict in dynamic_data["forms"]:
+            if form_dict["name"] != self.form_name:
+                continue
+            for section_dict in form_dict["sections"]:
+                if section_dict["allow_multiple"]:
+                    cde_dicts = chain(*section_dict["cdes"])
+                else:
+                    cde_dicts = section_dict["cdes"]
+                for cde_dict in cde_dicts:
+                    key = (section_dict["code"], cde_dict["code"])
+                    if key in self.condition_keys:
+                        cde_values.setdefault(key, cde_dict["value"])
+            break
+        return cde_values
+
+    def hidden_cdes(self, dynamic_data):
+        cde_values = self._get_cde_values(dynamic_data)
+        result = set()
+        for inst in self.instructions:
+            result.update(inst.hidden_cdes(cde_values))
+        return result
+
+
+_compiled_rules_cache = {}
+_compiled_rules_cache_lock = threading.Lock()
+
+
+def get_compiled_rules(form):
+    """
+    Returns the compiled conditional rendering rules of the form, compiling
+    them at most once per process and registry definition version.
+    """
+    key = (
+        form.pk,
+        form.conditional_rendering_rules,
+        get_definition_version(),
+    )
+    with _compiled_rules_cache_lock:
+        compiled = _compiled_rules_cache.get(form.pk)
+        if compiled is None or compiled[0] != key:
+            compiled = (key, CompiledRules(form))
+            _compiled_rules_cache[form.pk] = compiled
+        return compiled[1]
+
+
 # This should be used only on previously validated from DSLs
 class CodeEvaluator:
     """
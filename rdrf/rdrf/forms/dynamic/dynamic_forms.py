@@ -1,13 +1,17 @@
+import copy
 import logging
+import threading
 from collections import OrderedDict
 from datetime import datetime as dt
 
 from django.conf import settings
 from django.forms import BaseForm
 from django.utils.formats import date_format
+from django.utils.translation import get_language
 
 from rdrf.forms.dynamic.field_lookup import FieldFactory
 from rdrf.helpers.cde_data_types import CDEDataTypes
+from rdrf.helpers.definition_version import get_definition_version
 from rdrf.models.definition.models import CommonDataElement
 
 logger = logging.getLogger(__name__)
@@ -38,6 +42,102 @@ def create_form_class(owner_class_name):
     return form_class
 
 
+_section_form_cache = {}
+_section_form_cache_lock = threading.Lock()
+
+
+def _format_date(input):
+    # Transform date from YYYY-MM-DD to DD-MM-YYYY
+    if not input:
+        return
+    # TODO: python 3.7 re-write to use date.fromisoformat(input)
+    as_date = dt.strptime(input, "%Y-%m-%d")
+    return date_format(as_date, format="d-m-Y")
+
+
+def _get_previous_value(section, cde, previous_values):
+    prev_value = previous_values.get(cde.code)
+    if section.allow_multiple and section.code in previous_values:
+        prev_value = [
+            v
+            for x in previous_values[section.code]
+            for k, v in x.items()
+            if k.endswith(cde.code)
+        ]
+
+    if prev_value and cde.pv_group:
+        values = {
+            el["code"].lower(): el["value"]
+            for el in cde.pv_group.as_dict["values"]
+        }
+        if isinstance(prev_value, list):
+            prev_value = [values.get(v.lower()) for v in prev_value]
+        else:
+            prev_value = values.get(prev_value.lower())
+
+    if cde.datatype == CDEDataTypes.DATE and prev_value:
+        is_list = isinstance(prev_value, list)
+        prev_value = (
+            [_format_date(el) for el in prev_value]
+            if is_list
+            else _format_date(prev_value)
+        )
+    return prev_value
+
+
+def _get_section_form(
+    registry, data_defs, registry_form, section, cde_models, **kwargs
+):
+    """
+    Returns the cached section form class and its fields which depend on
+    the patient, building them at most once per process and registry
+    definition version for each set of visible CDEs.
+    """
+    key = (
+        registry.pk,
+        registry_form.pk,
+        section.pk,
+        tuple(cde.code for cde in cde_models),
+        bool(kwargs["is_superuser"]),
+        get_language(),
+    )
+    version = get_definition_version()
+    with _section_form_cache_lock:
+        cached = _section_form_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    base_fields = OrderedDict()
+    patient_fields = {}
+    for cde in cde_models:
+        field_factory = FieldFactory(
+            registry, data_defs, registry_form, section, cde, **kwargs
+        )
+        cde_field = field_factory.create_field()
+        cde_field.important = cde.important
+        cde_field.previous_value = None
+
+        field_code_on_form = "%s%s%s%s%s" % (
+            registry_form.name,
+            settings.FORM_SECTION_DELIMITER,
+            section.code,
+            settings.FORM_SECTION_DELIMITER,
+            cde.code,
+        )
+        base_fields[field_code_on_form] = cde_field
+        if field_factory.depends_on_patient():
+            patient_fields[field_code_on_form] = cde
+
+    form_class = type(
+        "SectionForm",
+        (BaseForm,),
+        {"base_fields": base_fields, "auto_id": True},
+    )
+    with _section_form_cache_lock:
+        _section_form_cache[key] = (version, form_class, patient_fields)
+    return form_class, patient_fields
+
+
 def create_form_class_for_section(
     registry,
     data_defs,
@@ -51,14 +151,6 @@ def create_form_class_for_section(
     allowed_cdes=(),
     previous_values=None,
 ):
-    def format_date(input):
-        # Transform date from YYYY-MM-DD to DD-MM-YYYY
-        if not input:
-            return
-        # TODO: python 3.7 re-write to use date.fromisoformat(input)
-        as_date = dt.strptime(input, "%Y-%m-%d")
-        return date_format(as_date, format="d-m-Y")
-
     if previous_values is None:
         previous_values = {}
 
@@ -67,71 +159,64 @@ def create_form_class_for_section(
 
     if allowed_cdes:
         cde_models = (c for c in cde_models if c.code in allowed_cdes)
-    base_fields = OrderedDict()
+    groups = None
+    visible_cdes = []
     for cde in cde_models:
         cde_policy = data_defs.cde_policies.get(cde.code)
         if cde_policy and user_groups:
+            if groups is None:
+                groups = list(user_groups.all())
             if not cde_policy.is_allowed(
-                user_groups.all(), patient_model, is_superuser=is_superuser
+                groups, patient_model, is_superuser=is_superuser
             ):
                 continue
+        visible_cdes.append(cde)
 
-        cde_field = FieldFactory(
-            registry,
-            data_defs,
-            registry_form,
-            section,
-            cde,
-            injected_model=injected_model,
-            injected_model_id=injected_model_id,
-            is_superuser=is_superuser,
-        ).create_field()
+    if not visible_cdes:
+        return None
 
-        cde_field.important = cde.important
-        prev_value = previous_values.get(cde.code)
-        if section.allow_multiple and section.code in previous_values:
-            prev_value = [
-                v
-                for x in previous_values[section.code]
-                for k, v in x.items()
-                if k.endswith(cde.code)
-            ]
-
-        cde_field.previous_value = prev_value
-        if prev_value and cde.pv_group:
-            values = {
-                el["code"].lower(): el["value"]
-                for el in cde.pv_group.as_dict["values"]
-            }
-            if isinstance(prev_value, list):
-                cde_field.previous_value = [
-                    values.get(v.lower()) for v in prev_value
-                ]
-            else:
-                cde_field.previous_value = values.get(prev_value.lower())
-
-        if cde.datatype == CDEDataTypes.DATE and cde_field.previous_value:
-            previous = cde_field.previous_value
-            is_list = isinstance(previous, list)
-            cde_field.previous_value = (
-                [format_date(el) for el in previous]
-                if is_list
-                else format_date(previous)
-            )
-
-        field_code_on_form = "%s%s%s%s%s" % (
-            registry_form.name,
-            settings.FORM_SECTION_DELIMITER,
-            section.code,
-            settings.FORM_SECTION_DELIMITER,
-            cde.code,
+    factory_kwargs = {
+        "injected_model": injected_model,
+        "injected_model_id": injected_model_id,
+        "is_superuser": is_superuser,
+    }
+    form_class, patient_fields = _get_section_form(
+        registry,
+        data_defs,
+        registry_form,
+        section,
+        visible_cdes,
+        **factory_kwargs,
+    )
+    previous = {
+        field_code_on_form: _get_previous_value(
+            section, cde_field.cde, previous_values
         )
+        for field_code_on_form, cde_field in form_class.base_fields.items()
+    }
+    if not patient_fields and not any(previous.values()):
+        return form_class
+
+    # The cached fields are shared, so the ones specific to this patient
+    # are set on copies
+    base_fields = OrderedDict()
+    for field_code_on_form, cde_field in form_class.base_fields.items():
+        cde = patient_fields.get(field_code_on_form)
+        if cde is not None:
+            cde_field = FieldFactory(
+                registry,
+                data_defs,
+                registry_form,
+                section,
+                cde,
+                **factory_kwargs,
+            ).create_field()
+            cde_field.important = cde.important
+        else:
+            cde_field = copy.copy(cde_field)
+        cde_field.previous_value = previous[field_code_on_form]
         base_fields[field_code_on_form] = cde_field
 
     form_class_dict = {"base_fields": base_fields, "auto_id": True}
 
-    return (
-        type("SectionForm", (BaseForm,), form_class_dict)
-        if base_fields
-        else None
-    )
+    return type("SectionForm", (BaseForm,), form_class_dict)
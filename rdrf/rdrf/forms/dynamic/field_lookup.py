@@ -326,6 +326,22 @@ class FieldFactory:
                 "could not locate widget from widget string: %s" % widget_string
             )
 
+    def depends_on_patient(self):
+        """
+        Whether the field is built using the injected model, so can't be
+        shared between patients (calculated fields and widgets given the
+        widget context).
+        """
+        if self._is_calculated_field():
+            return True
+        widget_name = self.cde.widget_name
+        if not widget_name:
+            return False
+        if widget_name in widgets.get_all_widgets():
+            widget_class = widgets.get_widget_class(widget_name)
+            return bool(self._inject_widget_context(widget_class))
+        return self._is_parametrised_widget(widget_name)
+
     def create_field(self):
         field = self._create_field()
         field.cde = self.cde
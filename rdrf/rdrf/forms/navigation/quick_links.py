@@ -1,4 +1,5 @@
 import logging
+import threading
 from collections import namedtuple
 from functools import reduce
 from operator import attrgetter
@@ -14,6 +15,7 @@ from registry import groups
 from registry.groups import GROUPS as RDRF_GROUPS
 from report.models import ReportDesign
 
+from rdrf.helpers.definition_version import get_definition_version
 from rdrf.helpers.registry_features import RegistryFeatures
 
 logger = logging.getLogger(__name__)
@@ -522,6 +524,13 @@ class RegularMenuConfig(MenuConfig):
         return ret_val
 
 
+# Quick links built per process, keyed by the registries they were built
+# for and the registry definition version (which covers registry features
+# and group permissions)
+_quick_links_cache = {}
+_quick_links_cache_lock = threading.Lock()
+
+
 class QuickLinks:
     """
     A convenience class to make it easy to see what links are provided to users on the "Home" screen
@@ -531,9 +540,35 @@ class QuickLinks:
 
     def __init__(self, registries):
         self.menu_config = self.REGULAR_MENU_CONFIG(registries)
+        self._group_menu_links = {}
+
+    @classmethod
+    def for_registries(cls, registries, registry_ids=None):
+        """
+        Returns the quick links of the registries, building the menus only
+        the first time they are needed for the registries' definitions.
+        """
+        if registry_ids is None:
+            registry_ids = [registry.pk for registry in registries]
+        version = get_definition_version()
+        key = (cls, frozenset(registry_ids), settings.DESIGN_MODE)
+        with _quick_links_cache_lock:
+            cached = _quick_links_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        quick_links = cls(registries)
+        with _quick_links_cache_lock:
+            _quick_links_cache[key] = (version, quick_links)
+        return quick_links
 
     def menu_links(self, groups):
-        return ordered_links(self.menu_config.menu_links(groups))
+        key = frozenset(groups)
+        links = self._group_menu_links.get(key)
+        if links is None:
+            links = self.menu_config.menu_links(groups)
+            self._group_menu_links[key] = links
+        return ordered_links(links)
 
     def settings_links(self):
         return ordered_links(self.menu_config.settings_links())
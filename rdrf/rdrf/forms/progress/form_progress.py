@@ -6,9 +6,13 @@ from aws_xray_sdk.core import xray_recorder
 from django.templatetags.static import static
 from django.urls import reverse
 
-from rdrf.forms.dsl.code_evaluator import CodeEvaluator
+from rdrf.forms.dsl.code_evaluator import get_compiled_rules
 from rdrf.helpers.registry_features import RegistryFeatures
-from rdrf.helpers.utils import de_camelcase, parse_iso_datetime
+from rdrf.helpers.utils import (
+    de_camelcase,
+    get_form_section_code,
+    parse_iso_datetime,
+)
 from rdrf.models.definition.models import ClinicalData
 
 from ..dynamic.value_fetcher import DynamicValueFetcher
@@ -97,6 +101,23 @@ class FormProgressError(Exception):
     pass
 
 
+def calculate_form_currency(form_model, dynamic_data):
+    from datetime import datetime, timedelta
+
+    form_timestamp_key = "%s_timestamp" % form_model.name
+    one_year_ago = datetime.now() - timedelta(weeks=52)
+
+    if dynamic_data is None:
+        return False
+
+    if form_timestamp_key in dynamic_data:
+        timestamp = parse_iso_datetime(dynamic_data[form_timestamp_key])
+        if timestamp >= one_year_ago:
+            return True
+
+    return False
+
+
 class FormProgressCalculator:
     def __init__(
         self, registry_model, form_model, dynamic_data, progress_cdes_map
@@ -121,8 +142,8 @@ class FormProgressCalculator:
 
     def _get_hidden_cdes(self, form_model):
         if form_model and form_model.conditional_rendering_rules:
-            code_eval = CodeEvaluator(form_model, self.dynamic_data)
-            return code_eval.determine_hidden_cdes()
+            compiled_rules = get_compiled_rules(form_model)
+            return compiled_rules.hidden_cdes(self.dynamic_data)
         return set()
 
     def _get_progress_cdes(self):
@@ -201,22 +222,7 @@ class FormProgressCalculator:
         return result
 
     def _calculate_form_currency(self):
-        from datetime import datetime, timedelta
-
-        form_timestamp_key = "%s_timestamp" % self.form_model.name
-        one_year_ago = datetime.now() - timedelta(weeks=52)
-
-        if self.dynamic_data is None:
-            return False
-
-        if form_timestamp_key in self.dynamic_data:
-            timestamp = parse_iso_datetime(
-                self.dynamic_data[form_timestamp_key]
-            )
-            if timestamp >= one_year_ago:
-                return True
-
-        return False
+        return calculate_form_currency(self.form_model, self.dynamic_data)
 
     def _form_section_traversal(self):
         if self.dynamic_data is None:
@@ -395,7 +401,38 @@ class FormProgress:
                 return form_model.applicable_to(self.current_patient)
         return True
 
-    def _calculate(self, dynamic_data, patient_model=None, context_model=None):
+    def _get_stored_form_progress(self, form_model, stored_progress):
+        keys = {
+            metric: f"{form_model.name}_form_{metric}"
+            for metric in [
+                ProgressMetric.PROGRESS,
+                ProgressMetric.HAS_DATA,
+                ProgressMetric.CDES_STATUS,
+            ]
+        }
+        if not all(key in stored_progress for key in keys.values()):
+            return None
+        return {metric: stored_progress[key] for metric, key in keys.items()}
+
+    def _calculate(
+        self,
+        dynamic_data,
+        patient_model=None,
+        context_model=None,
+        stored_progress=None,
+        changed_form_names=None,
+        complete_data=False,
+    ):
+        """
+        Calculates the progress of all applicable forms and groups.
+
+        If the stored progress and the names of the forms changed since it
+        was saved are given, only the changed forms are recalculated and the
+        stored progress of the other forms is reused.
+
+        complete_data indicates the dynamic data holds every form saved in
+        the context, so the patient's saved data needn't be loaded.
+        """
         logger.info("calculating progress")
         if patient_model is not None:
             self.current_patient = patient_model
@@ -406,13 +443,17 @@ class FormProgress:
         if not progress_metadata:
             return
 
+        incremental = (
+            stored_progress is not None and changed_form_names is not None
+        )
+
         groups_progress = {}
         forms_progress = {}
 
         xray_recorder.begin_subsegment("get_dynamic_data")
         existing_patient_data = (
             patient_model.get_dynamic_data(self.registry_model)
-            if patient_model
+            if patient_model and not (incremental or complete_data)
             else {}
         )
         existing_form_dyn_data = (
@@ -439,25 +480,41 @@ class FormProgress:
             if not self._applicable(form_model):
                 continue
             form_name = form_model.name
-            if (
-                form_name != current_form_name
-                and form_name in existing_form_dyn_data
-            ):
-                # Load existing data from previously saved forms because dynamic_data
-                # contains data only for the currently submitted form. As progress is cummulative
-                # we need existing data to properly compute it
-                form_dynamic_data = existing_form_dyn_data[form_name]
-            else:
-                form_dynamic_data = dynamic_data
 
-            fpc = FormProgressCalculator(
-                self.registry_model,
-                form_model,
-                form_dynamic_data,
-                self.progress_cdes_map,
-            )
-            fpc.calculate_progress()
-            forms_progress[form_model.name] = fpc.progress_as_dict()
+            form_progress = None
+            if incremental and form_name not in changed_form_names:
+                form_progress = self._get_stored_form_progress(
+                    form_model, stored_progress
+                )
+                if form_progress is not None:
+                    # Currency depends on the time since the form was
+                    # saved, so it can't be reused
+                    form_progress[ProgressMetric.CURRENT] = (
+                        calculate_form_currency(form_model, dynamic_data)
+                    )
+
+            if form_progress is None:
+                if (
+                    form_name != current_form_name
+                    and form_name in existing_form_dyn_data
+                ):
+                    # Load existing data from previously saved forms because dynamic_data
+                    # contains data only for the currently submitted form. As progress is cummulative
+                    # we need existing data to properly compute it
+                    form_dynamic_data = existing_form_dyn_data[form_name]
+                else:
+                    form_dynamic_data = dynamic_data
+
+                fpc = FormProgressCalculator(
+                    self.registry_model,
+                    form_model,
+                    form_dynamic_data,
+                    self.progress_cdes_map,
+                )
+                fpc.calculate_progress()
+                form_progress = fpc.progress_as_dict()
+
+            forms_progress[form_name] = form_progress
 
             for progress_group in progress_metadata:
                 if form_model.name in progress_metadata[progress_group]:
@@ -470,19 +527,20 @@ class FormProgress:
                             ProgressMetric.HAS_DATA: False,
                         }
 
-                    groups_progress[progress_group][
-                        ProgressMetric.REQUIRED
-                    ] += fpc.form_progress_dict[ProgressMetric.REQUIRED]
-                    groups_progress[progress_group][ProgressMetric.FILLED] += (
-                        fpc.form_progress_dict[ProgressMetric.FILLED]
+                    group_progress = groups_progress[progress_group]
+                    group_progress[ProgressMetric.REQUIRED] += form_progress[
+                        ProgressMetric.PROGRESS
+                    ].get(ProgressMetric.REQUIRED, 0)
+                    group_progress[ProgressMetric.FILLED] += form_progress[
+                        ProgressMetric.PROGRESS
+                    ].get(ProgressMetric.FILLED, 0)
+                    group_progress[ProgressMetric.CURRENT] = (
+                        group_progress[ProgressMetric.CURRENT]
+                        or form_progress[ProgressMetric.CURRENT]
                     )
-                    groups_progress[progress_group][ProgressMetric.CURRENT] = (
-                        groups_progress[progress_group][ProgressMetric.CURRENT]
-                        or fpc.form_currency
-                    )
-                    groups_progress[progress_group][ProgressMetric.HAS_DATA] = (
-                        groups_progress[progress_group][ProgressMetric.HAS_DATA]
-                        or fpc.form_has_data
+                    group_progress[ProgressMetric.HAS_DATA] = (
+                        group_progress[ProgressMetric.HAS_DATA]
+                        or form_progress[ProgressMetric.HAS_DATA]
                     )
         xray_recorder.end_subsegment()
 
@@ -659,15 +717,51 @@ class FormProgress:
 
     #########################################################################################
     # save progress
-    def save_progress(self, patient_model, dynamic_data, context_model=None):
+    def save_progress(
+        self,
+        patient_model,
+        dynamic_data,
+        context_model=None,
+        changed_cde_keys=None,
+        complete_data=False,
+    ):
+        """
+        Saves the progress calculated from the dynamic data.
+
+        changed_cde_keys are the delimited keys of the cdes saved since the
+        progress was last saved. If given, only the progress of the forms
+        containing them is recalculated.
+        """
+        # The calculator is reused for many patients (eg by the
+        # update_form_progress workers), so the progress of the previous
+        # patient mustn't be saved if nothing is calculated for this one
+        self.progress_data = {}
         if not dynamic_data:
             return self.progress_data
+        record = self._get_query(patient_model, context_model).first()
+
         xray_recorder.begin_subsegment("calculate")
-        self._calculate(dynamic_data, patient_model, context_model)
+        if record and changed_cde_keys is not None:
+            changed_form_names = {
+                get_form_section_code(key)[0] for key in changed_cde_keys
+            }
+            self._calculate(
+                dynamic_data,
+                patient_model,
+                context_model,
+                stored_progress=record.data,
+                changed_form_names=changed_form_names,
+            )
+        else:
+            self._calculate(
+                dynamic_data,
+                patient_model,
+                context_model,
+                complete_data=complete_data,
+            )
         xray_recorder.end_subsegment()
 
         xray_recorder.begin_subsegment("update")
-        record = self._get_query(patient_model, context_model).first()
         if not record:
             ctx = dict(context_id=context_model.id if context_model else None)
             context_id = context_model.id if context_model else None
@@ -684,7 +778,9 @@ class FormProgress:
         return self.progress_data
 
     # a convenience method
-    def save_for_patient(self, patient_model, context_model=None):
+    def save_for_patient(
+        self, patient_model, context_model=None, changed_cde_keys=None
+    ):
         self.reset()
         from rdrf.db.dynamic_data import DynamicDataWrapper
 
@@ -697,4 +793,6 @@ class FormProgress:
         dynamic_data = wrapper.load_dynamic_data(
             self.registry_model.code, "cdes", flattened=False
         )
-        return self.save_progress(patient_model, dynamic_data, context_model)
+        return self.save_progress(
+            patient_model, dynamic_data, context_model, changed_cde_keys
+        )
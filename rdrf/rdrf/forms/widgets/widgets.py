@@ -23,7 +23,7 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import gettext as _
 from registry.patients.models import PatientConsent
 
-from rdrf.db.filestorage import virus_checker_result
+from rdrf.db.filestorage import get_scan_status, virus_checker_result
 from rdrf.forms.dynamic.validation import iso_8601_validator
 from rdrf.helpers.cde_data_types import CDEDataTypes
 from rdrf.helpers.registry_features import RegistryFeatures
@@ -566,6 +566,9 @@ class FileInputWrapper(widgets.ClearableFileInput):
         except Exception:
             logger.exception("Exception while checking virus scan result")
 
+    def get_virus_check_result(self, value, filename):
+        return self.do_virus_check(filename) if filename else ""
+
     def get_context(self, name, value, attrs):
         context = super().get_context(name, value, attrs)
         checkbox_name = self.clear_checkbox_name(name)
@@ -583,9 +586,9 @@ class FileInputWrapper(widgets.ClearableFileInput):
                 "value": self.get_value(value) if is_initial else _("Not set"),
                 "initial_text": self.initial_text,
                 "clear_checkbox_label": self.clear_checkbox_label,
-                "virus_check_result": self.do_virus_check(filename)
-                if filename
-                else "",
+                "virus_check_result": self.get_virus_check_result(
+                    value, filename
+                ),
                 "virus_check_id": checkbox_name.replace("-", "_"),
             }
         )
@@ -609,14 +612,26 @@ class ConsentFileInput(FileInputWrapper):
 
 
 class CustomFileInput(FileInputWrapper):
-    def get_filename(self, value):
+    @staticmethod
+    def _get_cde_file(value):
         django_file_id = getattr(value, "fs_dict", {}).get("django_file_id")
         if django_file_id is None:
             return None
+        return CDEFile.objects.get(pk=django_file_id)
 
-        cde_file = CDEFile.objects.get(pk=django_file_id)
+    def get_filename(self, value):
+        cde_file = self._get_cde_file(value)
+        if cde_file is None:
+            return None
         return file_upload_to(cde_file, cde_file.filename)
 
+    def get_virus_check_result(self, value, filename):
+        # The saved status is shown, pending scans are polled by the page
+        cde_file = self._get_cde_file(value) if filename else None
+        if cde_file is None:
+            return ""
+        return get_scan_status(cde_file)
+
 
 class SliderWidget(widgets.TextInput):
     @staticmethod
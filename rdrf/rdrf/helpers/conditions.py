@@ -0,0 +1,92 @@
+import ast
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The python subset allowed in applicability and CDE policy conditions,
+# eg "patient.age > 6 and 'WA' in patient.working_groups"
+ALLOWED_NODES = (
+    ast.Expression,
+    ast.BoolOp,
+    ast.And,
+    ast.Or,
+    ast.UnaryOp,
+    ast.Not,
+    ast.USub,
+    ast.UAdd,
+    ast.BinOp,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Compare,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.In,
+    ast.NotIn,
+    ast.Is,
+    ast.IsNot,
+    ast.IfExp,
+    ast.Call,
+    ast.Attribute,
+    ast.Subscript,
+    ast.Slice,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.List,
+    ast.Tuple,
+    ast.Set,
+)
+
+
+class ConditionError(ValueError):
+    pass
+
+
+def _validate(tree, names):
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ConditionError(
+                "%s is not allowed in conditions" % type(node).__name__
+            )
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise ConditionError("Unknown name %s in condition" % node.id)
+        if isinstance(node, ast.Attribute) and node.attr.startswith("_"):
+            raise ConditionError(
+                "Private attribute %s is not allowed in conditions" % node.attr
+            )
+        # Only methods of the values can be called, eg patient.email.endswith()
+        if isinstance(node, ast.Call) and not isinstance(
+            node.func, ast.Attribute
+        ):
+            raise ConditionError("Only method calls are allowed in conditions")
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_condition(condition, names):
+    """
+    Returns the code object of a condition expression using only the given
+    names, raising ConditionError if it isn't a valid condition.
+
+    Compiled conditions are cached by their text, so editing a definition
+    simply compiles the new text.
+    """
+    try:
+        tree = ast.parse(condition.strip(), mode="eval")
+    except SyntaxError as ex:
+        raise ConditionError("Invalid condition %r: %s" % (condition, ex))
+    _validate(tree, names)
+    return compile(tree, "<condition>", "eval")
+
+
+def evaluate_condition(condition, **context):
+    code = compile_condition(condition, tuple(sorted(context)))
+    return eval(code, {"__builtins__": {}}, context)
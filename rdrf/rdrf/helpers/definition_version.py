@@ -0,0 +1,89 @@
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+
+logger = logging.getLogger(__name__)
+
+DEFINITION_VERSION_CACHE_KEY = "registry_definition_version"
+
+# The version read in the current definition version scope of the thread
+_scope = threading.local()
+
+
+def _read_definition_version():
+    version = cache.get(DEFINITION_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(DEFINITION_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(DEFINITION_VERSION_CACHE_KEY)
+    # Without a working cache nothing can safely be reused
+    return version or uuid.uuid4().hex
+
+
+def get_definition_version():
+    """
+    Returns a stamp identifying the current version of the registry
+    definitions (registries, forms, sections, CDEs, consents, ...).
+
+    The stamp is shared by all processes through the default cache, so
+    anything derived from the definitions can be cached per process and
+    rebuilt when the stamp changes. Within a definition_version_scope
+    (eg a request) it is only read from the cache once.
+    """
+    version = getattr(_scope, "version", None)
+    if version is None:
+        version = _read_definition_version()
+        if getattr(_scope, "active", False):
+            _scope.version = version
+    return version
+
+
+def bump_definition_version():
+    # A random stamp (rather than a counter) can't collide with a stamp
+    # a process has already seen, even if the cache entry is evicted.
+    logger.debug("Registry definitions changed, bumping version")
+    version = uuid.uuid4().hex
+    cache.set(DEFINITION_VERSION_CACHE_KEY, version, None)
+    if getattr(_scope, "active", False):
+        _scope.version = version
+
+
+def start_definition_version_scope():
+    _scope.active = True
+    _scope.version = None
+
+
+def end_definition_version_scope():
+    _scope.active = False
+    _scope.version = None
+
+
+@contextmanager
+def definition_version_scope():
+    """
+    Reads the definition version at most once within the block, eg for a
+    batch of patients processed outside of a request.
+    """
+    if getattr(_scope, "active", False):
+        yield
+        return
+    start_definition_version_scope()
+    try:
+        yield
+    finally:
+        end_definition_version_scope()
+
+
+def _request_started(sender, **kwargs):
+    start_definition_version_scope()
+
+
+def _request_finished(sender, **kwargs):
+    end_definition_version_scope()
+
+
+request_started.connect(_request_started)
+request_finished.connect(_request_finished)
@@ -0,0 +1,31 @@
+import uuid
+
+from django.core.cache import cache
+
+PATIENT_DATA_VERSION_CACHE_KEY = "patient_data_version_%s"
+
+
+def get_patient_data_version(registry_code):
+    """
+    Returns a stamp identifying the current version of the patient details
+    of the registry which aren't stored on the patient itself (consents,
+    addresses, parents, working groups, ...), so results derived from them
+    can be cached.
+    """
+    key = PATIENT_DATA_VERSION_CACHE_KEY % registry_code
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    # Without a working cache nothing can safely be reused
+    return version or uuid.uuid4().hex
+
+
+def bump_patient_data_version(registry_codes):
+    cache.set_many(
+        {
+            PATIENT_DATA_VERSION_CACHE_KEY % code: uuid.uuid4().hex
+            for code in registry_codes
+        },
+        None,
+    )
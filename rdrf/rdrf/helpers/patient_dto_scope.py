@@ -0,0 +1,71 @@
+import threading
+from contextlib import contextmanager
+
+from django.core.signals import request_finished, request_started
+
+# The patient DTOs built in the current patient DTO scope of the thread
+_scope = threading.local()
+
+
+def get_scoped_dto(patient_id, state):
+    """
+    Returns the DTO built for the patient in the current scope (eg a
+    request), or None when there isn't one or the patient's fields have
+    changed since it was built.
+    """
+    dtos = getattr(_scope, "dtos", None)
+    if dtos is None or patient_id is None:
+        return None
+    scoped = dtos.get(patient_id)
+    if scoped is None or scoped[0] != state:
+        return None
+    return scoped[1]
+
+
+def set_scoped_dto(patient_id, state, dto):
+    dtos = getattr(_scope, "dtos", None)
+    if dtos is not None and patient_id is not None:
+        dtos[patient_id] = (state, dto)
+
+
+def clear_patient_dto_scope():
+    # Called when relatives, parents or working groups change, which the
+    # DTOs depend on without changing the patient's fields
+    if getattr(_scope, "dtos", None) is not None:
+        _scope.dtos = {}
+
+
+def start_patient_dto_scope():
+    _scope.dtos = {}
+
+
+def end_patient_dto_scope():
+    _scope.dtos = None
+
+
+@contextmanager
+def patient_dto_scope():
+    """
+    Builds each patient's DTO at most once within the block, eg for a
+    batch of patients processed outside of a request.
+    """
+    if getattr(_scope, "dtos", None) is not None:
+        yield
+        return
+    start_patient_dto_scope()
+    try:
+        yield
+    finally:
+        end_patient_dto_scope()
+
+
+def _request_started(sender, **kwargs):
+    start_patient_dto_scope()
+
+
+def _request_finished(sender, **kwargs):
+    end_patient_dto_scope()
+
+
+request_started.connect(_request_started)
+request_finished.connect(_request_finished)
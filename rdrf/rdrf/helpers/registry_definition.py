@@ -0,0 +1,178 @@
+import logging
+import threading
+from collections import defaultdict
+from types import MappingProxyType
+
+from rdrf.helpers.definition_version import get_definition_version
+
+logger = logging.getLogger(__name__)
+
+
+class RegistryDefinition:
+    """
+    A read-only snapshot of a registry's forms, sections, CDEs and permitted
+    values, indexed for the lookups done over and over when rendering forms,
+    computing progress and building reports.
+
+    Snapshots are shared by all the requests of a process, so neither they
+    nor the models they hold may be modified.
+    """
+
+    def __init__(self, registry_model):
+        from rdrf.models.definition.models import (
+            CDEPermittedValue,
+            CommonDataElement,
+            RegistryForm,
+            Section,
+        )
+
+        self.registry_code = registry_model.code
+        self.features = frozenset(registry_model.features)
+        self.forms = tuple(
+            RegistryForm.objects.filter(registry=registry_model).select_related(
+                "registry"
+            )
+        )
+
+        section_codes = set(
+            code for form in self.forms for code in form.get_sections()
+        )
+        sections = {
+            section.code: section
+            for section in Section.objects.filter(code__in=section_codes)
+        }
+        cde_codes = set(
+            code
+            for section in sections.values()
+            for code in section.get_elements()
+        )
+        cdes = {
+            cde.code: cde
+            for cde in CommonDataElement.objects.filter(
+                code__in=cde_codes
+            ).select_related("pv_group")
+        }
+        permitted_values = defaultdict(list)
+        for value in CDEPermittedValue.objects.filter(
+            pv_group__in=set(cde.pv_group_id for cde in cdes.values())
+        ).order_by("position", "pk"):
+            permitted_values[value.pv_group_id].append(value)
+
+        self._forms_by_name = MappingProxyType(
+            {form.name: form for form in self.forms}
+        )
+        self._form_sections = MappingProxyType(
+            {
+                form.name: (
+                    form.pk,
+                    form.sections,
+                    tuple(
+                        sections[code]
+                        for code in form.get_sections()
+                        if code in sections
+                    ),
+                )
+                for form in self.forms
+            }
+        )
+        self._section_cdes = MappingProxyType(
+            {
+                section.code: tuple(
+                    cdes[code]
+                    for code in section.get_elements()
+                    if code in cdes
+                )
+                for section in sections.values()
+            }
+        )
+        self._cdes = MappingProxyType(cdes)
+        self._permitted_values = MappingProxyType(
+            {code: tuple(values) for code, values in permitted_values.items()}
+        )
+
+        cde_paths = defaultdict(list)
+        for form in self.forms:
+            for section in self._form_sections[form.name][2]:
+                for cde in self._section_cdes[section.code]:
+                    cde_paths[cde.code].append((form.name, section.code))
+        self._cde_paths = MappingProxyType(
+            {code: tuple(paths) for code, paths in cde_paths.items()}
+        )
+
+    def has_feature(self, feature):
+        return feature in self.features
+
+    def get_form(self, form_name):
+        return self._forms_by_name.get(form_name)
+
+    def get_cde(self, cde_code):
+        return self._cdes.get(cde_code)
+
+    def section_models(self, form_model):
+        """
+        Returns the section models of the form, None if the snapshot doesn't
+        match the form (eg it's unsaved or has been edited in memory).
+        """
+        snapshot = self._form_sections.get(form_model.name)
+        if snapshot is None or snapshot[:2] != (
+            form_model.pk,
+            form_model.sections,
+        ):
+            return None
+        return list(snapshot[2])
+
+    def cde_models(self, section_code):
+        cdes = self._section_cdes.get(section_code)
+        return None if cdes is None else list(cdes)
+
+    def permitted_values(self, pv_group_code):
+        return list(self._permitted_values.get(pv_group_code, ()))
+
+    def models_from_key(self, form_name, section_code, cde_code):
+        """
+        Returns the form, section and CDE models of a form/section/CDE key,
+        None if the key doesn't refer to a CDE on a form of the registry.
+        """
+        form_model = self._forms_by_name.get(form_name)
+        if form_model is None:
+            return None
+        if (form_name, section_code) not in self._cde_paths.get(cde_code, ()):
+            return None
+        section_model = next(
+            section
+            for section in self._form_sections[form_name][2]
+            if section.code == section_code
+        )
+        return form_model, section_model, self._cdes[cde_code]
+
+    def full_path(self, cde_code):
+        paths = self._cde_paths.get(cde_code, ())
+        if len(paths) != 1:
+            raise ValueError(
+                "cde code %s is not unique or not used by registry %s"
+                % (cde_code, self.registry_code)
+            )
+        form_name, section_code = paths[0]
+        return form_name, section_code, cde_code
+
+
+_definitions = {}
+_definitions_lock = threading.Lock()
+
+
+def get_registry_definition(registry_model):
+    """
+    Returns the definition snapshot of the registry, built at most once per
+    process and registry definition version.
+    """
+    version = get_definition_version()
+    with _definitions_lock:
+        cached = _definitions.get(registry_model.code)
+        if cached is None or cached[0] != version:
+            logger.debug(
+                "Building definition snapshot of registry %s"
+                % registry_model.code
+            )
+            cached = (version, RegistryDefinition(registry_model))
+            _definitions[registry_model.code] = cached
+        return cached[1]
@@ -23,6 +23,7 @@ from django.utils.translation import gettext as _
 from langcodes import LANGUAGE_ALPHA3, Language, standardize_tag
 
 from .cde_data_types import CDEDataTypes
+from .registry_definition import get_registry_definition
 from .registry_features import RegistryFeatures
 
 logger = logging.getLogger(__name__)
@@ -58,6 +59,12 @@ def models_from_mongo_key(registry_model, delimited_key):
     )
 
     form_name, section_code, cde_code = get_form_section_code(delimited_key)
+    models = get_registry_definition(registry_model).models_from_key(
+        form_name, section_code, cde_code
+    )
+    if models is not None:
+        return models
+
     try:
         form_model = RegistryForm.objects.get(
             name=form_name, registry=registry_model
@@ -719,7 +726,10 @@ class TimeStripper(object):
 
 class HistoryTimeStripper(TimeStripper):
     def munge_data(self, data):
-        # History embeds the full forms dictionary in the record key
+        # History snapshots embed the full forms dictionary in the record
+        # key, deltas only hold the changed values
+        if "record" not in data:
+            return False
         return super().munge_data(data["record"])
 
 
@@ -822,6 +832,19 @@ def applicable_forms(registry_model, patient_model):
     return applicable_forms_for_patient_type(registry_model, patient_type)
 
 
+def is_form_applicable_to_patient_type(registry_model, form_name, patient_type):
+    # Same rules as applicable_forms_for_patient_type, without loading forms
+    patient_type_map = registry_model.metadata.get("patient_types")
+    if patient_type_map is None:
+        return True
+
+    if patient_type not in patient_type_map:
+        return False
+
+    applicable_form_names = patient_type_map[patient_type].get("forms")
+    return not applicable_form_names or form_name in applicable_form_names
+
+
 def applicable_forms_for_patient_type(registry_model, patient_type):
     patient_type_map = registry_model.metadata.get("patient_types")
     # type map looks like:
@@ -879,22 +902,7 @@ def get_full_path(registry_model, cde_code):
     """
     Return triple of form name, section code and cde code for a unique code
     """
-    triples = []
-
-    for form_model in registry_model.forms:
-        for section_model in form_model.section_models:
-            for cde_model in section_model.cde_models:
-                if cde_model.code == cde_code:
-                    triples.append(
-                        (form_model.name, section_model.code, cde_code)
-                    )
-    if len(triples) != 1:
-        raise ValueError(
-            "cde code %s is not unique or not used by registry %s"
-            % (cde_code, registry_model.code)
-        )
-
-    return triples[0]
+    return get_registry_definition(registry_model).full_path(cde_code)
 
 
 def generate_token():
@@ -0,0 +1,89 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from rdrf.forms.dsl.code_evaluator import CodeEvaluator, get_compiled_rules
+from rdrf.models.definition.models import ClinicalData, Registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures how many evaluations per second of the forms conditional "
+        "rendering rules are done against saved patient data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("registry_code")
+        parser.add_argument(
+            "--patients",
+            type=int,
+            default=100,
+            help="Number of saved patient records to evaluate the rules on",
+        )
+        parser.add_argument(
+            "--uncompiled",
+            action="store_true",
+            help="Also measure re-parsing the rules on every evaluation",
+        )
+
+    def handle(self, registry_code, **options):
+        try:
+            registry_model = Registry.objects.get(code=registry_code)
+        except Registry.DoesNotExist:
+            self.stderr.write(
+                "Error: Unknown registry code: %s" % registry_code
+            )
+            sys.exit(1)
+            return
+
+        forms = [
+            form
+            for form in registry_model.forms
+            if form.conditional_rendering_rules
+        ]
+        if not forms:
+            self.stdout.write("No forms with conditional rendering rules")
+            return
+
+        dynamic_data = list(
+            ClinicalData.objects.collection(registry_code, "cdes")
+            .filter(django_model="Patient")
+            .values_list("data", flat=True)[: options["patients"]]
+        )
+        if not dynamic_data:
+            self.stdout.write("No patient data to evaluate the rules on")
+            return
+
+        self._benchmark(
+            "compiled",
+            forms,
+            dynamic_data,
+            lambda form, data: get_compiled_rules(form).hidden_cdes(data),
+        )
+        if options["uncompiled"]:
+            self._benchmark(
+                "uncompiled",
+                forms,
+                dynamic_data,
+                lambda form, data: CodeEvaluator(
+                    form, data
+                ).determine_hidden_cdes(),
+            )
+
+    def _benchmark(self, name, forms, dynamic_data, evaluate):
+        started_at = time.perf_counter()
+        for form in forms:
+            for data in dynamic_data:
+                evaluate(form, data)
+        elapsed = time.perf_counter() - started_at
+        evaluations = len(forms) * len(dynamic_data)
+        self.stdout.write(
+            "%s: %s evaluations in %.3fs (%.1f per second)"
+            % (
+                name,
+                evaluations,
+                elapsed,
+                evaluations / elapsed if elapsed else 0,
+            )
+        )
@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rdrf.auth.pwned_passwords.local_index import (
+    BreachedPasswordIndexError,
+    write_index,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the local breached password index (BREACHED_PASSWORD_INDEX) "
+        "from a SHA1:COUNT breached passwords dump ordered by hash"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("dump_file", help="Downloaded SHA1 dump")
+        parser.add_argument("index_file", help="Index file to write")
+        parser.add_argument(
+            "--min-count",
+            type=int,
+            default=0,
+            help="Leave out the hashes breached this many times or less, "
+            "e.g. MAX_BREACHED_PASSWORD_THRESHOLD",
+        )
+
+    def handle(self, *args, **options):
+        # Written next to the index and moved over it once complete, so
+        # running processes keep using the previous index
+        tmp_file = "%s.tmp" % options["index_file"]
+        try:
+            with open(options["dump_file"]) as dump:
+                with open(tmp_file, "wb") as index_file:
+                    written = write_index(
+                        dump, index_file, options["min_count"]
+                    )
+        except BreachedPasswordIndexError as ex:
+            os.remove(tmp_file)
+            raise CommandError(str(ex))
+        os.replace(tmp_file, options["index_file"])
+        self.stdout.write(
+            "Wrote %s hashes to %s" % (written, options["index_file"])
+        )
@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+
+from rdrf.db.dynamic_data import DynamicDataWrapper
+from rdrf.models.definition.models import (
+    ClinicalData,
+    apply_cde_changes,
+    diff_cde_values,
+    iter_cde_values,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts full history snapshots into deltas of the changed CDE "
+        "values, keeping a full snapshot every checkpoint interval. "
+        "The full record of each converted snapshot is dropped and can't "
+        "be restored, so back up the clinical database first and pass "
+        "--confirm to run it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--registry-code", help="Only compact this registry"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Minimum number of history records updated per transaction. "
+            "The records of a patient and context are always updated together",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the number of snapshots which would be converted",
+        )
+        parser.add_argument(
+            "--confirm",
+            action="store_true",
+            help="Confirm that the converted snapshots should be dropped",
+        )
+
+    def handle(self, *args, **options):
+        if not options["dry_run"] and not options["confirm"]:
+            raise CommandError(
+                "Converting snapshots to deltas drops their full records "
+                "irreversibly. Pass --confirm to run it, or --dry-run"
+            )
+
+        interval = DynamicDataWrapper.HISTORY_CHECKPOINT_INTERVAL
+        history = ClinicalData.objects.filter(collection="history", active=True)
+        if options["registry_code"]:
+            history = history.filter(registry_code=options["registry_code"])
+        history = history.order_by(
+            "registry_code", "django_model", "django_id", "context_id", "pk"
+        )
+
+        updated = []
+        total = 0
+        previous_group, values, since_checkpoint = None, {}, 0
+        for record in history.iterator(chunk_size=options["batch_size"]):
+            group = (
+                record.registry_code,
+                record.django_model,
+                record.django_id,
+                record.context_id,
+            )
+            if group != previous_group:
+                # Only whole groups are saved, so an interrupted run never
+                # leaves a partly rewritten history
+                if len(updated) >= options["batch_size"]:
+                    total += self._save(updated, options["dry_run"])
+                    updated = []
+                previous_group, values, since_checkpoint = group, {}, interval
+
+            if record.data.get("record_type") == "delta":
+                apply_cde_changes(values, record.data["changes"])
+                since_checkpoint += 1
+                continue
+
+            current = dict(iter_cde_values(record.data.get("record") or {}))
+            if since_checkpoint >= interval - 1:
+                since_checkpoint = 0
+                # Snapshots saved before deltas existed have no record type
+                if record.data.get("record_type") != "snapshot":
+                    record.data["record_type"] = "snapshot"
+                    updated.append(record)
+            else:
+                snapshot = record.data.pop("record")
+                record.data["record_type"] = "delta"
+                record.data["document"] = {
+                    key: value
+                    for key, value in snapshot.items()
+                    if key != "forms"
+                }
+                record.data["changes"] = diff_cde_values(values, current)
+                updated.append(record)
+                since_checkpoint += 1
+            values = current
+        total += self._save(updated, options["dry_run"])
+
+        self.stdout.write(
+            "%s %s snapshots to deltas"
+            % ("Would convert" if options["dry_run"] else "Converted", total)
+        )
+
+    @staticmethod
+    def _save(records, dry_run):
+        if records and not dry_run:
+            with transaction.atomic(using=router.db_for_write(ClinicalData)):
+                ClinicalData.objects.bulk_update(records, ["data"])
+        return len(
+            [
+                record
+                for record in records
+                if record.data.get("record_type") == "delta"
+            ]
+        )
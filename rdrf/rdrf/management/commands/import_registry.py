@@ -42,3 +42,6 @@ class Command(BaseCommand):
 
             with transaction.atomic():
                 importer.create_registry()
+
+            for phase, elapsed in importer.timings:
+                self.stdout.write("%s: %.2fs" % (phase, elapsed))
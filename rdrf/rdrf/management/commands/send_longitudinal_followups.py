@@ -12,9 +12,25 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("delta_seconds", type=int)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of followup entries processed per batch",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of threads sending the emails of a batch",
+        )
 
     def handle(self, *args, **options):
         delta_seconds = options["delta_seconds"]
 
         now = datetime.now()
-        send_longitudinal_followups(now + timedelta(seconds=delta_seconds))
+        send_longitudinal_followups(
+            now + timedelta(seconds=delta_seconds),
+            batch_size=options["batch_size"],
+            workers=max(options["workers"], 1),
+        )
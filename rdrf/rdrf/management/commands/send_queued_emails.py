@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from rdrf.services.io.notifications.outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Sends the emails queued when EMAIL_OUTBOX_ENABLED is set"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Number of emails sent per batch",
+        )
+
+    def handle(self, *args, **options):
+        sent, failed = send_queued_emails(batch_size=options["batch_size"])
+        self.stdout.write("Sent %s emails, %s failed" % (sent, failed))
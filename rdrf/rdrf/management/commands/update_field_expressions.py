@@ -0,0 +1,75 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rdrf.db.generalised_field_expressions import FieldExpressionWriter
+from rdrf.models.definition.models import Registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes patient field expression values from a csv file with "
+        "patient_id, field_expression and value columns"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("registry_code", help="Registry of the patients")
+        parser.add_argument("csv_file", help="File to read, - for stdin")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the errors without saving any values",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            registry_model = Registry.objects.get(code=options["registry_code"])
+        except Registry.DoesNotExist:
+            raise CommandError(
+                "Registry %s does not exist" % options["registry_code"]
+            )
+
+        if options["csv_file"] == "-":
+            rows = self._read_rows(sys.stdin)
+        else:
+            with open(options["csv_file"], newline="") as csv_file:
+                rows = self._read_rows(csv_file)
+
+        errors = FieldExpressionWriter(registry_model).write(
+            rows, dry_run=options["dry_run"]
+        )
+        for error in errors:
+            # Row 1 of the file is the header
+            self.stderr.write(
+                "Row %s patient %s %s: %s"
+                % (
+                    error.row + 2,
+                    error.patient_id,
+                    error.field_expression,
+                    error.message,
+                )
+            )
+        self.stdout.write(
+            "%s %s of %s values"
+            % (
+                "Would write" if options["dry_run"] else "Wrote",
+                len(rows) - len({error.row for error in errors}),
+                len(rows),
+            )
+        )
+
+    @staticmethod
+    def _read_rows(csv_file):
+        reader = csv.DictReader(csv_file)
+        missing = {"patient_id", "field_expression", "value"} - set(
+            reader.fieldnames or []
+        )
+        if missing:
+            raise CommandError(
+                "Missing columns: %s" % ", ".join(sorted(missing))
+            )
+        return [
+            (row["patient_id"], row["field_expression"], row["value"])
+            for row in reader
+        ]
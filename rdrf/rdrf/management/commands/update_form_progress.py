@@ -1,11 +1,65 @@
+import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand
+from django.db import connections
 from registry.patients.models import Patient
 
 from rdrf.forms.progress.form_progress import FormProgress
-from rdrf.helpers.registry_features import RegistryFeatures
-from rdrf.models.definition.models import Registry
+from rdrf.helpers.definition_version import definition_version_scope
+from rdrf.helpers.patient_dto_scope import patient_dto_scope
+from rdrf.models.definition.models import (
+    ClinicalData,
+    RDRFContext,
+    Registry,
+)
+
+# The form progress calculator of each worker process
+_form_progress = None
+
+
+def _init_worker(registry_code):
+    global _form_progress
+    _form_progress = FormProgress(Registry.objects.get(code=registry_code))
+
+
+def update_progress_batch(context_ids):
+    """
+    Recalculates the progress of the given patient contexts, loading their
+    patients and clinical data in bulk. Returns the number of contexts
+    whose progress was saved.
+    """
+    registry_model = _form_progress.registry_model
+    contexts = RDRFContext.objects.filter(id__in=context_ids).select_related(
+        "context_form_group"
+    )
+    patients = Patient.objects.in_bulk(
+        {context.object_id for context in contexts}
+    )
+    dynamic_data = {}
+    for context_id, data in (
+        ClinicalData.objects.collection(registry_model.code, "cdes")
+        .filter(django_model="Patient", context_id__in=context_ids)
+        .values_list("context_id", "data")
+    ):
+        dynamic_data.setdefault(context_id, data)
+
+    updated = 0
+    with definition_version_scope(), patient_dto_scope():
+        for context in contexts:
+            patient_model = patients.get(context.object_id)
+            data = dynamic_data.get(context.id)
+            if patient_model is None or not data:
+                continue
+            _form_progress.save_progress(
+                patient_model, data, context, complete_data=True
+            )
+            updated += 1
+    return updated
 
 
 class Command(BaseCommand):
@@ -13,6 +67,28 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("registry_code")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of patient contexts recalculated per batch",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes recalculating batches in parallel",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording the last recalculated batch, "
+            "so that an interrupted run can be resumed",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue after the last batch recorded in the checkpoint",
+        )
 
     def handle(self, registry_code, **options):
         self.registry_model = None
@@ -25,27 +101,102 @@ class Command(BaseCommand):
             sys.exit(1)
             return
 
+        if options["resume"] and not options["checkpoint"]:
+            self.stderr.write("Error: --resume requires --checkpoint")
+            sys.exit(1)
+            return
+
+        self.checkpoint = options["checkpoint"]
+        start_after = 0
+        if options["resume"]:
+            start_after = self._read_checkpoint()
+
         if self.registry_model is not None:
-            self._update_progress()
+            self._update_progress(
+                start_after, options["batch_size"], max(options["workers"], 1)
+            )
             self.stdout.write("Progress recalculated OK")
 
-    def _update_progress(self):
-        form_progress = FormProgress(self.registry_model)
+    def _read_checkpoint(self):
+        if not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            checkpoint = json.load(f)
+        if checkpoint["registry_code"] != self.registry_model.code:
+            self.stderr.write(
+                "Error: Checkpoint is for registry %s"
+                % checkpoint["registry_code"]
+            )
+            sys.exit(1)
+        return checkpoint["last_context_id"]
 
-        for patient_model in Patient.objects.filter(
-            rdrf_registry__in=[self.registry_model]
-        ):
-            if not self.registry_model.has_feature(RegistryFeatures.CONTEXTS):
-                default_context = patient_model.default_context(
-                    self.registry_model
-                )
-                form_progress.save_for_patient(patient_model, default_context)
-                self.stdout.write(
-                    "Recalculated progress for Patient %s" % patient_model.pk
+    def _write_checkpoint(self, last_context_id):
+        if self.checkpoint:
+            with open(self.checkpoint, "w") as f:
+                json.dump(
+                    {
+                        "registry_code": self.registry_model.code,
+                        "last_context_id": last_context_id,
+                    },
+                    f,
                 )
 
-            else:
-                self.stderr.write(
-                    "Script does not support registries with multiple contexts allowed, yet"
+    def _get_batches(self, start_after, batch_size):
+        context_ids = list(
+            RDRFContext.objects.filter(
+                registry=self.registry_model,
+                content_type=ContentType.objects.get_for_model(Patient),
+                object_id__in=Patient.objects.filter(
+                    rdrf_registry=self.registry_model
+                ).values("id"),
+                id__gt=start_after,
+            )
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        return [
+            context_ids[i : i + batch_size]
+            for i in range(0, len(context_ids), batch_size)
+        ]
+
+    def _update_progress(self, start_after, batch_size, workers):
+        batches = self._get_batches(start_after, batch_size)
+        total = sum(len(batch) for batch in batches)
+        self.stdout.write(
+            "Recalculating progress for %s patient contexts" % total
+        )
+
+        if workers == 1:
+            _init_worker(self.registry_model.code)
+            self._report_progress(
+                batches, total, map(update_progress_batch, batches)
+            )
+        else:
+            # Worker processes must open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self.registry_model.code,),
+            ) as executor:
+                self._report_progress(
+                    batches,
+                    total,
+                    executor.map(update_progress_batch, batches),
                 )
-                sys.exit(1)
+
+    def _report_progress(self, batches, total, results):
+        started_at = time.monotonic()
+        processed = updated = 0
+        # Results are in batch order, so everything up to the last
+        # context of a finished batch has been recalculated
+        for batch, batch_updated in zip(batches, results):
+            processed += len(batch)
+            updated += batch_updated
+            self._write_checkpoint(batch[-1])
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(
+                "Recalculated %s/%s patient contexts (%.1f per second)"
+                % (processed, total, processed / elapsed if elapsed else 0)
+            )
+        self.stdout.write("Saved progress for %s patient contexts" % updated)
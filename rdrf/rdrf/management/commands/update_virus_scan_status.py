@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from rdrf.db.filestorage import update_scan_statuses
+
+
+class Command(BaseCommand):
+    help = "Updates the virus scan status of uploaded files still being scanned"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of files checked per batch",
+        )
+
+    def handle(self, *args, **options):
+        updated = update_scan_statuses(batch_size=options["batch_size"])
+        self.stdout.write("Updated the scan status of %s files" % updated)
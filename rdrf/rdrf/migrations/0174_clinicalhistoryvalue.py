@@ -0,0 +1,117 @@
+# Generated by Django 4.2.16 on 2026-10-17 18:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import rdrf.forms.fields.jsonb
+
+
+def _dict_items(value):
+    if not isinstance(value, list):
+        return []
+    return [item for item in value if isinstance(item, dict)]
+
+
+def iter_cde_values(data):
+    for form_dict in _dict_items(data.get("forms")):
+        form_name = form_dict.get("name")
+        for section_dict in _dict_items(form_dict.get("sections")):
+            section_code = section_dict.get("code")
+            cdes = section_dict.get("cdes")
+            if section_dict.get("allow_multiple"):
+                items = enumerate(cdes if isinstance(cdes, list) else [])
+            else:
+                items = [(None, cdes)]
+            for item_index, cde_dicts in items:
+                for cde_dict in _dict_items(cde_dicts):
+                    if not (form_name and section_code and cde_dict.get("code")):
+                        continue
+                    yield (
+                        (form_name, section_code, cde_dict.get("code"), item_index),
+                        cde_dict.get("value"),
+                    )
+
+
+def index_clinical_history(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    ClinicalData = apps.get_model('rdrf', 'ClinicalData')
+    ClinicalHistoryValue = apps.get_model('rdrf', 'ClinicalHistoryValue')
+    records = ClinicalData.objects.using(db_alias).filter(
+        collection="history"
+    ).order_by(
+        'registry_code', 'django_model', 'django_id', 'context_id', 'active', 'pk'
+    )
+
+    # Each snapshot is indexed by what changed since the previous snapshot
+    # of the same patient and context
+    previous_group, previous = None, {}
+    for record in records.iterator(chunk_size=500):
+        group = (
+            record.registry_code,
+            record.django_model,
+            record.django_id,
+            record.context_id,
+            record.active,
+        )
+        if group != previous_group:
+            previous_group, previous = group, {}
+        current = dict(iter_cde_values(record.data.get("record") or {}))
+        changes = [
+            (key, value, False)
+            for key, value in current.items()
+            if key not in previous or previous[key] != value
+        ] + [(key, None, True) for key in previous if key not in current]
+        ClinicalHistoryValue.objects.using(db_alias).bulk_create(
+            [
+                ClinicalHistoryValue(
+                    clinical_data=record,
+                    registry_code=record.registry_code,
+                    django_id=record.django_id,
+                    django_model=record.django_model,
+                    context_id=record.context_id,
+                    form_name=form_name,
+                    section_code=section_code,
+                    cde_code=cde_code,
+                    item_index=item_index,
+                    value=value,
+                    removed=removed,
+                )
+                for (form_name, section_code, cde_code, item_index), value, removed
+                in changes
+            ]
+        )
+        previous = current
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdrf', '0173_clinicaldatavalue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicalHistoryValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registry_code', models.CharField(max_length=10)),
+                ('django_id', models.IntegerField()),
+                ('django_model', models.CharField(max_length=80)),
+                ('context_id', models.IntegerField(blank=True, null=True)),
+                ('form_name', models.CharField(max_length=80)),
+                ('section_code', models.CharField(max_length=100)),
+                ('cde_code', models.CharField(max_length=30)),
+                ('item_index', models.IntegerField(blank=True, null=True)),
+                ('value', rdrf.forms.fields.jsonb.DataField(blank=True, default=None, null=True)),
+                ('removed', models.BooleanField(default=False)),
+                ('clinical_data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history_values', to='rdrf.clinicaldata')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['registry_code', 'django_model', 'django_id', 'context_id', 'form_name', 'section_code', 'cde_code'], name='idx_clinical_history_cde')],
+            },
+        ),
+        migrations.RunPython(
+            index_clinical_history,
+            migrations.RunPython.noop,
+            hints={'model_name': 'clinicalhistoryvalue'},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-17 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdrf', '0174_clinicalhistoryvalue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cdefile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='cdefile',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdrf', '0175_cdefile_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cdefile',
+            name='scan_status',
+            field=models.CharField(blank=True, db_index=True, max_length=20),
+        ),
+    ]
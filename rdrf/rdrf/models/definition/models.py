@@ -14,13 +14,19 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Exists, OuterRef, Q
-from django.db.models.signals import post_delete, post_save, pre_delete
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
 from django.dispatch.dispatcher import receiver
 from django.forms.models import model_to_dict
 from django.template.defaultfilters import date as _date
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.formats import date_format, time_format
 from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
@@ -31,12 +37,16 @@ from rdrf.events.events import EventType
 from rdrf.forms.dsl.validator import DSLValidator
 from rdrf.forms.fields.jsonb import DataField
 from rdrf.helpers.cde_data_types import CDEDataTypes
+from rdrf.helpers.conditions import evaluate_condition
+from rdrf.helpers.definition_version import bump_definition_version
+from rdrf.helpers.registry_definition import get_registry_definition
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.helpers.utils import (
     check_calculation,
     format_date,
     get_display_value,
     is_alphanumeric,
+    mongo_key,
     parse_iso_datetime,
     validate_abbreviated_name,
     validate_file_extension_format,
@@ -228,6 +238,15 @@ class Registry(models.Model):
 
     @property
     def metadata(self):
+        # Parsed once per metadata_json value, this is read on every
+        # feature check
+        cached = self.__dict__.get("_metadata")
+        if cached is None or cached[0] != self.metadata_json:
+            cached = (self.metadata_json, self._parse_metadata())
+            self.__dict__["_metadata"] = cached
+        return cached[1]
+
+    def _parse_metadata(self):
         if self.metadata_json:
             try:
                 return json.loads(self.metadata_json)
@@ -733,6 +752,14 @@ class CommonDataElement(models.Model):
             )
 
     def save(self, *args, **kwargs):
+        self.normalise_widget()
+        super().save(*args, **kwargs)
+
+    def normalise_widget(self):
+        """
+        Strips the widget name and fills in the slider range, done on save
+        and by bulk writes which bypass it.
+        """
         if self.widget_name is not None:
             self.widget_name = self.widget_name.strip()
         if (
@@ -751,7 +778,6 @@ class CommonDataElement(models.Model):
                 if "min" not in existing and "max" not in existing:
                     existing.update(settings)
                     self.widget_settings = json.dumps(existing)
-        super().save(*args, **kwargs)
 
     def display_value(self, value):
         datatype = self.datatype.strip().lower()
@@ -792,12 +818,14 @@ class CdePolicy(models.Model):
     def is_allowed(self, user_groups, patient_model=None, is_superuser=False):
         if is_superuser:
             return True
-        for ug in user_groups:
-            if ug in self.groups_allowed.all():
-                if patient_model:
-                    return self.evaluate_condition(patient_model)
-                else:
-                    return True
+        # groups_allowed is usually prefetched with the policies
+        allowed_group_ids = set(group.pk for group in self.groups_allowed.all())
+        if any(ug.pk in allowed_group_ids for ug in user_groups):
+            if patient_model:
+                return self.evaluate_condition(patient_model)
+            else:
+                return True
+        return False
 
     class Meta:
         verbose_name = "CDE Policy"
@@ -806,11 +834,9 @@ class CdePolicy(models.Model):
     def evaluate_condition(self, patient_model):
         if not self.condition:
             return True
-        # need to think about safety here
-
-        context = {"patient": patient_model.as_dto()}
-        result = eval(self.condition, {"__builtins__": None}, context)
-        return result
+        return evaluate_condition(
+            self.condition, patient=patient_model.as_dto()
+        )
 
 
 class Language(models.Model):
@@ -933,6 +959,12 @@ class RegistryForm(models.Model):
 
     @property
     def section_models(self):
+        if self.pk and self.registry_id:
+            sections = get_registry_definition(self.registry).section_models(
+                self
+            )
+            if sections is not None:
+                return sections
         return Section.objects.get_by_comma_separated_codes(self.sections)
 
     @property
@@ -1028,7 +1060,7 @@ class RegistryForm(models.Model):
         # ( patient_type = carrier) and also
         # deceased patients, say. ( for MTM)
         # the default case is True - ie all forms are applicable to a patient
-        from rdrf.helpers.utils import applicable_forms
+        from rdrf.helpers.utils import is_form_applicable_to_patient_type
 
         if patient is None:
             return False
@@ -1038,10 +1070,9 @@ class RegistryForm(models.Model):
         ):
             return False
 
-        allowed_forms = [
-            f.name for f in applicable_forms(self.registry, patient)
-        ]
-        if self.name not in allowed_forms:
+        if not is_form_applicable_to_patient_type(
+            self.registry, self.name, patient.patient_type or "default"
+        ):
             return False
 
         # In allowed list for patient type, but is there a patient condition also?
@@ -1049,13 +1080,9 @@ class RegistryForm(models.Model):
         if not self.applicability_condition:
             return True
 
-        evaluation_context = {"patient": patient.as_dto()}
-
         try:
-            is_applicable = eval(
-                self.applicability_condition,
-                {"__builtins__": None},
-                evaluation_context,
+            is_applicable = evaluate_condition(
+                self.applicability_condition, patient=patient.as_dto()
             )
         except BaseException:
             # allows us to filter out forms for patients
@@ -1233,26 +1260,16 @@ class ConsentSection(models.Model):
 
             from registry.patients.models import ParentGuardian
 
-            self_patient = False
-            try:
-                ParentGuardian.objects.get(self_patient=patient)
-                self_patient = True
-            except ParentGuardian.DoesNotExist:
-                pass
-
-            function_context = {
-                "patient": patient.as_dto(),
-                "self_patient": self_patient.as_dto(),
-            }
+            self_patient = ParentGuardian.objects.filter(
+                self_patient=patient
+            ).exists()
 
-            is_applicable = eval(
+            return evaluate_condition(
                 self.applicability_condition,
-                {"__builtins__": None},
-                function_context,
+                patient=patient.as_dto(),
+                self_patient=self_patient,
             )
 
-            return is_applicable
-
     def is_valid(self, answer_dict):
         """
         does the supplied question_code --> answer map
@@ -1541,6 +1558,45 @@ class EmailNotificationHistory(models.Model):
         verbose_name_plural = "Email Notification History"
 
 
+class OutboundEmailState(models.TextChoices):
+    PENDING = "P"
+    SENT = "S"
+    FAILED = "F"
+
+
+class OutboundEmail(models.Model):
+    """
+    An email queued for the send_queued_emails command, when
+    EMAIL_OUTBOX_ENABLED is set
+    """
+
+    class Meta:
+        ordering = ("send_at",)
+        indexes = (
+            models.Index(
+                name="idx_outbound_email_pending",
+                fields=("send_at",),
+                condition=Q(state=OutboundEmailState.PENDING),
+            ),
+        )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    subject = models.TextField()
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    state = models.CharField(
+        choices=OutboundEmailState.choices,
+        max_length=1,
+        default=OutboundEmailState.PENDING,
+    )
+    send_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+
 class EmailPreferenceManager(models.Manager):
     def get_by_user(self, user):
         return self.filter(user=user).first()
@@ -1571,9 +1627,15 @@ class EmailPreference(models.Model):
         if self.unsubscribe_all:
             return False
         else:
-            preference = self.notification_preferences.filter(
-                email_notification=email_notification
-            ).first()
+            # Works with prefetched notification preferences
+            preference = next(
+                (
+                    preference
+                    for preference in self.notification_preferences.all()
+                    if preference.email_notification_id == email_notification.pk
+                ),
+                None,
+            )
             return preference.is_subscribed if preference else True
 
 
@@ -1794,28 +1856,64 @@ class ContextFormGroup(models.Model):
             return None
 
     def get_name_from_cde(self, patient_model, context_model):
+        return self.get_names_from_cde(patient_model, [context_model])[
+            context_model.pk
+        ]
+
+    def get_names_from_cde(self, patient_model, context_models):
+        """
+        Names of several contexts of the patient in this group, keyed by
+        context id, with the naming CDE values read in one query.
+        """
         if not self.naming_cde_to_use:
-            return self.get_default_name(patient_model, context_model)
+            if self.naming_scheme == "D":
+                return {
+                    context_model.pk: self.get_default_name(
+                        patient_model, context_model
+                    )
+                    for context_model in context_models
+                }
+            # The other schemes don't depend on the context
+            name = self.get_default_name(patient_model)
+            return {context_model.pk: name for context_model in context_models}
+
         form_name, section_code, cde_code = self.naming_cde_to_use.split("/")
-        try:
-            cde_value = patient_model.get_form_value(
-                self.registry.code,
-                form_name,
-                section_code,
-                cde_code,
-                context_id=context_model.pk,
+        cde_values = {}
+        for context_id, value in (
+            ClinicalDataValue.objects.cde(
+                self.registry.code, form_name, section_code, cde_code
             )
-
-            cde_model = CommonDataElement.objects.get(code=cde_code)
+            .for_object(patient_model)
+            .filter(
+                context_id__in=[
+                    context_model.pk for context_model in context_models
+                ],
+                item_index__isnull=True,
+            )
+            .order_by("clinical_data_id")
+            .values_list("context_id", "value")
+        ):
+            # Same record as ClinicalDataValue.objects.lookup
+            cde_values.setdefault(context_id, value)
+
+        names = {}
+        cde_model = None
+        for context_model in context_models:
+            if context_model.pk not in cde_values:
+                # value not filled out yet
+                names[context_model.pk] = "NOT SET"
+                continue
+            if cde_model is None:
+                cde_model = CommonDataElement.objects.get(code=cde_code)
             # This does not actually do type conversion for dates -
             # it just looks up range display codes.
-            display_value = get_display_value(cde_model, cde_value)
+            display_value = get_display_value(
+                cde_model, cde_values[context_model.pk]
+            )
             if isinstance(display_value, datetime.date):
                 display_value = format_date(display_value)
-            return display_value
-        except KeyError:
-            # value not filled out yet
-            return "NOT SET"
+            names[context_model.pk] = display_value
+        return names
 
     def get_ordering_value(self, patient_model, context_model):
         from rdrf.helpers.utils import MinType
@@ -2064,13 +2162,12 @@ class ClinicalData(models.Model):
         return json.dumps(model_to_dict(self), indent=2)
 
     def cde_val(self, form_name, section_code, cde_code):
-        forms = self.data.get("forms", [])
-        form_map = {f.get("name"): f for f in forms}
-        sections = form_map.get(form_name, {}).get("sections", [])
-        section_map = {s.get("code"): s for s in sections}
-        cdes = section_map.get(section_code, {}).get("cdes", [])
-        cde_map = {c.get("code"): c for c in cdes}
-        return cde_map.get(cde_code, {}).get("value")
+        for path, value in iter_cde_values(self.data):
+            if path[:3] == (form_name, section_code, cde_code) and (
+                path[3] is None
+            ):
+                return value
+        return None
 
     def save(self, *args, **kwargs):
         self.full_clean()
@@ -2123,6 +2220,368 @@ class ClinicalData(models.Model):
                 raise ValidationError({"data": e})
 
 
+def _dict_items(value):
+    if not isinstance(value, list):
+        return []
+    return [item for item in value if isinstance(item, dict)]
+
+
+def iter_cde_values(data):
+    """
+    Walks a clinical data document once, yielding
+    ((form_name, section_code, cde_code, item_index), value) for each
+    stored CDE. item_index is None for values outside of multisections.
+    Malformed parts of the document are skipped.
+    """
+    for form_dict in _dict_items(data.get("forms")):
+        form_name = form_dict.get("name")
+        for section_dict in _dict_items(form_dict.get("sections")):
+            section_code = section_dict.get("code")
+            cdes = section_dict.get("cdes")
+            if section_dict.get("allow_multiple"):
+                items = enumerate(cdes if isinstance(cdes, list) else [])
+            else:
+                items = [(None, cdes)]
+            for item_index, cde_dicts in items:
+                for cde_dict in _dict_items(cde_dicts):
+                    if not (
+                        form_name and section_code and cde_dict.get("code")
+                    ):
+                        continue
+                    yield (
+                        (
+                            form_name,
+                            section_code,
+                            cde_dict.get("code"),
+                            item_index,
+                        ),
+                        cde_dict.get("value"),
+                    )
+
+
+def diff_cde_values(previous, current):
+    """
+    Compares two mappings of (form_name, section_code, cde_code, item_index)
+    to value, as built from iter_cde_values, and returns the changes
+    needed to turn the first into the second.
+    """
+    changes = [
+        {
+            "key": list(key),
+            "old": previous.get(key),
+            "new": value,
+            "removed": False,
+        }
+        for key, value in current.items()
+        if key not in previous or previous[key] != value
+    ]
+    changes.extend(
+        {"key": list(key), "old": value, "new": None, "removed": True}
+        for key, value in previous.items()
+        if key not in current
+    )
+    return changes
+
+
+def apply_cde_changes(values, changes):
+    for change in changes:
+        key = tuple(change["key"])
+        if change["removed"]:
+            values.pop(key, None)
+        else:
+            values[key] = change["new"]
+    return values
+
+
+def nest_cde_values(values):
+    """
+    Rebuilds the "forms" list of a clinical data document from a mapping
+    of (form_name, section_code, cde_code, item_index) to value.
+    Multisections without any items are not restored.
+    """
+    forms = {}
+    for key, value in values.items():
+        form_name, section_code, cde_code, item_index = key
+        sections = forms.setdefault(form_name, {})
+        section_dict = sections.setdefault(
+            section_code,
+            {
+                "code": section_code,
+                "allow_multiple": item_index is not None,
+                "cdes": {} if item_index is not None else [],
+            },
+        )
+        cde_dict = {"code": cde_code, "value": value}
+        if item_index is None:
+            section_dict["cdes"].append(cde_dict)
+        else:
+            section_dict["cdes"].setdefault(item_index, []).append(cde_dict)
+
+    for sections in forms.values():
+        for section_dict in sections.values():
+            if section_dict["allow_multiple"]:
+                items = section_dict["cdes"]
+                section_dict["cdes"] = [items[index] for index in sorted(items)]
+    return [
+        {"name": form_name, "sections": list(sections.values())}
+        for form_name, sections in forms.items()
+    ]
+
+
+class ClinicalDataValueQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(clinical_data__active=True)
+
+    def for_object(self, obj, context_id=None):
+        qs = self.filter(django_id=obj.pk, django_model=obj.__class__.__name__)
+        if context_id is not None:
+            qs = qs.filter(context_id=context_id)
+        return qs
+
+    def cde(self, registry_code, form_name, section_code, cde_code):
+        return self.active().filter(
+            registry_code=registry_code,
+            form_name=form_name,
+            section_code=section_code,
+            cde_code=cde_code,
+        )
+
+    def index(self, clinical_data):
+        """
+        Replaces the indexed values of a "cdes" ClinicalData record
+        with the values currently held in its document.
+        """
+        rows = [
+            self.model(
+                clinical_data=clinical_data,
+                registry_code=clinical_data.registry_code,
+                django_id=clinical_data.django_id,
+                django_model=clinical_data.django_model,
+                context_id=clinical_data.context_id,
+                form_name=form_name,
+                section_code=section_code,
+                cde_code=cde_code,
+                item_index=item_index,
+                value=value,
+            )
+            for (
+                form_name,
+                section_code,
+                cde_code,
+                item_index,
+            ), value in iter_cde_values(clinical_data.data)
+        ]
+        with transaction.atomic(using=self.db):
+            self.filter(clinical_data=clinical_data).delete()
+            self.bulk_create(rows)
+
+    def lookup(
+        self,
+        registry_code,
+        obj,
+        form_name,
+        section_code,
+        cde_code,
+        context_id=None,
+        multisection=False,
+    ):
+        """
+        Reads a single CDE value for a patient (or other django object)
+        without loading the clinical data document.
+        Raises KeyError when no value has been stored, mirroring a
+        missing key in the flattened form data. A multisection without
+        values for the CDE, e.g. without any items, gives [].
+        """
+        rows = list(
+            self.cde(registry_code, form_name, section_code, cde_code)
+            .for_object(obj, context_id)
+            .filter(item_index__isnull=not multisection)
+            .order_by("clinical_data_id", "item_index")
+            .values_list("clinical_data_id", "value")
+        )
+        if not rows:
+            if multisection and self._has_section(
+                registry_code, obj, section_code, context_id
+            ):
+                return []
+            raise KeyError(mongo_key(form_name, section_code, cde_code))
+
+        # Same record as ClinicalData.objects.collection(...).first()
+        record_id = rows[0][0]
+        values = [value for pk, value in rows if pk == record_id]
+        if multisection:
+            return [value for value in values if value]
+        return values[0]
+
+    def _has_section(self, registry_code, obj, section_code, context_id):
+        data = (
+            ClinicalData.objects.using(self.db)
+            .find(obj, context_id)
+            .collection(registry_code, "cdes")
+            .data()
+            .first()
+        )
+        if data is None:
+            return False
+        return any(
+            section_dict.get("code") == section_code
+            for form_dict in _dict_items(data.get("forms"))
+            for section_dict in _dict_items(form_dict.get("sections"))
+        )
+
+    def object_ids(
+        self, registry_code, form_name, section_code, cde_code, **lookups
+    ):
+        """
+        Ids of the objects which have a stored value for the given CDE
+        matching the lookups, e.g. object_ids(..., value="Y") or
+        object_ids(..., value__in=["A", "B"]).
+        """
+        return (
+            self.cde(registry_code, form_name, section_code, cde_code)
+            .filter(**lookups)
+            .values_list("django_id", flat=True)
+            .distinct()
+        )
+
+
+class ClinicalDataValue(models.Model):
+    """
+    Denormalised, indexed copy of the CDE values held in "cdes"
+    ClinicalData documents, one row per stored value.
+    Kept in sync by the ClinicalData post_save receiver below.
+    """
+
+    clinical_data = models.ForeignKey(
+        ClinicalData, related_name="values", on_delete=models.CASCADE
+    )
+    registry_code = models.CharField(max_length=10)
+    django_id = models.IntegerField()
+    django_model = models.CharField(max_length=80)
+    context_id = models.IntegerField(blank=True, null=True)
+    form_name = models.CharField(max_length=80)
+    section_code = models.CharField(max_length=100)
+    cde_code = models.CharField(max_length=30)
+    item_index = models.IntegerField(blank=True, null=True)
+    value = DataField(blank=True, null=True, default=None)
+
+    objects = ClinicalDataValueQuerySet.as_manager()
+
+    class Meta:
+        indexes = (
+            models.Index(
+                name="idx_clinical_value_cde",
+                fields=(
+                    "registry_code",
+                    "form_name",
+                    "section_code",
+                    "cde_code",
+                ),
+            ),
+            models.Index(
+                name="idx_clinical_value_object",
+                fields=(
+                    "registry_code",
+                    "django_model",
+                    "django_id",
+                    "context_id",
+                ),
+            ),
+        )
+
+
+@receiver(post_save, sender=ClinicalData)
+def clinical_data_post_save(sender, instance, **kwargs):
+    if instance.collection == "cdes":
+        ClinicalDataValue.objects.using(kwargs["using"]).index(instance)
+
+
+class ClinicalHistoryValueQuerySet(models.QuerySet):
+    KEY_FIELDS = ("form_name", "section_code", "cde_code", "item_index")
+
+    def for_object(self, registry_code, obj, context_id=None):
+        qs = self.filter(
+            clinical_data__active=True,
+            registry_code=registry_code,
+            django_id=obj.pk,
+            django_model=obj.__class__.__name__,
+        )
+        if context_id is not None:
+            qs = qs.filter(context_id=context_id)
+        return qs
+
+    def cde(self, form_name, section_code, cde_code):
+        return self.filter(
+            form_name=form_name, section_code=section_code, cde_code=cde_code
+        )
+
+    def record(self, history, changes):
+        """
+        Indexes the changes a "history" ClinicalData record made to the
+        values held after the previous one.
+        """
+        rows = []
+        for change in changes:
+            form_name, section_code, cde_code, item_index = change["key"]
+            rows.append(
+                self.model(
+                    clinical_data=history,
+                    registry_code=history.registry_code,
+                    django_id=history.django_id,
+                    django_model=history.django_model,
+                    context_id=history.context_id,
+                    form_name=form_name,
+                    section_code=section_code,
+                    cde_code=cde_code,
+                    item_index=item_index,
+                    value=change["new"],
+                    removed=change["removed"],
+                )
+            )
+        self.bulk_create(rows)
+
+
+class ClinicalHistoryValue(models.Model):
+    """
+    Index of the changes recorded in "history" ClinicalData records, one
+    row per CDE value set or removed by a save. Replaying the rows of a
+    CDE in record order gives its timeline without loading any history
+    documents.
+    """
+
+    clinical_data = models.ForeignKey(
+        ClinicalData, related_name="history_values", on_delete=models.CASCADE
+    )
+    registry_code = models.CharField(max_length=10)
+    django_id = models.IntegerField()
+    django_model = models.CharField(max_length=80)
+    context_id = models.IntegerField(blank=True, null=True)
+    form_name = models.CharField(max_length=80)
+    section_code = models.CharField(max_length=100)
+    cde_code = models.CharField(max_length=30)
+    item_index = models.IntegerField(blank=True, null=True)
+    value = DataField(blank=True, null=True, default=None)
+    removed = models.BooleanField(default=False)
+
+    objects = ClinicalHistoryValueQuerySet.as_manager()
+
+    class Meta:
+        indexes = (
+            models.Index(
+                name="idx_clinical_history_cde",
+                fields=(
+                    "registry_code",
+                    "django_model",
+                    "django_id",
+                    "context_id",
+                    "form_name",
+                    "section_code",
+                    "cde_code",
+                ),
+            ),
+        )
+
+
 def file_upload_to(instance, _filename):
     return "/".join(
         filter(
@@ -2167,6 +2626,11 @@ class CDEFile(models.Model):
     original_filename = models.CharField(max_length=255)
     filename = models.CharField(max_length=255)
     mime_type = models.CharField(max_length=255, null=True, blank=True)
+    # sha256 of the content, records of identical uploads share the item
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    # Last known virus scan status, blank until it has been checked
+    scan_status = models.CharField(max_length=20, blank=True, db_index=True)
 
     def __str__(self):
         return self.original_filename
@@ -2174,7 +2638,13 @@ class CDEFile(models.Model):
 
 @receiver(pre_delete, sender=CDEFile)
 def fileuploaditem_delete(sender, instance, **kwargs):
-    instance.item.delete(False)
+    shared = (
+        CDEFile.objects.filter(item=instance.item.name)
+        .exclude(pk=instance.pk)
+        .exists()
+    )
+    if not shared:
+        instance.item.delete(False)
 
 
 @receiver(post_save, sender=Registry)
@@ -2188,6 +2658,28 @@ def registry_post_save(sender, instance, **kwargs):
             init_registry_stages_and_rules(instance)
 
 
+@receiver([post_save, post_delete], sender=Registry)
+@receiver([post_save, post_delete], sender=RegistryForm)
+@receiver([post_save, post_delete], sender=Section)
+@receiver([post_save, post_delete], sender=CommonDataElement)
+@receiver([post_save, post_delete], sender=CDEPermittedValueGroup)
+@receiver([post_save, post_delete], sender=CDEPermittedValue)
+@receiver([post_save, post_delete], sender=ContextFormGroup)
+@receiver([post_save, post_delete], sender=ContextFormGroupItem)
+@receiver([post_save, post_delete], sender=ConsentSection)
+@receiver([post_save, post_delete], sender=ConsentQuestion)
+def registry_definition_changed(sender, instance, **kwargs):
+    bump_definition_version()
+
+
+@receiver(m2m_changed, sender=RegistryForm.groups_allowed.through)
+@receiver(m2m_changed, sender=RegistryForm.groups_readonly.through)
+def registry_form_groups_changed(sender, action, **kwargs):
+    # The form permissions of users are cached per definition version
+    if action.startswith("post_"):
+        bump_definition_version()
+
+
 class FileStorage(models.Model):
     """
     This model is used only when the database file storage backend is
@@ -2294,8 +2786,8 @@ class DataDefinitions:
         cde_codes = self.form_cde_codes
         policies = CdePolicy.objects.filter(
             registry=self.registry_form.registry, cde__code__in=cde_codes
-        )
-        return {policy.cde.code: policy for policy in policies}
+        ).prefetch_related("groups_allowed")
+        return {policy.cde_id: policy for policy in policies}
 
     @cached_property
     def permitted_values_by_group(self):
@@ -14,6 +14,8 @@ class Column(object):
     field = "id"
     sort_fields = ["id"]
     visible = True
+    # The patient listing field holding the cell value, if there is one
+    listing_field = None
 
     def __init__(self, label, perm):
         self.label = label
@@ -51,6 +53,9 @@ class Column(object):
             return related_value
         return getattr(patient, self.field)
 
+    def listing_cell(self, listing):
+        return getattr(listing, self.listing_field)
+
     def fmt(self, val):
         return str(val)
 
@@ -143,10 +148,12 @@ class ColumnOptionalContext(Column):
 class ColumnWorkingGroups(Column):
     field = "working_groups__name"
     sort_fields = ["working_groups__name"]
+    listing_field = "working_group_names"
 
 
 class ColumnDiagnosisProgress(ColumnOptionalContext):
     field = "diagnosis_progress"
+    listing_field = "diagnosis_progress"
 
     def cell_optional_contexts(
         self, patient, form_progress=None, context_manager=None
@@ -172,6 +179,7 @@ class ColumnDiagnosisProgress(ColumnOptionalContext):
 class ColumnDiagnosisCurrency(ColumnOptionalContext):
     field = "diagnosis_currency"
     sort_fields = ["last_updated_overall_at"]
+    listing_field = "diagnosis_currency"
 
     def cell_optional_contexts(
         self, patient, form_progress=None, context_manager=None
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Q
+from registry.patients.models import Patient, PatientListing
+from report.schema import (
+    PatientFilterType,
+    list_patients_query,
+    search_patients,
+    to_snake_case,
+)
+
+logger = logging.getLogger(__name__)
+
+SearchItem = namedtuple("SearchItem", "text fields")
+
+TOTAL_CACHE_TIMEOUT = 300
+CURSOR_CACHE_TIMEOUT = 600
+
+# Patient sort fields whose listing column has a different name
+LISTING_SORT_FIELDS = {
+    "id": "patient_id",
+    "stage__id": "stage_id",
+    "working_groups__name": "working_group_names",
+}
+
+
+def _cache_key(prefix, *parts):
+    digest = hashlib.md5(
+        json.dumps(parts, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f"patient_listing_{prefix}_{digest}"
+
+
+def listing_ordering(sort_fields):
+    """
+    Maps patient sort fields to the listing columns, with the patient id
+    last so that every row has a unique position.
+    """
+    ordering = []
+    for sort_field in sort_fields or []:
+        descending = sort_field.startswith("-")
+        field = sort_field.lstrip("-")
+        field = LISTING_SORT_FIELDS.get(field, field)
+        ordering.append(f"-{field}" if descending else field)
+    if not any(field.lstrip("-") == "patient_id" for field in ordering):
+        ordering.append("patient_id")
+    return ordering
+
+
+def keyset_filter(ordering, values):
+    """
+    Returns the filter for the rows after the row with the given values of
+    the ordering fields. Nulls sort last ascending and first descending,
+    as they do in PostgreSQL.
+    """
+    query = Q(pk__in=[])
+    preceding = Q()
+    for sort_field in ordering:
+        descending = sort_field.startswith("-")
+        field = sort_field.lstrip("-")
+        value = values[field]
+        if value is None:
+            after = Q(**{f"{field}__isnull": False}) if descending else None
+            equal = Q(**{f"{field}__isnull": True})
+        else:
+            if descending:
+                after = Q(**{f"{field}__lt": value})
+            else:
+                after = Q(**{f"{field}__gt": value}) | Q(
+                    **{f"{field}__isnull": True}
+                )
+            equal = Q(**{field: value})
+        if after is not None:
+            query |= preceding & after
+        preceding &= equal
+    return query
+
+
+class PatientListingQuery:
+    """
+    Pages of the patient listing read from the denormalised listing table.
+
+    The patients the user can see are still selected by the same query as
+    the patients GraphQL schema, but only their ids are used to filter the
+    listing. Unfiltered totals are cached per user and listing version,
+    and each page records the position of its last row, so that the next
+    page is found by keyset rather than offset.
+    """
+
+    def __init__(self, user, registry_model):
+        self.user = user
+        self.registry_model = registry_model
+        self.version = PatientListing.objects.get_version(registry_model.code)
+
+    @staticmethod
+    def _filter_args(filters):
+        filter_args = PatientFilterType()
+        for key, value in filters.items():
+            if key == "search":
+                value = [
+                    SearchItem(item["text"], item["fields"]) for item in value
+                ]
+            setattr(filter_args, to_snake_case(key), value)
+        return filter_args
+
+    def _patients(self, filter_args):
+        patients = list_patients_query(
+            self.user, self.registry_model, filter_args
+        )
+        if filter_args.search:
+            patients = search_patients(patients, filter_args.search)
+        return patients
+
+    def _listing(self, filter_args):
+        return PatientListing.objects.filter(
+            registry=self.registry_model,
+            patient_id__in=self._patients(filter_args).values("id"),
+        )
+
+    def base_total(self):
+        key = _cache_key(
+            "total", self.registry_model.code, self.user.pk, self.version
+        )
+        total = cache.get(key)
+        if total is None:
+            total = self._listing(PatientFilterType()).count()
+            cache.set(key, total, TOTAL_CACHE_TIMEOUT)
+        return total
+
+    def page(self, filters, sort_fields, start, length):
+        """
+        Returns the filtered total and the listing rows of the page, each
+        with its patient.
+        """
+        ordering = listing_ordering(sort_fields)
+        listing = self._listing(self._filter_args(filters))
+        filtered_total = listing.count()
+
+        cursor_key = _cache_key(
+            "cursor",
+            self.registry_model.code,
+            self.user.pk,
+            self.version,
+            filters,
+            ordering,
+        )
+        cursor = cache.get(f"{cursor_key}_{start}") if start else None
+        rows = listing.order_by(*ordering)
+        if cursor is not None:
+            rows = rows.filter(keyset_filter(ordering, cursor))
+        elif start:
+            rows = rows[start:]
+        rows = list(rows[:length] if length > 0 else rows)
+
+        if rows and length > 0:
+            last_row = rows[-1]
+            cache.set(
+                f"{cursor_key}_{start + len(rows)}",
+                {
+                    field.lstrip("-"): getattr(last_row, field.lstrip("-"))
+                    for field in ordering
+                },
+                CURSOR_CACHE_TIMEOUT,
+            )
+
+        patients = Patient.objects.select_related("stage").in_bulk(
+            [row.patient_id for row in rows]
+        )
+        return filtered_total, [
+            (row, patients[row.patient_id])
+            for row in rows
+            if row.patient_id in patients
+        ]
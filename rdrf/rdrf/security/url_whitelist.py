@@ -384,6 +384,9 @@ SECURITY_WHITELISTED_URLS = (
     "print_consent_list",
     "report:report_designer",
     "report:report_download",
+    "report:report_job",
+    "report:report_job_download",
+    "report:report_job_submit",
     "report:report_delete",
     "report:reports_list",
     "registration_activate",
@@ -1,10 +1,14 @@
 import json
 import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import timedelta
 
 import yaml
 from django.contrib.auth.models import Group
-from django.core.exceptions import MultipleObjectsReturned, ValidationError
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from registry.groups.models import (
     WorkingGroup,
     WorkingGroupType,
@@ -22,7 +26,9 @@ from report.models import (
     ReportDesign,
 )
 
+from rdrf.forms.dsl.parse_utils import clear_prefetched_form_data_cache
 from rdrf.forms.widgets.widgets import get_widgets_for_data_type
+from rdrf.helpers.definition_version import bump_definition_version
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.models.data_fixes import CdeMappings
 from rdrf.models.definition.models import (
@@ -55,21 +61,26 @@ from .patient_stage_changes import PatientStageChanges
 logger = logging.getLogger(__name__)
 
 
-def _registries_using_cde(cde_code):
-    registries = set([])
-    for r in Registry.objects.all():
-        for form in RegistryForm.objects.filter(registry=r):
-            for section_code in form.get_sections():
-                try:
-                    section = Section.objects.get(code=section_code)
-                    for cde_code_in_section in section.get_elements():
-                        if cde_code == cde_code_in_section:
-                            registries.add(r.code)
+def _registries_using_cdes():
+    section_elements = {
+        section.code: section.get_elements()
+        for section in Section.objects.all()
+    }
+    registries = defaultdict(set)
+    for form in RegistryForm.objects.select_related("registry"):
+        for section_code in form.get_sections():
+            for cde_code in section_elements.get(section_code, []):
+                registries[cde_code].add(form.registry.code)
+
+    return registries
 
-                except Section.DoesNotExist:
-                    pass
 
-    return [code for code in registries]
+def _stored_value(model, field, value):
+    # Compare imported values the way they are stored, eg 10 and Decimal("10.00")
+    try:
+        return model._meta.get_field(field).to_python(value)
+    except ValidationError:
+        return value
 
 
 class RegistryImportError(Exception):
@@ -115,6 +126,7 @@ class Importer(object):
         self.check_validity = True
         self.check_soundness = True
         self.abort_on_conflict = False
+        self.timings = []
 
     def load_yaml_from_string(self, yaml_string):
         self.yaml_data_file = "yaml string"
@@ -156,18 +168,32 @@ class Importer(object):
         else:
             self.state = ImportState.VALID
 
-        self._create_registry_objects(export_type)
+        with transaction.atomic():
+            self._create_registry_objects(export_type)
+            # Imports can bypass model signals (eg bulk creates and raw
+            # updates), so make sure cached definition derivatives are rebuilt
+            clear_prefetched_form_data_cache(RegistryForm.objects.all())
+            bump_definition_version()
+
+            if self.check_soundness:
+                with self._timed("soundness check"):
+                    self._check_soundness(export_type)
+                if self.state == ImportState.UNSOUND:
+                    raise DefinitionFileUnsound(
+                        "Definition File refers to CDEs that don't exist: %s"
+                        % self.errors
+                    )
 
-        if self.check_soundness:
-            self._check_soundness(export_type)
-            if self.state == ImportState.UNSOUND:
-                raise DefinitionFileUnsound(
-                    "Definition File refers to CDEs that don't exist: %s"
-                    % self.errors
-                )
+            else:
+                self.state = ImportState.SOUND
 
-        else:
-            self.state = ImportState.SOUND
+    @contextmanager
+    def _timed(self, phase):
+        started_at = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - started_at
+        self.timings.append((phase, elapsed))
+        logger.info("import of %s took %.2fs" % (phase, elapsed))
 
     def _validate(self, export_type):
         ve = []
@@ -348,102 +374,141 @@ class Importer(object):
                 )
 
     def _create_pvgs(self, permissible_value_group_maps):
-        for pvg_map in permissible_value_group_maps:
-            pvg, created = CDEPermittedValueGroup.objects.get_or_create(
-                code=pvg_map["code"]
-            )
-            pvg.save()
-            if not created:
-                logger.warning(
-                    "Import is updating an existing group %s" % pvg.code
-                )
-                existing_values = [
-                    pv for pv in CDEPermittedValue.objects.filter(pv_group=pvg)
-                ]
-                existing_value_codes = set([pv.code for pv in existing_values])
-                import_value_codes = set([v["code"] for v in pvg_map["values"]])
-                import_missing = existing_value_codes - import_value_codes
-                # ensure applied import "wins" - this potentially could affect other
-                # registries though
-                # but if value sets are inconsistent we can't help it
-
-                for value_code in import_missing:
-                    logger.info("checking pvg value code %s" % value_code)
-                    try:
-                        value = CDEPermittedValue.objects.get(
-                            code=value_code, pv_group=pvg
-                        )
-                        logger.warning(
-                            "deleting value %s.%s as it is not in import!"
-                            % (pvg.code, value.code)
-                        )
-                        value.delete()
-                    except CDEPermittedValue.DoesNotExist:
-                        logger.info("value does not exist?")
-
-                    except Exception as ex:
-                        logger.error("err: %s" % ex)
-                        raise
+        pvg_maps = {
+            pvg_map["code"]: pvg_map for pvg_map in permissible_value_group_maps
+        }
+        existing_groups = CDEPermittedValueGroup.objects.in_bulk(list(pvg_maps))
+        for pvg_code in existing_groups:
+            logger.warning("Import is updating an existing group %s" % pvg_code)
+        CDEPermittedValueGroup.objects.bulk_create(
+            [
+                CDEPermittedValueGroup(code=pvg_code)
+                for pvg_code in pvg_maps
+                if pvg_code not in existing_groups
+            ]
+        )
 
+        import_keys = set(
+            (pvg_code, value_map["code"])
+            for pvg_code, pvg_map in pvg_maps.items()
+            for value_map in pvg_map["values"]
+        )
+        existing_values = {}
+        import_missing = []
+        for value in CDEPermittedValue.objects.filter(
+            pv_group__in=list(existing_groups)
+        ):
+            key = (value.pv_group_id, value.code)
+            if key not in import_keys:
+                import_missing.append(value)
+            elif key in existing_values:
+                raise ValidationError("range %s code %s is duplicated" % key)
+            else:
+                existing_values[key] = value
+
+        # ensure applied import "wins" - this potentially could affect other
+        # registries though
+        # but if value sets are inconsistent we can't help it
+        for value in import_missing:
+            logger.warning(
+                "deleting value %s.%s as it is not in import!"
+                % (value.pv_group_id, value.code)
+            )
+        if import_missing:
+            CDEPermittedValue.objects.filter(
+                pk__in=[value.pk for value in import_missing]
+            ).delete()
+
+        to_create = {}
+        to_update = {}
+        for pvg_code, pvg_map in pvg_maps.items():
             for value_map in pvg_map["values"]:
-                try:
-                    value, created = CDEPermittedValue.objects.get_or_create(
-                        code=value_map["code"], pv_group=pvg
-                    )
-                except MultipleObjectsReturned:
-                    raise ValidationError(
-                        "range %s code %s is duplicated"
-                        % (pvg.code, value_map["code"])
+                key = (pvg_code, value_map["code"])
+                value = existing_values.get(key)
+                if value is None:
+                    value = to_create.setdefault(
+                        key,
+                        CDEPermittedValue(
+                            pv_group_id=pvg_code, code=value_map["code"]
+                        ),
                     )
-
-                if not created:
+                else:
                     if value.value != value_map["value"]:
                         logger.warning(
                             "Existing value code %s.%s = '%s'"
-                            % (value.pv_group.code, value.code, value.value)
+                            % (pvg_code, value.code, value.value)
                         )
                         logger.warning(
                             "Import value code %s.%s = '%s'"
-                            % (
-                                pvg_map["code"],
-                                value_map["code"],
-                                value_map["value"],
-                            )
+                            % (pvg_code, value_map["code"], value_map["value"])
                         )
 
                     if value.desc != value_map["desc"]:
                         logger.warning(
                             "Existing value desc%s.%s = '%s'"
-                            % (value.pv_group.code, value.code, value.desc)
+                            % (pvg_code, value.code, value.desc)
                         )
                         logger.warning(
                             "Import value desc %s.%s = '%s'"
-                            % (
-                                pvg_map["code"],
-                                value_map["code"],
-                                value_map["desc"],
-                            )
+                            % (pvg_code, value_map["code"], value_map["desc"])
                         )
 
                 # update the value ...
-                value.value = value_map["value"]
-                value.desc = value_map["desc"]
-
+                import_fields = {
+                    "value": value_map["value"],
+                    "desc": value_map["desc"],
+                }
                 if "position" in value_map:
-                    value.position = value_map["position"]
-
-                value.save()
+                    import_fields["position"] = value_map["position"]
+
+                for field, import_value in import_fields.items():
+                    if getattr(value, field) != import_value:
+                        setattr(value, field, import_value)
+                        if value.pk:
+                            to_update[value.pk] = value
+
+        CDEPermittedValue.objects.bulk_create(list(to_create.values()))
+        if to_update:
+            CDEPermittedValue.objects.bulk_update(
+                list(to_update.values()), ["value", "desc", "position"]
+            )
+        logger.info(
+            "pvg values: %s created, %s updated, %s unchanged, %s deleted"
+            % (
+                len(to_create),
+                len(to_update),
+                len(existing_values) - len(to_update),
+                len(import_missing),
+            )
+        )
 
     def _create_cdes(self, cde_maps):
         unknown_attributes = set()
+        existing_cdes = CommonDataElement.objects.in_bulk(
+            [cde_map["code"] for cde_map in cde_maps]
+        )
+        pvgs = CDEPermittedValueGroup.objects.in_bulk(
+            [cde_map["pv_group"] for cde_map in cde_maps if cde_map["pv_group"]]
+        )
+        registries_using = _registries_using_cdes() if existing_cdes else {}
+        to_create = {}
+        to_update = {}
+        updated_fields = set()
         for cde_map in cde_maps:
-            cde_model, created = CommonDataElement.objects.get_or_create(
-                code=cde_map["code"],
-                defaults={"abbreviated_name": cde_map["abbreviated_name"]},
-            )
-
-            if not created:
-                registries_already_using = _registries_using_cde(cde_model)
+            created = cde_map["code"] not in existing_cdes
+            if created:
+                cde_model = to_create.setdefault(
+                    cde_map["code"],
+                    CommonDataElement(
+                        code=cde_map["code"],
+                        abbreviated_name=cde_map["abbreviated_name"],
+                    ),
+                )
+            else:
+                cde_model = existing_cdes[cde_map["code"]]
+                registries_already_using = sorted(
+                    registries_using.get(cde_model.code, [])
+                )
                 if len(registries_already_using) > 0:
                     logger.warning(
                         "Import is modifying existing CDE %s" % cde_model
@@ -453,6 +518,7 @@ class Importer(object):
                         % registries_already_using
                     )
 
+            changed_fields = set()
             for field in cde_map:
                 if not hasattr(cde_model, field):
                     if field not in unknown_attributes:
@@ -491,53 +557,120 @@ class Importer(object):
 
                 if not created:
                     old_value = getattr(cde_model, field)
-                    if old_value != import_value:
-                        logger.warning(
-                            "import will change cde %s: import value = %s new value = %s"
-                            % (cde_model.code, old_value, import_value)
-                        )
+                    if old_value == _stored_value(
+                        cde_model, field, import_value
+                    ):
+                        continue
+                    logger.warning(
+                        "import will change cde %s: import value = %s new value = %s"
+                        % (cde_model.code, old_value, import_value)
+                    )
+                    changed_fields.add(field)
 
                 setattr(cde_model, field, import_value)
-                # logger.info("cde %s.%s set to [%s]" % (cde_model.code, field, cde_map[field]))
 
             # Assign value group - pv_group will be empty string is not a range
 
             if cde_map["pv_group"]:
-                try:
-                    pvg = CDEPermittedValueGroup.objects.get(
-                        code=cde_map["pv_group"]
+                pvg = pvgs.get(cde_map["pv_group"])
+                if pvg is None:
+                    raise ConsistencyError(
+                        "Assign of group %s to imported CDE %s failed: group does not exist"
+                        % (cde_map["pv_group"], cde_model.code)
                     )
-                    if not created:
-                        if cde_model.pv_group != pvg:
-                            logger.warning(
-                                "import will change cde %s: old group = %s new group = %s"
-                                % (cde_model.code, cde_model.pv_group, pvg)
-                            )
+                if not created and cde_model.pv_group_id != pvg.code:
+                    logger.warning(
+                        "import will change cde %s: old group = %s new group = %s"
+                        % (cde_model.code, cde_model.pv_group_id, pvg.code)
+                    )
+                    changed_fields.add("pv_group")
+                cde_model.pv_group = pvg
 
-                    cde_model.pv_group = pvg
-                except CDEPermittedValueGroup.DoesNotExist as ex:
-                    raise ConsistencyError(
-                        "Assign of group %s to imported CDE %s failed: %s"
-                        % (cde_map["pv_group"], cde_model.code, ex)
+            # Bulk writes skip CommonDataElement.save
+            widget = (cde_model.widget_name, cde_model.widget_settings)
+            cde_model.normalise_widget()
+            if not created:
+                if widget[0] != cde_model.widget_name:
+                    changed_fields.add("widget_name")
+                if widget[1] != cde_model.widget_settings:
+                    changed_fields.add("widget_settings")
+                if changed_fields:
+                    to_update[cde_model.code] = cde_model
+                    updated_fields |= changed_fields
+
+        CommonDataElement.objects.bulk_create(list(to_create.values()))
+        if to_update:
+            CommonDataElement.objects.bulk_update(
+                list(to_update.values()), sorted(updated_fields)
+            )
+        logger.info(
+            "cdes: %s created, %s updated, %s unchanged"
+            % (
+                len(to_create),
+                len(to_update),
+                len(existing_cdes) - len(to_update),
+            )
+        )
+
+    def _create_sections(self, section_maps, update_abbreviated_name=True):
+        section_maps = {
+            section_map["code"]: section_map for section_map in section_maps
+        }
+        existing_sections = Section.objects.in_bulk(
+            list(section_maps), field_name="code"
+        )
+        to_create = []
+        to_update = []
+        updated_fields = set()
+        for code, section_map in section_maps.items():
+            import_fields = {
+                "display_name": section_map["display_name"],
+                "header": section_map["header"],
+                "elements": ",".join(section_map["elements"]),
+                "allow_multiple": section_map["allow_multiple"],
+                "extra": section_map["extra"],
+            }
+            section = existing_sections.get(code)
+            if section is None:
+                to_create.append(
+                    Section(
+                        code=code,
+                        abbreviated_name=section_map["abbreviated_name"],
+                        **import_fields,
                     )
+                )
+                continue
 
-            cde_model.save()
-            # logger.info("updated cde %s" % cde_model)
+            if update_abbreviated_name:
+                import_fields["abbreviated_name"] = section_map[
+                    "abbreviated_name"
+                ]
+            changed_fields = [
+                field
+                for field, import_value in import_fields.items()
+                if getattr(section, field) != import_value
+            ]
+            if changed_fields:
+                for field in changed_fields:
+                    setattr(section, field, import_fields[field])
+                to_update.append(section)
+                updated_fields.update(changed_fields)
+
+        Section.objects.bulk_create(to_create)
+        if to_update:
+            Section.objects.bulk_update(to_update, sorted(updated_fields))
+        logger.info(
+            "sections: %s created, %s updated, %s unchanged"
+            % (
+                len(to_create),
+                len(to_update),
+                len(existing_sections) - len(to_update),
+            )
+        )
 
     def _create_generic_sections(self, generic_section_maps):
         logger.info("creating generic sections")
-        for section_map in generic_section_maps:
-            logger.info("importing generic section map %s" % section_map)
-            s, created = Section.objects.get_or_create(code=section_map["code"])
-            s.code = section_map["code"]
-            s.abbreviated_name = section_map["abbreviated_name"]
-            s.display_name = section_map["display_name"]
-            s.header = section_map["header"]
-            s.elements = ",".join(section_map["elements"])
-            s.allow_multiple = section_map["allow_multiple"]
-            s.extra = section_map["extra"]
-            s.save()
-            logger.info("saved generic section %s" % s.code)
+        self._create_sections(generic_section_maps)
 
     def _create_patient_data_section(self, section_map):
         if section_map:
@@ -572,17 +705,25 @@ class Importer(object):
 
     def _create_registry_objects(self, export_type):
         if "pvgs" in self.data:
-            self._create_pvgs(self.data["pvgs"])
+            with self._timed("pvgs"):
+                self._create_pvgs(self.data["pvgs"])
             logger.info("imported pvgs OK")
 
         if "cdes" in self.data:
-            self._create_cdes(self.data["cdes"])
+            with self._timed("cdes"):
+                self._create_cdes(self.data["cdes"])
             logger.info("imported cdes OK")
 
         if "generic_sections" in self.data:
-            self._create_generic_sections(self.data["generic_sections"])
+            with self._timed("generic sections"):
+                self._create_generic_sections(self.data["generic_sections"])
             logger.info("imported generic sections OK")
 
+        with self._timed("registry"):
+            self._create_registry_definition(export_type)
+
+    def _create_registry_definition(self, export_type):
+
         r, created = Registry.objects.get_or_create(code=self.data["code"])
 
         original_forms = set(
@@ -793,6 +934,10 @@ class Importer(object):
                 logger.info("FormTitle records imported")
 
         if "forms" in self.data:
+            # First create section models so the form save validation passes
+            with self._timed("form sections"):
+                self._create_form_sections(self.data["forms"])
+
             for frm_map in self.data["forms"]:
                 logger.info("starting import of form map %s" % frm_map)
 
@@ -800,9 +945,6 @@ class Importer(object):
                     [section_map["code"] for section_map in frm_map["sections"]]
                 )
 
-                # First create section models so the form save validation passes
-                self._create_form_sections(frm_map)
-
                 f, created = RegistryForm.objects.get_or_create(
                     registry=r,
                     name=frm_map["name"],
@@ -1023,20 +1165,15 @@ class Importer(object):
                 en.email_templates.add(et)
                 en.save()
 
-    def _create_form_sections(self, frm_map):
-        for section_map in frm_map["sections"]:
-            s, created = Section.objects.get_or_create(
-                code=section_map["code"],
-                defaults={"abbreviated_name": section_map["abbreviated_name"]},
-            )
-            s.code = section_map["code"]
-            s.display_name = section_map["display_name"]
-            s.header = section_map["header"]
-            s.elements = ",".join(section_map["elements"])
-            s.allow_multiple = section_map["allow_multiple"]
-            s.extra = section_map["extra"]
-            s.save()
-            logger.info("imported section %s OK" % s.code)
+    def _create_form_sections(self, form_maps):
+        self._create_sections(
+            [
+                section_map
+                for frm_map in form_maps
+                for section_map in frm_map["sections"]
+            ],
+            update_abbreviated_name=False,
+        )
 
     def _create_context_form_groups(self, registry):
         from rdrf.models.definition.models import (
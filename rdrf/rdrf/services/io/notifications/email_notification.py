@@ -1,8 +1,9 @@
+import functools
 import json
 import logging
+from collections import defaultdict
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives, send_mail
 from django.template import Context, Engine, Template
 from django.template.loader import get_template
 from registry.groups.models import CustomUser
@@ -13,9 +14,10 @@ from rdrf.models.definition.models import (
     EmailNotification,
     EmailNotificationHistory,
     EmailPreference,
-    EmailTemplate,
 )
 
+from .outbox import send_email
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +25,19 @@ class RdrfEmailException(Exception):
     pass
 
 
+@functools.lru_cache(maxsize=None)
+def _get_template_engine():
+    # Makes the full_url custom tag available in Email Templates without having to {% load full_url %}
+    # full_url is like url but it returns the full URL so it doesn't have to be hardcoded into the templates.
+    return Engine(builtins=["rdrf.templatetags.full_url"])
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_email_template(subject, body):
+    # Cached by the template text, so edited templates are compiled again
+    return Template(subject), Template(body, engine=_get_template_engine())
+
+
 class RdrfEmail(object):
     _DEFAULT_LANGUAGE = "en"
 
@@ -41,6 +56,10 @@ class RdrfEmail(object):
         self.reg_code = reg_code
         self.description = description
         self.language = language  # used to only send to subset of languages by EmailNotificationHistory resend
+        # Loaded once per send for all the recipients
+        self._users = {}
+        self._email_preferences = {}
+        self._templates = None
 
         if email_notification:
             self.email_notification = email_notification
@@ -50,16 +69,10 @@ class RdrfEmail(object):
         else:
             self.email_notification = self._get_email_notification()
 
-    def _send_mail(
-        self, subject, body, address, recipient_list, html_message, headers=None
-    ):
-        mail = EmailMultiAlternatives(
-            subject, body, address, recipient_list, headers
+    def _send_mail(self, subject, body, address, recipient_list, html_message):
+        return send_email(
+            subject, body, address, recipient_list, html_body=html_message
         )
-        if html_message:
-            mail.attach_alternative(html_message, "text/html")
-
-        return mail.send()
 
     def send(self):
         success = False
@@ -75,29 +88,35 @@ class RdrfEmail(object):
                 self.email_notification.email_from
                 or settings.DEFAULT_FROM_EMAIL
             )
+            recipients_by_language = defaultdict(list)
             for recipient in recipients:
                 language = self._get_preferred_language(recipient)
                 if self.language and self.language != language:
                     # skip recipients with diff language
                     # this is used in resend when we resend per language template
                     continue
+                recipients_by_language[language].append(recipient)
 
-                email_subject, email_body = self._get_email_subject_and_body(
+            # The template context is the same for all the recipients, so
+            # only the unsubscribe footer is rendered per recipient
+            for language, language_recipients in recipients_by_language.items():
+                email_subject, language_body = self._get_email_subject_and_body(
                     language
                 )
-
-                if unsubscribe_footer := self._get_unsubscribe_footer(
-                    recipient
-                ):
-                    email_body += unsubscribe_footer
-
-                self._send_mail(
-                    email_subject,
-                    email_body,
-                    sender_address,
-                    [recipient],
-                    html_message=email_body,
-                )
+                for recipient in language_recipients:
+                    email_body = language_body
+                    if unsubscribe_footer := self._get_unsubscribe_footer(
+                        recipient
+                    ):
+                        email_body += unsubscribe_footer
+
+                    self._send_mail(
+                        email_subject,
+                        email_body,
+                        sender_address,
+                        [recipient],
+                        html_message=email_body,
+                    )
 
                 if language not in notification_record_saved:
                     self._save_notification_record(language)
@@ -113,8 +132,39 @@ class RdrfEmail(object):
             )
         return success
 
+    def _load_users(self, email_addresses):
+        users = defaultdict(list)
+        for user in CustomUser.objects.filter(email__in=email_addresses):
+            users[user.email].append(user)
+        # Addresses shared by several users aren't treated as users
+        self._users = {
+            email_address: (
+                users[email_address][0]
+                if len(users[email_address]) == 1
+                else None
+            )
+            for email_address in email_addresses
+        }
+        if self.email_notification.subscribable:
+            self._email_preferences = {
+                preference.user_id: preference
+                for preference in EmailPreference.objects.filter(
+                    user__in=[user for user in self._users.values() if user]
+                ).prefetch_related("notification_preferences")
+            }
+
     def _get_user_from_email(self, email_address):
-        return CustomUser.objects.get(email=email_address)
+        if email_address not in self._users:
+            return CustomUser.objects.get(email=email_address)
+        user = self._users[email_address]
+        if user is None:
+            raise CustomUser.DoesNotExist()
+        return user
+
+    def _get_email_preference(self, user):
+        if user.email in self._users:
+            return self._email_preferences.get(user.pk)
+        return EmailPreference.objects.get_by_user(user)
 
     def _get_preferred_language(self, email_address):
         def pref_lang():
@@ -136,7 +186,7 @@ class RdrfEmail(object):
             ):
                 return True  # recipient is not a standard user, therefore we don't know their email preferences
 
-            email_preference = EmailPreference.objects.get_by_user(user)
+            email_preference = self._get_email_preference(user)
 
             if email_preference and not email_preference.is_email_allowed(
                 self.email_notification
@@ -166,39 +216,37 @@ class RdrfEmail(object):
         # and a parent template is registered against the account verified
         # event , the recipient template will evaluate to an empty string ..
 
-        return [
-            r
-            for r in recipients
-            if self._valid_email(r) and self._is_allowed_to_email(r)
-        ]
+        recipients = [r for r in recipients if self._valid_email(r)]
+        self._load_users(recipients)
+        return [r for r in recipients if self._is_allowed_to_email(r)]
 
     def _valid_email(self, s):
         return "@" in s
 
-    def _get_email_subject_and_body(self, language):
-        try:
-            email_template = self.email_notification.email_templates.get(
-                language=language
+    def _get_email_template(self, language):
+        if self._templates is None:
+            self._templates = {
+                email_template.language: email_template
+                for email_template in self.email_notification.email_templates.all()
+            }
+        email_template = self._templates.get(language) or self._templates.get(
+            self._DEFAULT_LANGUAGE
+        )
+        if email_template is None:
+            raise RdrfEmailException(
+                "Can't find any email templates for Email notification %s"
+                % self.email_notification.id
             )
-        except EmailTemplate.DoesNotExist:
-            try:
-                email_template = self.email_notification.email_templates.get(
-                    language=self._DEFAULT_LANGUAGE
-                )
-            except EmailTemplate.DoesNotExist:
-                raise RdrfEmailException(
-                    "Can't find any email templates for Email notification %s"
-                    % self.email_notification.id
-                )
+        return email_template
 
-        context = Context(self.template_data)
+    def _get_email_subject_and_body(self, language):
+        email_template = self._get_email_template(language)
 
-        # Makes the full_url custom tag available in Email Templates without having to {% load full_url %}
-        # full_url is like url but it returns the full URL so it doesn't have to be hardcoded into the templates.
-        engine = Engine(builtins=["rdrf.templatetags.full_url"])
+        context = Context(self.template_data)
 
-        template_subject = Template(email_template.subject)
-        template_body = Template(email_template.body, engine=engine)
+        template_subject, template_body = _compile_email_template(
+            email_template.subject, email_template.body
+        )
 
         template_subject = template_subject.render(context)
         template_body = template_body.render(context)
@@ -312,12 +360,12 @@ def process_raw_email(
         Context(message_template_data).flatten()
     )
 
-    return send_mail(
-        subject=subject,
-        message=email_body,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=recipient_list,
-        html_message=email_body,
+    return send_email(
+        subject,
+        email_body,
+        settings.DEFAULT_FROM_EMAIL,
+        recipient_list,
+        html_body=email_body,
     )
 
 
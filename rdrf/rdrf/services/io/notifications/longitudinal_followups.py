@@ -1,8 +1,11 @@
 import datetime
 import itertools
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from urllib.parse import urlencode
 
+from django.db import connections, transaction
 from django.db.models import (
     DateTimeField,
     ExpressionWrapper,
@@ -17,11 +20,15 @@ from registry.patients.models import (
     ConsentValue,
     LongitudinalFollowupEntry,
     LongitudinalFollowupQueueState,
+    Patient,
+    PatientDTO,
+    patientdto_attr_fields,
 )
 
 from rdrf.events.events import EventType
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.models.definition.models import (
+    ConsentQuestion,
     ContextFormGroupItem,
     LongitudinalFollowup,
     Registry,
@@ -69,32 +76,76 @@ class ConditionException(Exception):
         return f"ConditionException: {self.original_exception}"
 
 
-def _get_consents(patient):
-    return {
-        f"{registry.code}.{section.code}.{question.code}": (
-            consent_value.answer
-            if (
-                consent_value := ConsentValue.objects.filter(
-                    patient=patient, consent_question=question
-                ).first()
+class FollowupBatch:
+    """
+    The data the follow-up conditions of a batch of patients are evaluated
+    against, loaded in bulk for the whole batch.
+    """
+
+    def __init__(self, patients):
+        self.patients = {patient.id: patient for patient in patients}
+        self._consents = None
+
+    def _load_consents(self):
+        registry_questions = {}
+        for question in ConsentQuestion.objects.filter(
+            section__registry__in={
+                registry.id
+                for patient in self.patients.values()
+                for registry in patient.rdrf_registry.all()
+            }
+        ).select_related("section__registry"):
+            registry = question.section.registry
+            registry_questions.setdefault(registry.id, []).append(
+                (
+                    f"{registry.code}.{question.section.code}.{question.code}",
+                    question.id,
+                )
             )
-            else None
+
+        answers = {}
+        for patient_id, question_id, answer in ConsentValue.objects.filter(
+            patient__in=self.patients.keys()
+        ).values_list("patient_id", "consent_question_id", "answer"):
+            answers.setdefault((patient_id, question_id), answer)
+
+        return {
+            patient_id: {
+                key: answers.get((patient_id, question_id))
+                for registry in patient.rdrf_registry.all()
+                for key, question_id in registry_questions.get(registry.id, [])
+            }
+            for patient_id, patient in self.patients.items()
+        }
+
+    def get_consents(self, patient_id):
+        if self._consents is None:
+            self._consents = self._load_consents()
+        return self._consents[patient_id]
+
+    def get_patient_dto(self, patient_id):
+        patient = self.patients[patient_id]
+        return PatientDTO(
+            **{f: getattr(patient, f) for f in patientdto_attr_fields},
+            working_groups=[wg.name for wg in patient.working_groups.all()],
         )
-        for registry in patient.rdrf_registry.all()
-        for section in registry.consent_sections.all()
-        for question in section.questions.all()
-    }
 
 
-def evaluate_condition(longitudinal_followup_entry):
-    if condition := longitudinal_followup_entry.longitudinal_followup.condition:
+@lru_cache
+def _compile_condition(condition):
+    return compile(condition, "<condition>", "eval")
+
+
+def evaluate_condition(longitudinal_followup_entry, batch):
+    longitudinal_followup = longitudinal_followup_entry.longitudinal_followup
+    if condition := longitudinal_followup.condition:
         try:
-            patient = longitudinal_followup_entry.patient
+            patient_id = longitudinal_followup_entry.patient_id
             return eval(
-                condition,
+                _compile_condition(condition),
                 {
-                    "patient": patient.as_dto(),
-                    "consents": _get_consents(patient),
+                    "patient": batch.get_patient_dto(patient_id),
+                    "consents": batch.get_consents(patient_id),
                 },
             )
         except Exception as e:
@@ -145,22 +196,50 @@ def _serialize_entries(patient_entries):
     }
 
 
-def with_now(func):
-    def wrapper(now=None):
-        return func(now=now or datetime.datetime.now())
-
-    return wrapper
+def _send_notifications(notifications, close_connections):
+    sent_success = sent_failure = 0
+    try:
+        for registry_code, template_data in notifications:
+            try:
+                process_notification(
+                    registry_code,
+                    EventType.LONGITUDINAL_FOLLOWUP,
+                    template_data,
+                )
+                sent_success += 1
+            except Exception as e:
+                logger.error(e)
+                sent_failure += 1
+    finally:
+        if close_connections:
+            # Connections are per thread, so close those of the worker
+            connections.close_all()
+    return sent_success, sent_failure
+
+
+def _dispatch_notifications(notifications, executor, workers):
+    if executor is None:
+        return _send_notifications(notifications, False)
+
+    chunks = [notifications[i::workers] for i in range(workers)]
+    results = executor.map(
+        _send_notifications, [c for c in chunks if c], itertools.repeat(True)
+    )
+    sent_success = sent_failure = 0
+    for success, failure in results:
+        sent_success += success
+        sent_failure += failure
+    return sent_success, sent_failure
 
 
-@with_now
-def send_longitudinal_followups(now):
+def _outstanding_entries(now):
     allowed_registries = [
         r.code
         for r in Registry.objects.all()
         if r.has_feature(RegistryFeatures.LONGITUDINAL_FOLLOWUPS)
     ]
 
-    outstanding_entries = (
+    return (
         LongitudinalFollowupEntry.objects.annotate(
             debounce_value=Coalesce(
                 "longitudinal_followup__debounce",
@@ -200,19 +279,33 @@ def send_longitudinal_followups(now):
             .values("patient__id")
             .distinct(),
         )
+        .select_related("longitudinal_followup")
         .order_by("patient__id", "created_at")
     )
 
-    logger.info(
-        f"Found {len(outstanding_entries)} outstanding followup entries"
-    )
 
-    sent_success = sent_failure = 0
+def _process_batch(now, batch_entries):
+    """
+    Marks the due entries of a batch of patients as sent, and returns
+    the notifications to send for them and whether processing must halt.
+    """
+    patients = Patient.objects.filter(
+        id__in={entry.patient_id for entry in batch_entries}
+    ).prefetch_related("rdrf_registry", "working_groups")
+    batch = FollowupBatch(patients)
+
+    notifications = []
+    sent_entries = []
+    halt = False
     for patient_id, patient_entries_group in itertools.groupby(
-        outstanding_entries, lambda entry: entry.patient.id
+        batch_entries, lambda entry: entry.patient_id
     ):
         all_patient_entries = list(patient_entries_group)
-        patient_entries = list(filter(evaluate_condition, all_patient_entries))
+        patient_entries = [
+            entry
+            for entry in all_patient_entries
+            if evaluate_condition(entry, batch)
+        ]
         logger.debug(
             f"Patient {patient_id}: {len(patient_entries)} / {len(all_patient_entries)} followup entries"
         )
@@ -220,9 +313,11 @@ def send_longitudinal_followups(now):
         if len(patient_entries) == 0:
             continue
 
-        patient = patient_entries[0].patient
+        patient = batch.patients[patient_id]
 
-        patient_registry = patient.rdrf_registry.first()
+        patient_registry = min(
+            patient.rdrf_registry.all(), key=lambda registry: registry.pk
+        )
         registry_code = patient_registry.code
 
         if not patient_registry.has_feature(
@@ -231,6 +326,7 @@ def send_longitudinal_followups(now):
             logger.info(
                 f"Halting longitudinal followup processing as registry {registry_code} disabled the feature"
             )
+            halt = True
             break
 
         # At least one email that's eligible before debounce
@@ -244,23 +340,78 @@ def send_longitudinal_followups(now):
         for entry in patient_entries:
             entry.sent_at.append(sent_at)
             entry.state = LongitudinalFollowupQueueState.SENT
-        LongitudinalFollowupEntry.objects.bulk_update(
-            patient_entries, ["sent_at", "state"]
-        )
+        sent_entries.extend(patient_entries)
 
-        try:
-            process_notification(
+        notifications.append(
+            (
                 registry_code,
-                EventType.LONGITUDINAL_FOLLOWUP,
                 {
                     "patient": patient,
                     "longitudinal_followups": longitudinal_followups,
                 },
             )
-            sent_success += 1
-        except Exception as e:
-            logger.error(e)
-            sent_failure += 1
+        )
+
+    with transaction.atomic():
+        LongitudinalFollowupEntry.objects.bulk_update(
+            sent_entries, ["sent_at", "state"]
+        )
+
+    return notifications, halt
+
+
+def _patient_batches(entries, batch_size):
+    batch = []
+    for _, patient_entries in itertools.groupby(
+        entries, lambda entry: entry.patient_id
+    ):
+        batch.extend(patient_entries)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def with_now(func):
+    def wrapper(now=None, **kwargs):
+        return func(now=now or datetime.datetime.now(), **kwargs)
+
+    return wrapper
+
+
+@with_now
+def send_longitudinal_followups(now, batch_size=1000, workers=1):
+    """
+    Sends the outstanding followups of each patient in a single email.
+
+    Patients are processed in batches of about batch_size entries, whose
+    sent state is committed before their emails are sent by up to workers
+    threads.
+    """
+    outstanding_entries = _outstanding_entries(now)
+
+    logger.info(
+        f"Found {outstanding_entries.count()} outstanding followup entries"
+    )
+
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    sent_success = sent_failure = 0
+    try:
+        for batch_entries in _patient_batches(
+            outstanding_entries.iterator(chunk_size=batch_size), batch_size
+        ):
+            notifications, halt = _process_batch(now, batch_entries)
+            success, failure = _dispatch_notifications(
+                notifications, executor, workers
+            )
+            sent_success += success
+            sent_failure += failure
+            if halt:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     logger.info(
         f"Sent {sent_success} followup emails, failed to send {sent_failure}"
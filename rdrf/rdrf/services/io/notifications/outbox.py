@@ -0,0 +1,146 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rdrf.models.definition.models import OutboundEmail, OutboundEmailState
+
+logger = logging.getLogger(__name__)
+
+
+def _message(subject, body, from_email, recipient_list, html_body, connection):
+    mail = EmailMultiAlternatives(
+        subject, body, from_email, recipient_list, connection=connection
+    )
+    if html_body:
+        mail.attach_alternative(html_body, "text/html")
+    return mail
+
+
+def send_email(
+    subject, body, from_email, recipient_list, html_body="", connection=None
+):
+    """
+    Queues the email when EMAIL_OUTBOX_ENABLED is set, otherwise sends it
+    straight away. Returns the number of emails sent or queued.
+    """
+    if settings.EMAIL_OUTBOX_ENABLED:
+        OutboundEmail.objects.create(
+            subject=subject,
+            body=body,
+            html_body=html_body or "",
+            from_email=from_email,
+            recipients=list(recipient_list),
+        )
+        return 1
+    return _message(
+        subject, body, from_email, recipient_list, html_body, connection
+    ).send()
+
+
+class RateLimiter:
+    def __init__(self, per_second):
+        self.interval = 1 / per_second if per_second else 0
+        self.last_sent_at = None
+
+    def wait(self):
+        if self.interval and self.last_sent_at is not None:
+            delay = self.last_sent_at + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.last_sent_at = time.monotonic()
+
+
+def _failed(email, error, now):
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        logger.error(
+            "Giving up on email %s after %s attempts: %s"
+            % (email.pk, email.attempts, error)
+        )
+        email.state = OutboundEmailState.FAILED
+    else:
+        delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+        logger.warning(
+            "Sending email %s failed, retrying in %ss: %s"
+            % (email.pk, delay, error)
+        )
+        email.send_at = now + timedelta(seconds=delay)
+
+
+def _claim(batch_size, rate_limiter):
+    """
+    Claims a batch of due emails by moving them past the end of the claim
+    and counting the attempt. If the worker dies while sending them, the
+    unsent ones are retried once the claim has expired, instead of the
+    whole batch being sent again.
+    """
+    # Locked rows are skipped, so several workers can run at once
+    with transaction.atomic():
+        now = timezone.now()
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(state=OutboundEmailState.PENDING, send_at__lte=now)
+            .order_by("send_at")[:batch_size]
+        )
+        claimed_until = now + timedelta(
+            seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT
+            + len(batch) * rate_limiter.interval
+        )
+        OutboundEmail.objects.filter(
+            pk__in=[email.pk for email in batch]
+        ).update(send_at=claimed_until, attempts=F("attempts") + 1)
+    for email in batch:
+        email.attempts += 1
+    return batch
+
+
+def send_queued_emails(batch_size=None, connection=None):
+    """
+    Sends the due queued emails in batches over a single connection.
+    Each batch is claimed first and each send is recorded straight away.
+    Failed emails are retried with an exponential backoff, up to
+    EMAIL_OUTBOX_MAX_ATTEMPTS times. Returns the number of emails sent and
+    the number that failed.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    connection = connection or get_connection()
+    rate_limiter = RateLimiter(settings.EMAIL_OUTBOX_RATE_LIMIT)
+    sent = failed = 0
+    with connection:
+        while True:
+            batch = _claim(batch_size, rate_limiter)
+            for email in batch:
+                rate_limiter.wait()
+                try:
+                    _message(
+                        email.subject,
+                        email.body,
+                        email.from_email,
+                        email.recipients,
+                        email.html_body,
+                        connection,
+                    ).send()
+                except Exception as ex:
+                    _failed(email, ex, timezone.now())
+                    OutboundEmail.objects.filter(pk=email.pk).update(
+                        state=email.state,
+                        send_at=email.send_at,
+                        last_error=email.last_error,
+                    )
+                    failed += 1
+                else:
+                    OutboundEmail.objects.filter(pk=email.pk).update(
+                        state=OutboundEmailState.SENT, sent_at=timezone.now()
+                    )
+                    sent += 1
+            if len(batch) < batch_size:
+                break
+
+    logger.info("Sent %s queued emails, %s failed" % (sent, failed))
+    return sent, failed
@@ -281,6 +281,22 @@ else:
     EMAIL_BACKEND = "anymail.backends.amazon_ses.EmailBackend"
 
 EMAIL_BACKEND = env.get("OVERRIDE_EMAIL_BACKEND", EMAIL_BACKEND)
+# Used by django.core.mail.backends.filebased.EmailBackend
+EMAIL_FILE_PATH = env.get("email_file_path", "/tmp/rdrf-emails")
+
+# Queue notification emails in the database instead of sending them
+# during the request, sent in batches by the send_queued_emails command
+EMAIL_OUTBOX_ENABLED = env.get("email_outbox_enabled", False)
+EMAIL_OUTBOX_BATCH_SIZE = env.get("email_outbox_batch_size", 100)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.get("email_outbox_max_attempts", 5)
+# Seconds before the first retry, doubled for each later attempt
+EMAIL_OUTBOX_RETRY_DELAY = env.get("email_outbox_retry_delay", 60)
+# Maximum emails sent per second, 0 for no limit
+EMAIL_OUTBOX_RATE_LIMIT = env.get("email_outbox_rate_limit", 0)
+# Seconds a worker has to send a claimed email, on top of the time the rate
+# limit allows for its batch. Emails left unsent by a worker that died are
+# retried after it.
+EMAIL_OUTBOX_CLAIM_TIMEOUT = env.get("email_outbox_claim_timeout", 300)
 
 ANYMAIL = {
     "AMAZON_SES_CLIENT_PARAMS": {
@@ -350,6 +366,13 @@ AWS_LOCATION = env.get(
 
 VIRUS_CHECKING_ENABLED = env.get("VIRUS_CHECKING_ENABLED", False)
 
+# Redirect file downloads to pre-signed S3 urls instead of streaming
+# them through the app
+FILE_DOWNLOAD_PRESIGNED_URLS = env.get("file_download_presigned_urls", False)
+FILE_DOWNLOAD_PRESIGNED_URL_EXPIRY = env.get(
+    "file_download_presigned_url_expiry", 60
+)
+
 #
 #       END OF - File Uploads
 
@@ -427,6 +450,12 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = (
 # The setting `LOGIN_FAILURE_LIMIT` allows to enable a number of allowed login attempts.
 # If the settings is not set or set to 0, the feature is disabled.
 LOGIN_FAILURE_LIMIT = env.get("login_failure_limit", 5)
+# The login log entries are written in batches of this size, or once the
+# oldest buffered entry is LOGIN_LOG_FLUSH_INTERVAL seconds old
+LOGIN_LOG_BATCH_SIZE = env.get("login_log_batch_size", 1)
+LOGIN_LOG_FLUSH_INTERVAL = env.get("login_log_flush_interval", 5)
+# Days of login log entries kept by the rollup_login_logs command
+LOGIN_LOG_RETENTION_DAYS = env.get("login_log_retention_days", 365)
 
 # APPLICATION SPECIFIC SETTINGS
 AUTH_PROFILE_MODULE = "groups.User"
@@ -438,6 +467,9 @@ ALLOWED_HOSTS = env.getlist("allowed_hosts", ["localhost"])
 USE_X_FORWARDED_HOST = env.get("use_x_forwarded_host", True)
 
 CACHE_DEFAULT_TIMEOUT = 3600
+# How long (in seconds) the permission snapshot of a user is shared between
+# requests. With 0 it is loaded once per request.
+USER_PERMISSIONS_CACHE_TIMEOUT = env.get("user_permissions_cache_timeout", 0)
 
 if env.get("memcache", ""):
     CACHES = {
@@ -620,6 +652,9 @@ BREACHED_PASSWORD_DETECTION_ENABLED = env.get(
     "breached_password_detection_enabled", False
 )
 BREACHED_PASSWORD_ENDPOINT = env.get("breached_password_endpoint", "")
+# Local index of breached password hashes used instead of the endpoint,
+# see the build_breached_password_index command
+BREACHED_PASSWORD_INDEX = env.get("breached_password_index", "")
 MAX_BREACHED_PASSWORD_THRESHOLD = int(
     env.get("max_breached_password_threshold", "") or 0
 )
@@ -760,6 +795,11 @@ SCHEMA_MODULE = "report.schema"
 SCHEMA_METHOD_PATIENT_FIELDS = "get_patient_fields"
 REPORT_CONFIG_MODULE = "report.report_configuration"
 REPORT_CONFIG_METHOD_GET = "get_configuration"
+# Generate report downloads with the run_report_jobs worker rather than
+# within the request
+REPORTS_RUN_IN_BACKGROUND = env.get("reports_run_in_background", False)
+# How long (in seconds) generated reports are reused and kept for
+REPORT_JOB_MAX_AGE = env.get("report_job_max_age", 24 * 60 * 60)
 
 # Use the setting below in registries derived from trrf to setup extra UI widgets
 # it shoud be a string indicating the module where registry specific widgets are defined
@@ -0,0 +1,91 @@
+from django.test import SimpleTestCase, TestCase
+from registry.groups.models import WorkingGroup
+from registry.patients.models import ParentGuardian, Patient
+
+from rdrf.helpers.conditions import (
+    ConditionError,
+    compile_condition,
+    evaluate_condition,
+)
+from rdrf.helpers.patient_dto_scope import patient_dto_scope
+from rdrf.models.definition.models import ConsentSection, Registry
+
+
+class ConditionTest(SimpleTestCase):
+    def test_evaluate_condition(self):
+        self.assertTrue(evaluate_condition("x > 6 and x < 10", x=7))
+        self.assertFalse(evaluate_condition("'WA' in groups", groups=["NSW"]))
+        self.assertTrue(
+            evaluate_condition("email.endswith('.org')", email="a@b.org")
+        )
+
+    def test_compiled_once(self):
+        compiled = compile_condition("x == 1", ("x",))
+        self.assertIs(compile_condition("x == 1", ("x",)), compiled)
+
+    def test_invalid_conditions(self):
+        for condition in [
+            "x ==",
+            "y == 1",
+            "open('/etc/passwd')",
+            "x.__class__",
+            "[y for y in x]",
+            "(lambda: x)()",
+        ]:
+            with self.subTest(condition=condition):
+                with self.assertRaises(ConditionError):
+                    evaluate_condition(condition, x=1)
+
+
+class PatientConditionTest(TestCase):
+    def setUp(self):
+        self.registry = Registry.objects.create(code="reg")
+        self.working_group = WorkingGroup.objects.create(
+            name="WA", registry=self.registry
+        )
+        self.patients = [
+            Patient.objects.create(consent=True, date_of_birth="1999-12-12")
+            for __ in range(3)
+        ]
+        for patient in self.patients:
+            patient.rdrf_registry.set([self.registry])
+        self.patients[0].working_groups.add(self.working_group)
+
+    def test_dto_changes(self):
+        patient = self.patients[1]
+        self.assertEqual(patient.as_dto().working_groups, [])
+        patient.working_groups.add(self.working_group)
+        self.assertEqual(patient.as_dto().working_groups, ["WA"])
+        patient.given_names = "Changed"
+        self.assertEqual(patient.as_dto().given_names, "Changed")
+        self.assertFalse(patient.as_dto().has_guardian)
+        ParentGuardian.objects.create(
+            first_name="Parent", last_name="Guardian"
+        ).patient.add(patient)
+        self.assertTrue(patient.as_dto().has_guardian)
+
+    def test_dto_built_once_per_scope(self):
+        with patient_dto_scope():
+            patient = Patient.objects.get(pk=self.patients[0].pk)
+            dto = patient.as_dto()
+            # Also for other instances of the patient
+            other_instance = Patient.objects.get(pk=patient.pk)
+            with self.assertNumQueries(0):
+                self.assertEqual(dto, other_instance.as_dto())
+
+            # Changes to the relations the DTO depends on are picked up
+            self.assertFalse(dto.has_guardian)
+            ParentGuardian.objects.create(
+                first_name="Parent", last_name="Guardian"
+            ).patient.add(patient)
+            self.assertTrue(patient.as_dto().has_guardian)
+
+    def test_consent_section_applicability(self):
+        section = ConsentSection.objects.create(
+            registry=self.registry,
+            code="adult",
+            section_label="Adult",
+            applicability_condition="not self_patient and 'WA' in patient.working_groups",
+        )
+        self.assertTrue(section.applicable_to(self.patients[0]))
+        self.assertFalse(section.applicable_to(self.patients[1]))
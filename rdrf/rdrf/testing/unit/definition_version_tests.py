@@ -0,0 +1,27 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from rdrf.helpers.definition_version import (
+    DEFINITION_VERSION_CACHE_KEY,
+    bump_definition_version,
+    definition_version_scope,
+    get_definition_version,
+)
+
+
+class DefinitionVersionTest(TestCase):
+    def test_version_read_once_per_scope(self):
+        version = get_definition_version()
+        with definition_version_scope():
+            self.assertEqual(version, get_definition_version())
+            # Changes by other processes are seen in the next scope
+            cache.set(DEFINITION_VERSION_CACHE_KEY, "other", None)
+            self.assertEqual(version, get_definition_version())
+
+            # but the changes of this one straight away
+            bump_definition_version()
+            bumped_version = get_definition_version()
+            self.assertNotIn(bumped_version, [version, "other"])
+
+        cache.set(DEFINITION_VERSION_CACHE_KEY, "other", None)
+        self.assertEqual("other", get_definition_version())
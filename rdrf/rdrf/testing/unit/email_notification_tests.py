@@ -0,0 +1,71 @@
+from django.core import mail
+from django.test import TestCase
+from registry.groups.models import CustomUser
+
+from rdrf.events.events import EventType
+from rdrf.models.definition.models import (
+    EmailNotification,
+    EmailPreference,
+    EmailTemplate,
+    Registry,
+)
+from rdrf.services.io.notifications import email_notification
+from rdrf.services.io.notifications.email_notification import RdrfEmail
+
+
+class RdrfEmailTest(TestCase):
+    def setUp(self):
+        self.registry = Registry.objects.create(code="test")
+        self.notification = EmailNotification.objects.create(
+            registry=self.registry,
+            description=EventType.REMINDER,
+            subscribable=True,
+        )
+        self.notification.email_templates.set(
+            [
+                EmailTemplate.objects.create(
+                    language=language,
+                    description="Reminder",
+                    subject="%s {{ name }}" % subject,
+                    body="%s {{ name }}" % subject,
+                )
+                for language, subject in [("en", "Hello"), ("fr", "Bonjour")]
+            ]
+        )
+
+    def _make_user(self, username, preferred_language):
+        return CustomUser.objects.create(
+            username=username,
+            email="%s@example.com" % username,
+            preferred_language=preferred_language,
+        )
+
+    def test_send_per_language(self):
+        self._make_user("english", "en")
+        self._make_user("french", "fr")
+        unsubscribed = self._make_user("unsubscribed", "en")
+        EmailPreference.objects.create(user=unsubscribed, unsubscribe_all=True)
+
+        email_notification._compile_email_template.cache_clear()
+        email = RdrfEmail(email_notification=self.notification)
+        email.recipient_dict = {
+            "english@example.com": "en",
+            "french@example.com": "en",
+            "unsubscribed@example.com": "en",
+            "guest@example.com": "fr",
+        }
+        email.template_data = {"name": "Pat"}
+        self.assertTrue(email.send())
+
+        subjects = {message.to[0]: message.subject for message in mail.outbox}
+        self.assertEqual(
+            subjects,
+            {
+                "english@example.com": "Hello Pat",
+                "french@example.com": "Bonjour Pat",
+                "guest@example.com": "Bonjour Pat",
+            },
+        )
+        self.assertEqual(
+            email_notification._compile_email_template.cache_info().misses, 2
+        )
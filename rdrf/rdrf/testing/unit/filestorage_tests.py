@@ -0,0 +1,139 @@
+import tempfile
+from datetime import date
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase, override_settings
+from registry.patients.models import Patient
+
+from rdrf.db import filestorage
+from rdrf.models.definition.models import CDEFile
+from rdrf.testing.unit.tests import RDRFTestCase
+from rdrf.views.form_view import FileUploadView
+
+
+class FakeScanningStorage(FileSystemStorage):
+    """
+    Local stand-in for CustomS3Storage, tagging files like the S3 virus
+    scanner does.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tags = {}
+        self.tag_requests = 0
+
+    def get_tags(self, name):
+        self.tag_requests += 1
+        if not self.exists(name):
+            return None
+        return self.tags.get(name, {})
+
+
+class FileRangeTestCase(TestCase):
+    def _get_range(self, header, size=100):
+        request = RequestFactory().get("/", HTTP_RANGE=header)
+        return FileUploadView._get_range(request, size)
+
+    def test_ranges(self):
+        self.assertIsNone(self._get_range(""))
+        self.assertIsNone(self._get_range("items=0-10"))
+        self.assertEqual(self._get_range("bytes=0-9"), (0, 9))
+        self.assertEqual(self._get_range("bytes=90-"), (90, 99))
+        self.assertEqual(self._get_range("bytes=90-200"), (90, 99))
+        self.assertEqual(self._get_range("bytes=-10"), (90, 99))
+        with self.assertRaises(ValueError):
+            self._get_range("bytes=100-")
+
+    def test_iter_file_range(self):
+        file_obj = BytesIO(b"0123456789")
+        chunks = list(filestorage.iter_file_range(file_obj, 2, 5, chunk_size=2))
+        self.assertEqual(chunks, [b"23", b"45", b"6"])
+        self.assertTrue(file_obj.closed)
+
+
+class StoreFileTestCase(RDRFTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = Patient.objects.create(
+            consent=True, date_of_birth=date(2000, 1, 1)
+        )
+        self.media_root = tempfile.TemporaryDirectory()
+        self.storage = FakeScanningStorage(location=self.media_root.name)
+        storage_patch = mock.patch.object(
+            CDEFile._meta.get_field("item"), "storage", self.storage
+        )
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        self.addCleanup(self.media_root.cleanup)
+
+    def _store(self, content, name="scan.txt"):
+        upload = filestorage.store_file(
+            "fh",
+            None,
+            self.patient,
+            "CDEScan",
+            SimpleUploadedFile(name, content),
+            "form",
+            "section",
+        )
+        return CDEFile.objects.get(pk=upload["django_file_id"])
+
+    def test_identical_uploads_share_content(self):
+        first = self._store(b"some scan")
+        second = self._store(b"some scan", name="copy.txt")
+        other = self._store(b"another scan")
+
+        self.assertEqual(first.size, len(b"some scan"))
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(first.item.name, second.item.name)
+        self.assertEqual(second.original_filename, "copy.txt")
+        self.assertNotEqual(first.item.name, other.item.name)
+
+        first.delete()
+        self.assertTrue(self.storage.exists(second.item.name))
+        second.delete()
+        self.assertFalse(self.storage.exists(second.item.name))
+
+    @override_settings(VIRUS_CHECKING_ENABLED=True)
+    def test_scan_status(self):
+        cde_file = self._store(b"some scan")
+        self.assertEqual(cde_file.scan_status, "")
+        # Rendering uses the saved status only
+        self.assertEqual(
+            filestorage.get_scan_status(cde_file),
+            filestorage.VirusScanStatus.SCANNING,
+        )
+        self.assertEqual(self.storage.tag_requests, 0)
+
+        self.storage.tags[cde_file.item.name] = {"av-status": "CLEAN"}
+        self.assertEqual(filestorage.update_scan_statuses(batch_size=1), 1)
+        self.assertEqual(self.storage.tag_requests, 1)
+        cde_file.refresh_from_db()
+        self.assertEqual(
+            cde_file.scan_status, filestorage.VirusScanStatus.CLEAN
+        )
+
+        # Identical uploads share the finished scan
+        duplicate = self._store(b"some scan")
+        self.assertEqual(
+            filestorage.get_scan_status(duplicate, refresh=True),
+            filestorage.VirusScanStatus.CLEAN,
+        )
+        self.assertEqual(filestorage.update_scan_statuses(), 0)
+        self.assertEqual(self.storage.tag_requests, 1)
+
+    @override_settings(VIRUS_CHECKING_ENABLED=True)
+    def test_refresh_scan_status(self):
+        cde_file = self._store(b"some scan")
+        self.storage.tags[cde_file.item.name] = {"av-status": "INFECTED"}
+        self.assertEqual(
+            filestorage.get_scan_status(cde_file, refresh=True),
+            filestorage.VirusScanStatus.INFECTED,
+        )
+        self.assertEqual(
+            CDEFile.objects.get(pk=cde_file.pk).scan_status,
+            filestorage.VirusScanStatus.INFECTED,
+        )
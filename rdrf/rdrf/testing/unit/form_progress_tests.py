@@ -1,6 +1,17 @@
+import json
 import logging
-
-from rdrf.forms.progress.form_progress import FormProgressCalculator
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+
+from rdrf.forms.dsl.code_evaluator import CodeEvaluator, get_compiled_rules
+from rdrf.forms.progress.form_progress import (
+    FormProgress,
+    FormProgressCalculator,
+)
 from rdrf.models.definition.models import ClinicalData, CommonDataElement
 from rdrf.views.form_view import FormView
 
@@ -183,3 +194,173 @@ class FormProgressTestCase(FormTestCase):
         self._set_form_data(self.new_form, ff)
         result = self._compute_progress(self.new_form, progress_cdes_map)
         self.assertEqual(result["progress"]["percentage"], 100)
+
+    def test_compiled_rules(self):
+        self.new_form.conditional_rendering_rules = """
+        DM1Fatigue visible if CDEAge >= 10
+        """
+        self.new_form.save()
+
+        ff = FormFiller(self.new_form)
+        ff.sectionA.CDEAge = 5
+        self._set_form_data(self.new_form, ff)
+        dynamic_data = self._get_clinical_data()
+
+        compiled_rules = get_compiled_rules(self.new_form)
+        self.assertIs(compiled_rules, get_compiled_rules(self.new_form))
+        self.assertEqual(
+            {"DM1Fatigue"}, compiled_rules.hidden_cdes(dynamic_data)
+        )
+        self.assertEqual(
+            CodeEvaluator(self.new_form, dynamic_data).determine_hidden_cdes(),
+            compiled_rules.hidden_cdes(dynamic_data),
+        )
+
+        # Saving the form recompiles its rules
+        self.new_form.conditional_rendering_rules = """
+        DM1Fatigue hidden if CDEAge >= 10
+        """
+        self.new_form.save()
+        compiled_rules = get_compiled_rules(self.new_form)
+        self.assertEqual(set(), compiled_rules.hidden_cdes(dynamic_data))
+
+    def test_form_progress_recalculates_changed_forms(self):
+        cde_name = CommonDataElement.objects.get(code="CDEName")
+        cde_fatigue = CommonDataElement.objects.get(code="DM1Fatigue")
+        for form in [self.new_form, self.other_form]:
+            form.complete_form_cdes.add(cde_name)
+            form.complete_form_cdes.add(cde_fatigue)
+
+        ff = FormFiller(self.other_form)
+        ff.sectionA.CDEName = "Fred"
+        self._set_form_data(self.other_form, ff)
+
+        ff = FormFiller(self.new_form)
+        ff.sectionA.CDEName = "Fred"
+        self._set_form_data(self.new_form, ff)
+
+        form_progress = FormProgress(self.registry)
+        progress = form_progress.progress_collection.find(
+            self.patient, context_id=self.default_context.id
+        ).first()
+        self.assertEqual(
+            50, progress.data["NewForm_form_progress"]["percentage"]
+        )
+        self.assertEqual(
+            50, progress.data["OtherForm_form_progress"]["percentage"]
+        )
+
+        # Progress of forms which haven't changed is not recalculated
+        progress.data["OtherForm_form_progress"] = {
+            "required": 2,
+            "filled": 2,
+            "percentage": 100,
+        }
+        # Currency is always recalculated from the form timestamp
+        progress.data["OtherForm_form_current"] = False
+        progress.save()
+
+        ff = FormFiller(self.new_form)
+        ff.sectionA.CDEName = "Fred"
+        ff.sectionD.DM1Fatigue = "DM1FatigueNo"
+        self._set_form_data(self.new_form, ff)
+
+        form_progress.reset()
+        self.assertEqual(
+            100,
+            form_progress.get_form_progress(
+                self.new_form, self.patient, self.default_context
+            ),
+        )
+        self.assertEqual(
+            100,
+            form_progress.get_form_progress(
+                self.other_form, self.patient, self.default_context
+            ),
+        )
+        self.assertTrue(
+            form_progress.get_form_currency(
+                self.other_form, self.patient, self.default_context
+            )
+        )
+
+        # Without changed cdes, every form is recalculated
+        form_progress.save_for_patient(self.patient, self.default_context)
+        form_progress.reset()
+        self.assertEqual(
+            50,
+            form_progress.get_form_progress(
+                self.other_form, self.patient, self.default_context
+            ),
+        )
+
+    def test_save_progress_doesnt_reuse_previous_progress(self):
+        form_progress = FormProgress(self.registry)
+        form_progress.progress_collection.delete()
+        form_progress.progress_data = {
+            "NewForm_form_progress": {
+                "required": 2,
+                "filled": 2,
+                "percentage": 100,
+            }
+        }
+        # Nothing is calculated without progress metadata
+        with patch.object(
+            form_progress, "_get_progress_metadata", return_value={}
+        ):
+            form_progress.save_progress(
+                self.patient, {"forms": []}, self.default_context
+            )
+        progress = form_progress.progress_collection.find(
+            self.patient, context_id=self.default_context.id
+        ).first()
+        self.assertNotIn("NewForm_form_progress", progress.data)
+
+    def test_update_form_progress_command(self):
+        cde_name = CommonDataElement.objects.get(code="CDEName")
+        cde_fatigue = CommonDataElement.objects.get(code="DM1Fatigue")
+        self.new_form.complete_form_cdes.add(cde_name)
+        self.new_form.complete_form_cdes.add(cde_fatigue)
+
+        ff = FormFiller(self.new_form)
+        ff.sectionA.CDEName = "Fred"
+        self._set_form_data(self.new_form, ff)
+
+        progress_collection = ClinicalData.objects.collection(
+            self.registry.code, "progress"
+        )
+        progress_collection.delete()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint = os.path.join(tmpdir, "checkpoint.json")
+            args = [
+                "update_form_progress",
+                self.registry.code,
+                "--workers",
+                "1",
+                "--checkpoint",
+                checkpoint,
+                "--resume",
+            ]
+            call_command(*args, stdout=StringIO())
+
+            form_progress = FormProgress(self.registry)
+            self.assertEqual(
+                50,
+                form_progress.get_form_progress(
+                    self.new_form, self.patient, self.default_context
+                ),
+            )
+            with open(checkpoint) as f:
+                self.assertEqual(
+                    {
+                        "registry_code": self.registry.code,
+                        "last_context_id": self.default_context.id,
+                    },
+                    json.load(f),
+                )
+
+            # Contexts recalculated before the checkpoint are skipped
+            progress_collection.delete()
+            call_command(*args, stdout=StringIO())
+            self.assertFalse(progress_collection.exists())
@@ -571,6 +571,32 @@ class LongitudinalFollowupConditionTest(
         self.create_entry("consents.get('reg.test.test3') == True")
         self.get_emails(0)
 
+    def test_batches(self):
+        condition = "consents.get('reg.test.test1') == True"
+        self.create_entry(condition)
+        patient = Patient.objects.create(
+            consent=True, date_of_birth=datetime(1971, 1, 1), sex="3"
+        )
+        patient.rdrf_registry.add(self.registry)
+        LongitudinalFollowupEntry.objects.create(
+            longitudinal_followup=LongitudinalFollowup.objects.get(
+                condition=condition
+            ),
+            patient=patient,
+            state=LongitudinalFollowupQueueState.PENDING,
+            send_at=self.now - timedelta(days=1),
+        )
+
+        send_longitudinal_followups(self.now, batch_size=1)
+        # The second patient hasn't given the consent
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            1,
+            LongitudinalFollowupEntry.objects.filter(
+                state=LongitudinalFollowupQueueState.SENT
+            ).count(),
+        )
+
 
 class LongitudinalFollowupDebounceTest(
     TestCase, LongitudinalFollowupSetupMixin
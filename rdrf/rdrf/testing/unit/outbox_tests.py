@@ -0,0 +1,99 @@
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rdrf.models.definition.models import OutboundEmail, OutboundEmailState
+from rdrf.services.io.notifications.outbox import send_email, send_queued_emails
+
+
+class FailingEmailBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError("Connection refused")
+
+
+class WorkerKilled(BaseException):
+    pass
+
+
+class DyingEmailBackend(EmailBackend):
+    # Dies, like a timed out worker, after sending one email
+    def send_messages(self, messages):
+        if mail.outbox:
+            raise WorkerKilled()
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_OUTBOX_ENABLED=True)
+class OutboxTest(TestCase):
+    def _queue(self, count=1):
+        for i in range(count):
+            send_email(
+                "Subject %s" % i,
+                "Body",
+                "no-reply@example.com",
+                ["user%s@example.com" % i],
+                html_body="<p>Body</p>",
+            )
+
+    @override_settings(EMAIL_OUTBOX_ENABLED=False)
+    def test_send_without_outbox(self):
+        self._queue()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_send_queued_emails(self):
+        self._queue(count=3)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(send_queued_emails(batch_size=2), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ["user0@example.com"])
+        self.assertEqual(
+            mail.outbox[0].alternatives, [("<p>Body</p>", "text/html")]
+        )
+        self.assertFalse(
+            OutboundEmail.objects.exclude(
+                state=OutboundEmailState.SENT
+            ).exists()
+        )
+        # Nothing is sent twice
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_retries(self):
+        self._queue()
+        connection = FailingEmailBackend()
+        self.assertEqual(send_queued_emails(connection=connection), (0, 1))
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.state, OutboundEmailState.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("Connection refused", email.last_error)
+        self.assertGreater(email.send_at, timezone.now())
+
+        # Not due yet
+        self.assertEqual(send_queued_emails(connection=connection), (0, 0))
+
+        OutboundEmail.objects.update(send_at=timezone.now())
+        self.assertEqual(send_queued_emails(connection=connection), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.state, OutboundEmailState.FAILED)
+        self.assertEqual(email.attempts, 2)
+
+    def test_sends_recorded_when_worker_dies(self):
+        self._queue(count=3)
+        with self.assertRaises(WorkerKilled):
+            send_queued_emails(connection=DyingEmailBackend())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            OutboundEmail.objects.filter(state=OutboundEmailState.SENT).count(),
+            1,
+        )
+        # The claimed emails aren't sent again until the claim expires
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+        OutboundEmail.objects.filter(state=OutboundEmailState.PENDING).update(
+            send_at=timezone.now()
+        )
+        self.assertEqual(send_queued_emails(), (2, 0))
+        self.assertEqual(len(mail.outbox), 3)
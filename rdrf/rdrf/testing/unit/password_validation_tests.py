@@ -1,3 +1,5 @@
+import hashlib
+import tempfile
 from unittest import TestCase, mock
 from unittest.mock import Mock
 
@@ -7,6 +9,7 @@ from django.contrib.auth.password_validation import (
     UserAttributeSimilarityValidator,
 )
 from django.forms import ValidationError
+from django.test import override_settings
 from registry.groups.models import CustomUser
 
 from rdrf.auth import password_validation
@@ -21,6 +24,7 @@ from rdrf.auth.password_validation import (
     HasUppercaseLetterValidator,
 )
 from rdrf.auth.pwned_passwords import pwned_passwords
+from rdrf.auth.pwned_passwords.local_index import open_index, write_index
 
 
 class PasswordValidationTests(TestCase):
@@ -211,3 +215,44 @@ class PasswordValidationTests(TestCase):
         with self.assertRaises(ValidationError) as e:
             validator.validate("password123")
         self.assertEqual(e.exception.message, "This password is too common.")
+
+
+class BreachedPasswordLookupTests(TestCase):
+    def _sha1(self, password):
+        return hashlib.sha1(password.encode("utf8")).hexdigest().upper()
+
+    def test_local_index(self):
+        dump = sorted(
+            [
+                "%s:%s" % (self._sha1("Password12!"), 52632),
+                "%s:%s" % (self._sha1("password123"), 1),
+            ]
+        )
+        with tempfile.NamedTemporaryFile() as index_file:
+            self.assertEqual(write_index(dump, index_file, min_count=1), 1)
+            index_file.flush()
+            open_index.cache_clear()
+            with override_settings(BREACHED_PASSWORD_INDEX=index_file.name):
+                self.assertEqual(
+                    pwned_passwords.check_breaches("Password12!"), 52632
+                )
+                # Left out by min_count
+                self.assertEqual(
+                    pwned_passwords.check_breaches("password123"), 0
+                )
+                self.assertEqual(pwned_passwords.check_breaches("unknown"), 0)
+            open_index.cache_clear()
+
+    @override_settings(BREACHED_PASSWORD_INDEX="")
+    def test_remote_ranges_are_cached(self):
+        sha1 = self._sha1("Password12!")
+        pwned_passwords._cached_range.cache_clear()
+        with mock.patch.object(
+            pwned_passwords.PwnedPasswordsApi,
+            "range",
+            return_value=("%s:12\r\n" % sha1[5:]).encode(),
+        ) as api_range:
+            self.assertEqual(pwned_passwords.check_breaches("Password12!"), 12)
+            self.assertEqual(pwned_passwords.check_breaches("Password12!"), 12)
+            api_range.assert_called_once_with(sha1[:5].lower())
+        pwned_passwords._cached_range.cache_clear()
@@ -1,7 +1,13 @@
+from datetime import date, datetime
+
+from registry.groups.models import WorkingGroup
+from registry.patients.models import Patient, PatientListing
+
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.models.definition.models import Registry
 from rdrf.patients.patient_columns import ColumnFullName
 from rdrf.patients.patient_list_configuration import PatientListConfiguration
+from rdrf.patients.patient_listing import keyset_filter, listing_ordering
 from rdrf.testing.unit.tests import RDRFTestCase
 
 
@@ -119,3 +125,103 @@ class PatientListTests(RDRFTestCase):
 
         self.assertEqual(len(base_patient_list.get_columns().keys()), 1)
         self.assertEqual(len(extended_patient_list.get_columns().keys()), 2)
+
+
+class PatientListingTests(RDRFTestCase):
+    def setUp(self):
+        self.registry = Registry.objects.get(code="reg1")
+
+    def testListingFollowsPatientChanges(self):
+        patient = Patient.objects.create(
+            consent=True,
+            family_name="Smith",
+            given_names="John",
+            date_of_birth=date(1980, 1, 1),
+            sex="1",
+        )
+        patient.rdrf_registry.add(self.registry)
+        listing = PatientListing.objects.get(
+            registry=self.registry, patient=patient
+        )
+        self.assertEqual("Smith", listing.family_name)
+
+        working_group = WorkingGroup.objects.create(
+            name="WG1", registry=self.registry
+        )
+        patient.working_groups.add(working_group)
+        patient.family_name = "Jones"
+        patient.save()
+        listing.refresh_from_db()
+        self.assertEqual("Jones", listing.family_name)
+        self.assertEqual("WG1", listing.working_group_names)
+
+        # Clinical data saves only touch the last updated timestamp
+        version = PatientListing.objects.get_version(self.registry.code)
+        patient.mark_changed_timestamp()
+        listing.refresh_from_db()
+        self.assertEqual(
+            Patient.objects.get(pk=patient.pk).last_updated_overall_at,
+            listing.last_updated_overall_at,
+        )
+        self.assertNotEqual(
+            version, PatientListing.objects.get_version(self.registry.code)
+        )
+
+        patient.rdrf_registry.remove(self.registry)
+        self.assertFalse(
+            PatientListing.objects.filter(patient=patient).exists()
+        )
+
+    def testListingOrdering(self):
+        self.assertEqual(
+            ["-family_name", "given_names", "patient_id"],
+            listing_ordering(["-family_name", "given_names"]),
+        )
+        self.assertEqual(
+            ["working_group_names", "patient_id"],
+            listing_ordering(["working_groups__name", "id"]),
+        )
+
+    def testKeysetFilter(self):
+        patients = []
+        for i, last_updated in enumerate(
+            [datetime(2020, 1, 1), datetime(2021, 1, 1), None]
+        ):
+            patient = Patient.objects.create(
+                consent=True,
+                family_name=f"Patient{i}",
+                given_names="Test",
+                date_of_birth=date(1980, 1, 1),
+                sex="1",
+                last_updated_overall_at=last_updated,
+            )
+            patient.rdrf_registry.add(self.registry)
+            patients.append(patient)
+
+        listing = PatientListing.objects.filter(
+            registry=self.registry, patient__in=patients
+        )
+
+        def ids_after(ordering, patient):
+            row = listing.get(patient=patient)
+            cursor = {
+                field.lstrip("-"): getattr(row, field.lstrip("-"))
+                for field in ordering
+            }
+            return list(
+                listing.filter(keyset_filter(ordering, cursor))
+                .order_by(*ordering)
+                .values_list("patient_id", flat=True)
+            )
+
+        ordering = ["last_updated_overall_at", "patient_id"]
+        self.assertEqual(
+            [patients[1].id, patients[2].id], ids_after(ordering, patients[0])
+        )
+        self.assertEqual([], ids_after(ordering, patients[2]))
+
+        ordering = ["-last_updated_overall_at", "patient_id"]
+        self.assertEqual(
+            [patients[1].id, patients[0].id], ids_after(ordering, patients[2])
+        )
+        self.assertEqual([], ids_after(ordering, patients[0]))
@@ -2,6 +2,7 @@ from django.test import override_settings
 from registry.groups import GROUPS as RDRF_GROUPS
 
 from rdrf.forms.navigation.quick_links import QuickLinks, RegularLinks
+from rdrf.models.definition.models import Registry
 
 from .tests import RDRFTestCase
 
@@ -47,3 +48,29 @@ class NormalQuickLinksTests(ExtraAssertionsMixin, RDRFTestCase):
             RegularLinks.REGISTRY_DESIGN, ql.admin_page_links()
         )
         self.assertContainsAll(RegularLinks.EMAIL, ql.admin_page_links())
+
+    def test_cached_menus(self):
+        registry = Registry.objects.get(code="fh")
+        ql = QuickLinks.for_registries([registry])
+        self.assertIs(QuickLinks.for_registries([registry]), ql)
+        self.assertIsNot(QuickLinks.for_registries([]), ql)
+
+        menu = ql.menu_links([RDRF_GROUPS.WORKING_GROUP_CURATOR])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                ql.menu_links([RDRF_GROUPS.WORKING_GROUP_CURATOR]), menu
+            )
+
+        registry.name = "Renamed registry"
+        registry.save()
+        rebuilt = QuickLinks.for_registries([registry])
+        self.assertIsNot(rebuilt, ql)
+        self.assertIn(
+            "Patient List (Renamed registry)",
+            [
+                link.text
+                for link in rebuilt.menu_links(
+                    [RDRF_GROUPS.WORKING_GROUP_CURATOR]
+                )
+            ],
+        )
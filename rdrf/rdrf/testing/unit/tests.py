@@ -10,14 +10,20 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
 from django.core import management
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
+from django.db import connections
 from django.forms.models import model_to_dict
 from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from registry.groups import GROUPS as RDRF_GROUPS
 from registry.groups.models import CustomUser, WorkingGroup
 from registry.patients.models import AddressType, Patient, PatientAddress, State
 
+from rdrf.db.generalised_field_expressions import FieldExpressionWriter
+from rdrf.forms.dynamic.dynamic_forms import create_form_class_for_section
+from rdrf.helpers.registry_definition import get_registry_definition
 from rdrf.helpers.transform_cd_dict import (
     get_cd_form,
     get_section,
@@ -28,13 +34,18 @@ from rdrf.models.definition.models import (
     CDEPermittedValue,
     CDEPermittedValueGroup,
     ClinicalData,
+    ClinicalDataValue,
     CommonDataElement,
+    ContextFormGroup,
+    DataDefinitions,
     EmailNotification,
     EmailNotificationHistory,
     EmailTemplate,
+    RDRFContext,
     Registry,
     RegistryForm,
     Section,
+    iter_cde_values,
 )
 from rdrf.services.io.defs.exporter import Exporter, ExportType
 from rdrf.services.io.defs.importer import Importer, ImportState
@@ -546,6 +557,47 @@ class ImporterTestCase(TestCase):
         importer.create_registry()
         assert importer.state == ImportState.SOUND
 
+    def test_reimport_applies_differences(self):
+        importer = Importer()
+        importer.load_yaml(self._get_yaml_file())
+        importer.create_registry()
+
+        importer = Importer()
+        importer.load_yaml(self._get_yaml_file())
+        pvg_map = next(
+            pvg_map
+            for pvg_map in importer.data["pvgs"]
+            if len(pvg_map["values"]) > 1
+        )
+        pvg_map["values"][0]["value"] = "Changed value"
+        removed_value = pvg_map["values"].pop()
+        cde_map = importer.data["cdes"][0]
+        CommonDataElement.objects.filter(code=cde_map["code"]).update(
+            name="Renamed"
+        )
+        importer.create_registry()
+
+        self.assertEqual(importer.state, ImportState.SOUND)
+        self.assertEqual(
+            CDEPermittedValue.objects.get(
+                pv_group__code=pvg_map["code"],
+                code=pvg_map["values"][0]["code"],
+            ).value,
+            "Changed value",
+        )
+        self.assertFalse(
+            CDEPermittedValue.objects.filter(
+                pv_group__code=pvg_map["code"], code=removed_value["code"]
+            ).exists()
+        )
+        self.assertEqual(
+            CommonDataElement.objects.get(code=cde_map["code"]).name,
+            cde_map["name"],
+        )
+        phases = [phase for phase, __ in importer.timings]
+        for phase in ["pvgs", "cdes", "form sections", "registry"]:
+            self.assertIn(phase, phases)
+
 
 class ImporterUsingExporterFileTest(RDRFTestCase):
     def setUp(self):
@@ -866,6 +918,253 @@ class FormTestCase(RDRFTestCase):
             == 80.08
         )
 
+    def test_form_permission_queries(self):
+        ff = FormFiller(self.simple_form)
+        ff.sectionA.CDEName = "Fred"
+        request = self._create_request(self.simple_form, ff.data)
+        request.session = {}
+        view = FormView()
+        view.request = request
+        with CaptureQueriesContext(connections["default"]) as queries:
+            view.post(
+                request,
+                self.registry.code,
+                self.simple_form.pk,
+                self.patient.pk,
+                self.default_context.pk,
+            )
+
+        sql = [query["sql"] for query in queries.captured_queries]
+        # The user's groups are loaded once rather than queried per check
+        self.assertEqual(
+            [
+                statement
+                for statement in sql
+                if 'UPPER("auth_group"."name"' in statement
+            ],
+            [],
+        )
+        self.assertEqual(
+            len(
+                [
+                    statement
+                    for statement in sql
+                    if statement.startswith(
+                        'SELECT "auth_group"."id", "auth_group"."name"'
+                    )
+                ]
+            ),
+            1,
+        )
+
+    def test_field_expression_writer(self):
+        other_patient = self.create_patient()
+        writer = FieldExpressionWriter(self.registry)
+        errors = writer.write(
+            [
+                (self.patient.pk, "simple/sectionA/CDEName", "Fred"),
+                (self.patient.pk, "simple/sectionB/CDEHeight", 1.8),
+                (self.patient.pk, "given_names", "Frederick"),
+                (other_patient.pk, "simple/sectionA/CDEName", "Bob"),
+                (other_patient.pk, "simple/bad/CDEName", "Bob"),
+                (0, "simple/sectionA/CDEName", "Nobody"),
+            ]
+        )
+
+        self.assertEqual(
+            [(error.row, error.message) for error in errors],
+            [(4, "Parse error"), (5, "Patient not found")],
+        )
+        # The bad expression was parsed only once
+        self.assertEqual(len(writer._expressions), 4)
+
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.given_names, "Frederick")
+        records = ClinicalData.objects.collection(
+            self.registry.code, "cdes"
+        ).filter(django_model="Patient")
+        record = records.get(django_id=self.patient.pk)
+        self.assertEqual(
+            record.cde_val("simple", self.sectionA.code, "CDEName"), "Fred"
+        )
+        self.assertEqual(
+            record.cde_val("simple", self.sectionB.code, "CDEHeight"), 1.8
+        )
+        record = records.get(django_id=other_patient.pk)
+        self.assertEqual(
+            record.cde_val("simple", self.sectionA.code, "CDEName"), "Bob"
+        )
+
+        errors = writer.write(
+            [(self.patient.pk, "simple/sectionA/CDEName", "George")],
+            dry_run=True,
+        )
+        self.assertEqual(errors, [])
+        record = records.get(django_id=self.patient.pk)
+        self.assertEqual(
+            record.cde_val("simple", self.sectionA.code, "CDEName"), "Fred"
+        )
+
+    def test_field_expression_writer_context_errors(self):
+        ambiguous_patient = self.create_patient()
+        RDRFContext.objects.create(
+            registry=self.registry,
+            object_id=ambiguous_patient.pk,
+            content_type=ContentType.objects.get_for_model(Patient),
+        )
+        errors = FieldExpressionWriter(self.registry).write(
+            [
+                (ambiguous_patient.pk, "simple/sectionA/CDEName", "Bob"),
+                (self.patient.pk, "simple/sectionA/CDEName", "Fred"),
+            ]
+        )
+
+        self.assertEqual(
+            [(error.row, error.patient_id) for error in errors],
+            [(0, ambiguous_patient.pk)],
+        )
+        self.assertTrue(errors[0].message.startswith("No default context"))
+        record = ClinicalData.objects.collection(
+            self.registry.code, "cdes"
+        ).get(django_model="Patient", django_id=self.patient.pk)
+        self.assertEqual(
+            record.cde_val("simple", self.sectionA.code, "CDEName"), "Fred"
+        )
+
+    def test_section_form_class_cache(self):
+        def form_class(**kwargs):
+            return create_form_class_for_section(
+                self.registry,
+                DataDefinitions(self.simple_form),
+                self.simple_form,
+                self.sectionA,
+                injected_model="Patient",
+                injected_model_id=self.patient.pk,
+                **kwargs,
+            )
+
+        name_field = self._create_form_key(
+            self.simple_form, self.sectionA, "CDEName"
+        )
+        cached = form_class()
+        self.assertIs(form_class(), cached)
+        self.assertIsNot(form_class(is_superuser=True), cached)
+        self.assertEqual(
+            list(form_class(allowed_cdes=["CDEAge"]).base_fields),
+            [self._create_form_key(self.simple_form, self.sectionA, "CDEAge")],
+        )
+
+        # Previous values are set on copies of the cached fields
+        with_previous = form_class(previous_values={"CDEName": "Fred"})
+        self.assertIsNot(with_previous, cached)
+        self.assertEqual(
+            with_previous.base_fields[name_field].previous_value, "Fred"
+        )
+        self.assertIsNone(cached.base_fields[name_field].previous_value)
+
+        # Definition changes rebuild the classes
+        self.sectionA.save()
+        self.assertIsNot(form_class(), cached)
+
+    def test_registry_definition_snapshot(self):
+        definition = get_registry_definition(self.registry)
+        self.assertIs(get_registry_definition(self.registry), definition)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [s.code for s in definition.section_models(self.simple_form)],
+                ["sectionA", "sectionB"],
+            )
+            self.assertEqual(
+                [cde.code for cde in definition.cde_models("sectionB")],
+                ["CDEHeight", "CDEWeight"],
+            )
+            form, section, cde = definition.models_from_key(
+                "simple", "sectionB", "CDEHeight"
+            )
+            self.assertEqual(
+                (form, section.code, cde.code),
+                (self.simple_form, "sectionB", "CDEHeight"),
+            )
+            self.assertIsNone(
+                definition.models_from_key("simple", "sectionC", "CDEName")
+            )
+            self.assertEqual(
+                definition.full_path("CDEHeight"),
+                ("simple", "sectionB", "CDEHeight"),
+            )
+            # CDEName is on both forms
+            with self.assertRaises(ValueError):
+                definition.full_path("CDEName")
+
+        # Forms edited in memory don't use the snapshot
+        self.simple_form.sections = "sectionB"
+        self.assertIsNone(definition.section_models(self.simple_form))
+        self.assertEqual(
+            [s.code for s in self.simple_form.section_models], ["sectionB"]
+        )
+
+        # Definition changes rebuild the snapshot
+        self.simple_form.save()
+        rebuilt = get_registry_definition(self.registry)
+        self.assertIsNot(rebuilt, definition)
+        self.assertEqual(
+            [s.code for s in rebuilt.section_models(self.simple_form)],
+            ["sectionB"],
+        )
+
+    def test_context_names_from_cde(self):
+        form_group = ContextFormGroup.objects.create(
+            registry=self.registry,
+            code="visits",
+            name="Visit",
+            abbreviated_name="visit",
+            context_type="M",
+            naming_scheme="C",
+            naming_cde_to_use="simple/sectionA/CDEName",
+        )
+        first, second = [
+            RDRFContext.objects.create(
+                registry=self.registry,
+                context_form_group=form_group,
+                object_id=self.patient.pk,
+                content_type=ContentType.objects.get_for_model(Patient),
+            )
+            for __ in range(2)
+        ]
+        ClinicalData.create(
+            self.patient,
+            registry_code=self.registry.code,
+            collection="cdes",
+            context_id=first.pk,
+            data={
+                "context_id": first.pk,
+                "timestamp": datetime.now().isoformat(),
+                "forms": [
+                    {
+                        "name": self.simple_form.name,
+                        "sections": [
+                            {
+                                "code": self.sectionA.code,
+                                "allow_multiple": False,
+                                "cdes": [
+                                    {"code": "CDEName", "value": "Baseline"}
+                                ],
+                            }
+                        ],
+                    }
+                ],
+            },
+        ).save()
+
+        self.assertEqual(
+            form_group.get_names_from_cde(self.patient, [first, second]),
+            {first.pk: "Baseline", second.pk: "NOT SET"},
+        )
+        self.assertEqual(
+            form_group.get_name_from_cde(self.patient, first), "Baseline"
+        )
+
 
 class LongitudinalTestCase(FormTestCase):
     def test_simple_form(self):
@@ -891,6 +1190,89 @@ class LongitudinalTestCase(FormTestCase):
                 "Each  snapshot should record dict contain a forms field",
             )
 
+    def test_history_deltas(self):
+        from rdrf.db.dynamic_data import DynamicDataWrapper
+
+        def save_weight(weight):
+            ff = FormFiller(self.simple_form)
+            ff.sectionA.CDEName = "Fred"
+            ff.sectionB.CDEWeight = weight
+            request = self._create_request(self.simple_form, ff.data)
+            request.session = {}
+            view = FormView()
+            view.request = request
+            view.post(
+                request,
+                self.registry.code,
+                self.simple_form.pk,
+                self.patient.pk,
+                self.default_context.pk,
+            )
+
+        save_weight(88.23)
+        save_weight(90.1)
+        save_weight(90.1)
+
+        history = list(
+            ClinicalData.objects.collection(self.registry.code, "history")
+            .find(self.patient)
+            .data()
+        )
+        self.assertEqual(
+            [record["record_type"] for record in history],
+            ["snapshot", "delta", "delta"],
+        )
+        self.assertNotIn("record", history[1])
+        self.assertEqual(
+            [change["key"][2] for change in history[1]["changes"]],
+            ["CDEWeight"],
+        )
+        self.assertEqual(history[2]["changes"], [])
+
+        wrapper = DynamicDataWrapper(
+            self.patient, rdrf_context_id=self.default_context.pk
+        )
+        timeline = wrapper.get_cde_history(
+            self.registry.code,
+            self.simple_form.name,
+            self.sectionB.code,
+            "CDEWeight",
+        )
+        self.assertEqual(len(timeline), 2)
+
+        first = wrapper.get_history_record(
+            self.registry.code, history[0]["timestamp"]
+        )
+        self.assertEqual(first["forms"], history[0]["record"]["forms"])
+        latest = wrapper.get_history_record(
+            self.registry.code, history[2]["timestamp"]
+        )
+        current = wrapper.load_dynamic_data(
+            self.registry.code, "cdes", flattened=False
+        )
+        self.assertEqual(latest["timestamp"], current["timestamp"])
+        self.assertEqual(
+            dict(iter_cde_values(latest)), dict(iter_cde_values(current))
+        )
+
+        # Deltas are diffed against the values replayed from the snapshot
+        save_weight(91.5)
+        changes = (
+            ClinicalData.objects.collection(self.registry.code, "history")
+            .find(self.patient)
+            .data()
+            .last()["changes"]
+        )
+        self.assertEqual(
+            [(str(change["old"]), str(change["new"])) for change in changes],
+            [("90.1", "91.5")],
+        )
+
+    def test_compact_clinical_history_needs_confirmation(self):
+        with self.assertRaises(CommandError):
+            call_command("compact_clinical_history")
+        call_command("compact_clinical_history", dry_run=True)
+
 
 class DeCamelcaseTestCase(TestCase):
     _EXPECTED_VALUE = "Your Condition"
@@ -1873,3 +2255,89 @@ class ClinicalDataTestCase(RDRFTestCase):
         self.assertEqual(patient_model2.active, True)
         self.assertEqual(clinicaldata_model2.active, True)
         self.assertEqual(patient_model2.id, clinicaldata_model2.django_id)
+
+    def _clinical_data_with_values(self, patient_id, registry_code):
+        cd = self.create_clinicaldata(patient_id, registry_code)
+        cd.data["forms"] = [
+            {
+                "name": "form1",
+                "sections": [
+                    {
+                        "code": "sec1",
+                        "allow_multiple": False,
+                        "cdes": [{"code": "cde1", "value": "A"}],
+                    },
+                    {
+                        "code": "multi1",
+                        "allow_multiple": True,
+                        "cdes": [
+                            [{"code": "cde2", "value": "X"}],
+                            [{"code": "cde2", "value": ""}],
+                            [{"code": "cde2", "value": "Y"}],
+                        ],
+                    },
+                ],
+            }
+        ]
+        cd.save()
+        return cd
+
+    def test_clinicaldata_value_index(self):
+        patient_model = self.create_new_patient()
+        cd = self._clinical_data_with_values(patient_model.id, "dummy")
+
+        self.assertEqual(
+            ClinicalDataValue.objects.filter(clinical_data=cd).count(), 4
+        )
+        self.assertEqual(
+            patient_model.get_form_value("dummy", "form1", "sec1", "cde1"), "A"
+        )
+        self.assertEqual(
+            patient_model.get_form_value(
+                "dummy", "form1", "multi1", "cde2", multisection=True
+            ),
+            ["X", "Y"],
+        )
+        with self.assertRaises(KeyError):
+            patient_model.get_form_value("dummy", "form1", "sec1", "cde3")
+        with self.assertRaises(KeyError):
+            patient_model.get_form_value(
+                "dummy", "form1", "multi2", "cde2", multisection=True
+            )
+
+        cd.data["forms"][0]["sections"][1]["cdes"] = []
+        cd.save()
+        self.assertEqual(
+            patient_model.get_form_value(
+                "dummy", "form1", "multi1", "cde2", multisection=True
+            ),
+            [],
+        )
+
+        cd.data["forms"][0]["sections"][0]["cdes"][0]["value"] = "B"
+        cd.save()
+        self.assertEqual(
+            patient_model.get_form_value("dummy", "form1", "sec1", "cde1"), "B"
+        )
+        self.assertEqual(cd.cde_val("form1", "sec1", "cde1"), "B")
+
+    def test_clinicaldata_value_object_ids(self):
+        patient_model1 = self.create_new_patient()
+        patient_model2 = self.create_new_patient()
+        self._clinical_data_with_values(patient_model1.id, "dummy")
+        self._clinical_data_with_values(patient_model2.id, "dummy")
+
+        def object_ids(**lookups):
+            return set(
+                ClinicalDataValue.objects.object_ids(
+                    "dummy", "form1", "sec1", "cde1", **lookups
+                )
+            )
+
+        self.assertEqual(
+            object_ids(value="A"), {patient_model1.id, patient_model2.id}
+        )
+        self.assertEqual(object_ids(value="B"), set())
+
+        patient_model2.delete()
+        self.assertEqual(object_ids(value="A"), {patient_model1.id})
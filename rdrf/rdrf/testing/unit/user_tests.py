@@ -1,12 +1,19 @@
 import logging
 
+from django.contrib.auth.models import Group
 from django.test import TestCase
 from django.urls import reverse
 from registry.groups import GROUPS
 from registry.groups.models import CustomUser
 from registry.patients.models import ParentGuardian, Patient
 
-from rdrf.models.definition.models import Registry, RegistryDashboard
+from rdrf.models.definition.models import (
+    CommonDataElement,
+    Registry,
+    RegistryDashboard,
+    RegistryForm,
+    Section,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -170,3 +177,62 @@ class GroupTest(TestCase):
 
     def test_group_like(self):
         self._test_group_attrs(["patients1"], [])
+
+
+class UserPermissionsTest(TestCase):
+    def setUp(self):
+        self.registry = Registry.objects.create(code="test")
+        CommonDataElement.objects.create(code="C1", abbreviated_name="C1")
+        Section.objects.create(code="S1", abbreviated_name="S1", elements="C1")
+        self.open_form, self.restricted_form, self.hidden_form = (
+            RegistryForm.objects.create(
+                name=name,
+                registry=self.registry,
+                abbreviated_name=name,
+                sections="S1",
+            )
+            for name in ("open", "restricted", "hidden")
+        )
+        clinicians, __ = Group.objects.get_or_create(name=GROUPS.CLINICAL)
+        curators, __ = Group.objects.get_or_create(
+            name=GROUPS.WORKING_GROUP_CURATOR
+        )
+        self.restricted_form.groups_allowed.add(clinicians)
+        self.restricted_form.groups_readonly.add(clinicians)
+        self.hidden_form.groups_allowed.add(curators)
+
+        user = CustomUser.objects.create(username="clinician")
+        user.groups.add(clinicians)
+        user.registry.add(self.registry)
+
+    def test_permission_checks_query_once(self):
+        user = CustomUser.objects.get(username="clinician")
+
+        # groups, registries, working groups, restricted, allowed and
+        # read only forms
+        with self.assertNumQueries(6):
+            self.assertTrue(user.is_clinician)
+
+        with self.assertNumQueries(0):
+            for __ in range(10):
+                self.assertFalse(user.is_patient)
+                self.assertFalse(user.is_curator)
+                self.assertTrue(user.in_registry(self.registry))
+                self.assertTrue(user.can_view(self.open_form))
+                self.assertTrue(user.can_view(self.restricted_form))
+                self.assertFalse(user.can_view(self.hidden_form))
+                self.assertTrue(user.is_readonly(self.restricted_form))
+                self.assertFalse(user.is_readonly(self.open_form))
+
+    def test_permissions_follow_membership_changes(self):
+        user = CustomUser.objects.get(username="clinician")
+        self.assertFalse(user.is_curator)
+        self.assertFalse(user.can_view(self.hidden_form))
+
+        user.add_group(GROUPS.WORKING_GROUP_CURATOR)
+        self.assertTrue(user.is_curator)
+        self.assertTrue(user.can_view(self.hidden_form))
+
+        user.registry.clear()
+        self.assertFalse(user.in_registry(self.registry))
+        self.assertFalse(user.can_view(self.open_form))
@@ -7,7 +7,7 @@ from django.urls import include, path, re_path
 from django.utils.translation import gettext as _
 from django.views.generic.base import TemplateView
 from django.views.i18n import JavaScriptCatalog
-from report.schema import create_dynamic_schema
+from report.schema import get_dynamic_schema
 from report.TrrfGraphQLView import TrrfGraphQLView
 from two_factor import views as twv
 
@@ -112,7 +112,7 @@ if settings.DEBUG is True:
         path(
             "graphql",
             lambda request: TrrfGraphQLView.as_view(
-                schema=create_dynamic_schema(), graphiql=True
+                schema=get_dynamic_schema(), graphiql=True
             )(request),
         ),
     ]
@@ -1,5 +1,6 @@
 import json
 import logging
+import re
 from collections import OrderedDict
 from urllib.parse import urlencode
 
@@ -10,12 +11,12 @@ from django.core.exceptions import PermissionDenied
 from django.forms.formsets import formset_factory
 from django.forms.models import inlineformset_factory
 from django.http import (
-    FileResponse,
     Http404,
     HttpResponse,
     HttpResponseNotFound,
     HttpResponseRedirect,
     JsonResponse,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.context_processors import csrf
@@ -43,7 +44,7 @@ from rdrf.admin_forms import CommonDataElementAdminForm
 from rdrf.db import filestorage
 from rdrf.db.contexts_api import RDRFContextError, RDRFContextManager
 from rdrf.db.dynamic_data import DynamicDataWrapper
-from rdrf.db.filestorage import virus_checker_result
+from rdrf.db.filestorage import get_scan_status
 from rdrf.forms.components import (
     RDRFContextLauncherComponent,
     RDRFPatientInfoComponent,
@@ -67,6 +68,7 @@ from rdrf.helpers.utils import (
     de_camelcase,
     location_name,
     make_index_map,
+    mongo_key,
     silk_profile,
 )
 from rdrf.helpers.view_helper import FileErrorHandlingMixin
@@ -95,6 +97,8 @@ from rdrf.services.rpc.actions import ActionExecutor
 
 logger = logging.getLogger(__name__)
 
+BYTE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
 
 class RDRFContextSwitchError(Exception):
     pass
@@ -346,24 +350,32 @@ class FormView(View):
             # create mode
             return None, selected_version_name
 
-        previous_contexts_qs = self.rdrf_context_manager.get_previous_contexts(
-            self.rdrf_context, patient_model
+        previous_contexts = list(
+            self.rdrf_context_manager.get_previous_contexts(
+                self.rdrf_context, patient_model
+            ).select_related("context_form_group__registry")
         )
-        self.has_previous_contexts = previous_contexts_qs.exists()
-        for prev_context in previous_contexts_qs:
-            form_group_name = self.get_form_group_name(
-                patient_model, prev_context
-            )
-            clinical_data = self._get_dynamic_data(
-                id=patient_model.id,
-                registry_code=registry_code,
-                rdrf_context_id=prev_context.id,
-            )
+        self.has_previous_contexts = bool(previous_contexts)
+        if not previous_contexts:
+            return None, selected_version_name
+
+        # All the previous contexts are in the form group of this context
+        form_group = previous_contexts[0].context_form_group
+        form_group_names = form_group.get_names_from_cde(
+            patient_model, previous_contexts
+        )
+        for prev_context in previous_contexts:
+            form_group_name = form_group_names[prev_context.id]
             if (
                 changes_since_version
                 and int(changes_since_version) == prev_context.id
             ):
-                self.previous_data = clinical_data
+                # Only the selected version is loaded for comparison
+                self.previous_data = self._get_dynamic_data(
+                    id=patient_model.id,
+                    registry_code=registry_code,
+                    rdrf_context_id=prev_context.id,
+                )
                 selected_version_name = form_group_name
             self.previous_versions.append(
                 {
@@ -912,7 +924,15 @@ class FormView(View):
             xray_recorder.begin_subsegment("progress")
             if not self.CREATE_MODE:
                 progress_dict = dyn_patient.save_form_progress(
-                    registry, context_model=self.rdrf_context
+                    registry,
+                    context_model=self.rdrf_context,
+                    changed_cde_keys=[
+                        mongo_key(form_obj.name, section_info.section_code, cde)
+                        for section_info in sections_to_save
+                        for cde in section_element_map[
+                            section_info.section_code
+                        ]
+                    ],
                 )
             xray_recorder.end_subsegment()
 
@@ -1544,20 +1564,73 @@ class FileUploadView(FileErrorHandlingMixin, View):
             cde_file = get_object_or_404(CDEFile, pk=file_id)
             return JsonResponse(
                 {
-                    "response": virus_checker_result(cde_file.item.name),
+                    "response": get_scan_status(cde_file, refresh=True),
                 }
             )
 
         if file_info.item is not None:
-            response = FileResponse(
-                file_info.item,
-                content_type=file_info.mime_type or "application/octet-stream",
+            download_url = filestorage.get_download_url(file_info)
+            if download_url:
+                return HttpResponseRedirect(download_url)
+            return self._file_response(request, file_info)
+        return HttpResponseNotFound()
+
+    @staticmethod
+    def _get_range(request, size):
+        """
+        The (start, end) of a single "bytes" range requested, None for the
+        whole file. Raises ValueError for unsatisfiable ranges.
+        """
+        match = BYTE_RANGE_RE.match(request.headers.get("Range", ""))
+        if not match:
+            return None
+        start, end = match.groups()
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        elif end:
+            # The last bytes of the file
+            start = max(size - int(end), 0)
+            end = size - 1
+        else:
+            return None
+        if start > end:
+            raise ValueError("Unsatisfiable range")
+        return start, end
+
+    def _file_response(self, request, file_info):
+        content_type = file_info.mime_type or "application/octet-stream"
+        file_obj = file_info.item.open("rb")
+        size = file_info.size
+        if size is None:
+            size = file_info.item.size
+
+        try:
+            byte_range = self._get_range(request, size)
+        except ValueError:
+            file_obj.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%s" % size
+            return response
+
+        if byte_range is None:
+            response = StreamingHttpResponse(
+                filestorage.iter_file_range(file_obj, 0, size),
+                content_type=content_type,
             )
-            response["Content-disposition"] = (
-                'filename="%s"' % file_info.filename
+            response["Content-Length"] = size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                filestorage.iter_file_range(file_obj, start, end - start + 1),
+                status=206,
+                content_type=content_type,
             )
-            return response
-        return HttpResponseNotFound()
+            response["Content-Length"] = end - start + 1
+            response["Content-Range"] = "bytes %s-%s/%s" % (start, end, size)
+        response["Accept-Ranges"] = "bytes"
+        response["Content-disposition"] = 'filename="%s"' % file_info.filename
+        return response
 
 
 class StandardView(object):
@@ -140,20 +140,23 @@ class PatientFormMixin:
     ):
         additional_fields = OrderedDict()
         field_pairs = self._get_registry_specific_fields(user, registry_model)
+        cde_policies = {
+            cde_policy.cde_id: cde_policy
+            for cde_policy in CdePolicy.objects.filter(
+                registry=registry_model,
+                cde__in=[cde for cde, __ in field_pairs],
+            ).prefetch_related("groups_allowed")
+        }
+        user_groups = list(user.groups.all())
 
         for cde, field_object in field_pairs:
-            try:
-                cde_policy = CdePolicy.objects.get(
-                    registry=registry_model, cde=cde
-                )
-            except CdePolicy.DoesNotExist:
-                cde_policy = None
+            cde_policy = cde_policies.get(cde.code)
 
             if cde_policy is None or patient is None:
                 additional_fields[cde.code] = field_object
             else:
                 if user.is_superuser or cde_policy.is_allowed(
-                    user.groups.all(), patient
+                    user_groups, patient
                 ):
                     if patient and patient.is_index:
                         additional_fields[cde.code] = field_object
@@ -8,22 +8,14 @@ from django.template.context_processors import csrf
 from django.urls import reverse
 from django.utils.translation import gettext as _
 from django.views.generic.base import View
-from registry.patients.models import Patient
-from report.schema import create_dynamic_schema, to_camel_case
 
 from rdrf.db.contexts_api import RDRFContextManager
 from rdrf.forms.progress.form_progress import FormProgress
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.models.definition.models import Registry
 from rdrf.patients.patient_list_configuration import PatientListConfiguration
-from rdrf.patients.query_data import (
-    build_all_patients_query,
-    build_patient_filters,
-    build_patients_query,
-    build_search_item,
-    get_all_patients,
-    query_patient_facets,
-)
+from rdrf.patients.patient_listing import PatientListingQuery
+from rdrf.patients.query_data import build_search_item, query_patient_facets
 
 logger = logging.getLogger(__name__)
 
@@ -227,37 +219,6 @@ class PatientsListingView(View):
                 if col.field == self.sort_field
             ]
 
-    def _query_all_patients(
-        self,
-        request,
-        registry,
-        filters,
-        patient_fields,
-        sort_fields,
-        pagination,
-    ):
-        patient_query = build_patients_query(
-            patient_fields, sort_fields, pagination
-        )
-
-        operation_input, query_input, variables = build_patient_filters(filters)
-        all_patients_query = build_all_patients_query(
-            registry, ["total", patient_query], query_input, operation_input
-        )
-
-        schema = create_dynamic_schema()
-
-        result_all = schema.execute(
-            build_all_patients_query(registry, ["total"]), context_value=request
-        )
-        result_filtered = schema.execute(
-            all_patients_query, variable_values=variables, context_value=request
-        )
-
-        return get_all_patients(result_all, registry).get(
-            "total"
-        ), get_all_patients(result_filtered, registry)
-
     def _get_results(self, request):
         if self.registry_model is None:
             return []
@@ -272,27 +233,15 @@ class PatientsListingView(View):
             )
             filters.update({"search": [patient_search]})
 
-        patient_fields = ["id"]
-        sort_fields = self._sort_fields()
-        schema_sort_fields = list(map(to_camel_case, sort_fields))
-        pagination = {"offset": self.start, "limit": self.length}
-
-        base_total, results = self._query_all_patients(
-            request,
-            self.registry_model,
-            filters,
-            patient_fields,
-            schema_sort_fields,
-            pagination,
+        listing_query = PatientListingQuery(self.user, self.registry_model)
+        base_total = listing_query.base_total()
+        filtered_total, rows = listing_query.page(
+            filters, self._sort_fields(), self.start, self.length
         )
 
-        patient_ids = [patient["id"] for patient in results.get("patients", [])]
-        patients = Patient.objects.filter(id__in=patient_ids).order_by(
-            *sort_fields
-        )
-
-        filtered_total = results.get("total")
-        patients_dict = [self._get_row_dict(patient) for patient in patients]
+        patients_dict = [
+            self._get_row_dict(patient, listing) for listing, patient in rows
+        ]
 
         return base_total, filtered_total, patients_dict
 
@@ -326,7 +275,7 @@ class PatientsListingView(View):
         sort_field = request.POST.get(column_name, None)
         return sort_field, sort_direction
 
-    def _get_row_dict(self, instance):
+    def _get_row_dict(self, instance, listing=None):
         # Create any missing fixed contexts
         self.rdrf_context_manager.get_or_create_default_context(instance)
 
@@ -336,7 +285,9 @@ class PatientsListingView(View):
         self.form_progress._set_current(instance)
         return {
             col.field: col.fmt(
-                col.cell(
+                col.listing_cell(listing)
+                if listing is not None and col.listing_field
+                else col.cell(
                     instance,
                     self.supports_contexts,
                     self.form_progress,
@@ -1,5 +1,4 @@
 import logging
-import operator
 import re
 from enum import Enum
 from functools import reduce
@@ -14,18 +13,25 @@ from django.contrib.auth.models import (
 from django.core import validators
 from django.db import models
 from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
 from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 from registration.signals import user_activated
 from simple_history.models import HistoricalRecords
 
+from rdrf.helpers.definition_version import bump_definition_version
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.helpers.utils import consent_check
 from rdrf.models.definition.models import Registry, RegistryDashboard
 from registry.groups import GROUPS as RDRF_GROUPS
+from registry.groups.user_permissions import (
+    UserPermissions,
+    bump_user_permissions_version,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -110,6 +116,13 @@ class WorkingGroup(models.Model):
             return self.name
 
 
+@receiver([post_save, post_delete], sender=WorkingGroupType)
+@receiver([post_save, post_delete], sender=WorkingGroup)
+def working_group_definition_changed(sender, instance, **kwargs):
+    # Working groups and their types are part of the report schema
+    bump_definition_version()
+
+
 class CustomUserManager(UserManager):
     def get_by_natural_key(self, username):
         return self.get(**{f"{self.model.USERNAME_FIELD}__iexact": username})
@@ -299,13 +312,18 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
             to_username=self.username, seen=False
         ).order_by("-created")
 
+    @cached_property
+    def permissions(self):
+        return UserPermissions.load(self)
+
+    def invalidate_permissions(self):
+        self.__dict__.pop("permissions", None)
+
     def in_registry(self, registry_model):
-        return self.registry.filter(pk=registry_model.pk).exists()
+        return registry_model.pk in self.permissions.registry_ids
 
     def in_group(self, *names):
-        return self.groups.filter(
-            reduce(operator.or_, ((Q(name__iexact=name) for name in names)))
-        ).exists()
+        return self.permissions.in_group(*names)
 
     @property
     def is_patient(self):
@@ -403,9 +421,8 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         # can this user view a link to this patient?
         if self.is_superuser:
             return True
-        my_wgs = set([wg.id for wg in self.working_groups.all()])
         patient_wgs = set([wg.id for wg in patient_model.working_groups.all()])
-        return my_wgs.intersection(patient_wgs)
+        return self.permissions.working_group_ids.intersection(patient_wgs)
 
     def has_feature(self, feature):
         if not self.is_superuser:
@@ -416,8 +433,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def add_group(self, group_name):
         from django.contrib.auth.models import Group
 
-        existing_groups = [g.name for g in self.groups.all()]
-        if group_name not in existing_groups:
+        if group_name not in self.permissions.group_names:
             group, __ = Group.objects.get_or_create(name=group_name)
             self.groups.add(group)
 
@@ -426,15 +442,16 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
             return UserFormPermission.CAN_VIEW
 
         form_registry = registry_form_model.registry
+        permissions = self.permissions
 
-        if not self.registry.filter(id=form_registry.id).exists():
+        if form_registry.id not in permissions.registry_ids:
             return UserFormPermission.NOT_IN_REGISTRY
 
-        if not registry_form_model.open:
-            if not registry_form_model.groups_allowed.filter(
-                id__in=self.groups.all().values_list("id")
-            ).exists():
-                return UserFormPermission.GROUP_NOT_ALLOWED
+        if (
+            registry_form_model.pk in permissions.restricted_form_ids
+            and registry_form_model.pk not in permissions.allowed_form_ids
+        ):
+            return UserFormPermission.GROUP_NOT_ALLOWED
 
         if self.is_patient_or_delegate and form_registry.has_feature(
             RegistryFeatures.HIDE_UNTRANSLATED_FORMS
@@ -449,10 +466,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.get_form_permission(registry_form_model).can_view()
 
     def is_readonly(self, registry_form_model):
-        return any(
-            group in registry_form_model.groups_readonly.all()
-            for group in self.groups.all()
-        )
+        return registry_form_model.pk in self.permissions.readonly_form_ids
 
     def set_password(self, raw_password):
         super().set_password(raw_password)
@@ -469,18 +483,28 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
             return None
         return import_string(setting_value)
 
-    @property
-    def menu_links(self):
+    def _quick_links(self):
         quick_links_class = self._load_quick_links()
         if not quick_links_class:
+            return None
+        if self.is_superuser:
+            return quick_links_class.for_registries(
+                self.get_registries_or_all()
+            )
+        return quick_links_class.for_registries(
+            self.get_registries(),
+            registry_ids=self.permissions.registry_ids,
+        )
+
+    @property
+    def menu_links(self):
+        qlinks = self._quick_links()
+        if not qlinks:
             return []
-        qlinks = quick_links_class(self.get_registries_or_all())
         if self.is_superuser:
             links = qlinks.menu_links([RDRF_GROUPS.SUPER_USER])
         else:
-            links = qlinks.menu_links(
-                [group.name for group in self.groups.all()]
-            )
+            links = qlinks.menu_links(list(self.permissions.group_names))
 
         return links
 
@@ -488,10 +512,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def settings_links(self):
         links = []
         if self.is_superuser:
-            quick_links_class = self._load_quick_links()
-            if not quick_links_class:
+            qlinks = self._quick_links()
+            if not qlinks:
                 return links
-            qlinks = quick_links_class(self.get_registries_or_all())
             links = qlinks.settings_links()
         return links
 
@@ -499,15 +522,44 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def admin_page_links(self):
         links = []
         if self.is_superuser:
-            quick_links_class = self._load_quick_links()
-            if not quick_links_class:
+            qlinks = self._quick_links()
+            if not qlinks:
                 return links
-            qlinks = quick_links_class(self.get_registries_or_all())
             links = qlinks.admin_page_links()
 
         return links
 
 
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.registry.through)
+@receiver(m2m_changed, sender=CustomUser.working_groups.through)
+def user_memberships_changed(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, CustomUser):
+        instance.invalidate_permissions()
+        bump_user_permissions_version([instance.pk])
+    elif pk_set:
+        bump_user_permissions_version(pk_set)
+    else:
+        # Cleared from the group, registry or working group side, the
+        # users aren't known anymore
+        bump_definition_version()
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Cached user permissions and quick links refer to groups by name
+    bump_definition_version()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    # Quick links are cached per definition version
+    if action.startswith("post_"):
+        bump_definition_version()
+
+
 @receiver(user_activated)
 def user_activated_callback(sender, user, request, **kwargs):
     from rdrf.events.events import EventType
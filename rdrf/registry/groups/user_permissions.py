@@ -0,0 +1,93 @@
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rdrf.helpers.definition_version import get_definition_version
+
+logger = logging.getLogger(__name__)
+
+USER_PERMISSIONS_VERSION_CACHE_KEY = "user_permissions_version_%s"
+
+
+def get_user_permissions_version(user_id):
+    key = USER_PERMISSIONS_VERSION_CACHE_KEY % user_id
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_permissions_version(user_ids):
+    cache.set_many(
+        {
+            USER_PERMISSIONS_VERSION_CACHE_KEY % user_id: uuid.uuid4().hex
+            for user_id in user_ids
+        },
+        None,
+    )
+
+
+class UserPermissions:
+    """
+    Snapshot of the groups, registries, working groups and form
+    permissions of a user, loaded with one query each.
+
+    The snapshot is kept on the user instance, so it is loaded once per
+    request. When USER_PERMISSIONS_CACHE_TIMEOUT is set it is also shared
+    between requests through the default cache, keyed by versions bumped
+    whenever the user's memberships or the registry definitions change.
+    """
+
+    def __init__(self, user):
+        from rdrf.models.definition.models import RegistryForm
+
+        groups = list(user.groups.values_list("id", "name"))
+        self.group_ids = frozenset(group_id for group_id, _ in groups)
+        self.group_names = tuple(name for _, name in groups)
+        self.registry_ids = frozenset(
+            user.registry.values_list("id", flat=True)
+        )
+        self.working_group_ids = frozenset(
+            user.working_groups.values_list("id", flat=True)
+        )
+        self.restricted_form_ids = frozenset(
+            RegistryForm.groups_allowed.through.objects.values_list(
+                "registryform_id", flat=True
+            ).distinct()
+        )
+        self.allowed_form_ids = frozenset(
+            RegistryForm.groups_allowed.through.objects.filter(
+                group_id__in=self.group_ids
+            ).values_list("registryform_id", flat=True)
+        )
+        self.readonly_form_ids = frozenset(
+            RegistryForm.groups_readonly.through.objects.filter(
+                group_id__in=self.group_ids
+            ).values_list("registryform_id", flat=True)
+        )
+        self.lower_group_names = frozenset(
+            name.lower() for name in self.group_names
+        )
+
+    @classmethod
+    def load(cls, user):
+        timeout = getattr(settings, "USER_PERMISSIONS_CACHE_TIMEOUT", 0)
+        if not timeout or user.pk is None:
+            return cls(user)
+
+        key = "user_permissions_%s_%s_%s" % (
+            user.pk,
+            get_user_permissions_version(user.pk),
+            get_definition_version(),
+        )
+        permissions = cache.get(key)
+        if permissions is None:
+            permissions = cls(user)
+            cache.set(key, permissions, timeout)
+        return permissions
+
+    def in_group(self, *names):
+        return any(name.lower() in self.lower_group_names for name in names)
@@ -0,0 +1,115 @@
+# Generated by Django 4.2.16 on 2026-10-17 17:20
+
+from django.db import connections, migrations, models
+import django.db.models.deletion
+
+
+def build_patient_listing(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Patient = apps.get_model('patients', 'Patient')
+    PatientListing = apps.get_model('patients', 'PatientListing')
+    ClinicalData = apps.get_model('rdrf', 'ClinicalData')
+    RDRFContext = apps.get_model('rdrf', 'RDRFContext')
+
+    patients = (
+        Patient.objects.using(db_alias)
+        .prefetch_related('rdrf_registry')
+        .order_by('id')
+    )
+    for patient in patients.iterator(chunk_size=500):
+        working_group_names = ', '.join(
+            patient.working_groups.order_by(
+                'registry__code', 'type__name', 'name'
+            ).values_list('name', flat=True)
+        )
+        PatientListing.objects.using(db_alias).bulk_create(
+            [
+                PatientListing(
+                    registry=registry,
+                    patient=patient,
+                    given_names=patient.given_names,
+                    family_name=patient.family_name,
+                    date_of_birth=patient.date_of_birth,
+                    sex=patient.sex,
+                    patient_type=patient.patient_type,
+                    living_status=patient.living_status,
+                    stage_id=patient.stage_id,
+                    working_group_names=working_group_names,
+                    last_updated_overall_at=patient.last_updated_overall_at,
+                )
+                for registry in patient.rdrf_registry.all()
+            ]
+        )
+
+    # The progress records are in the clinical database, which is migrated
+    # separately, so they are read through its connection
+    clinical_connection = connections['clinical']
+    if (
+        ClinicalData._meta.db_table
+        not in clinical_connection.introspection.table_names()
+    ):
+        return
+    default_context_ids = set(
+        RDRFContext.objects.using(db_alias)
+        .filter(
+            models.Q(context_form_group__isnull=True)
+            | models.Q(context_form_group__is_default=True)
+        )
+        .values_list('id', flat=True)
+    )
+    progress_records = (
+        ClinicalData.objects.using(clinical_connection.alias)
+        .filter(collection='progress', django_model='Patient')
+        .values_list('registry_code', 'django_id', 'context_id', 'data')
+    )
+    for registry_code, patient_id, context_id, data in (
+        progress_records.iterator(chunk_size=500)
+    ):
+        if context_id not in default_context_ids:
+            continue
+        PatientListing.objects.using(db_alias).filter(
+            registry__code=registry_code,
+            patient_id=patient_id,
+        ).update(
+            diagnosis_progress=data.get('diagnosis_group_progress', 0),
+            diagnosis_currency=data.get('diagnosis_group_current', False),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdrf', '0173_clinicaldatavalue'),
+        ('patients', '0064_patient_stages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientListing',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('given_names', models.CharField(max_length=100)),
+                ('family_name', models.CharField(max_length=100)),
+                ('date_of_birth', models.DateField()),
+                ('sex', models.CharField(max_length=1)),
+                ('patient_type', models.CharField(blank=True, max_length=80, null=True)),
+                ('living_status', models.CharField(max_length=80)),
+                ('working_group_names', models.TextField(blank=True)),
+                ('diagnosis_progress', models.IntegerField(default=0)),
+                ('diagnosis_currency', models.BooleanField(default=False)),
+                ('last_updated_overall_at', models.DateTimeField(blank=True, null=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listings', to='patients.patient')),
+                ('registry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rdrf.registry')),
+                ('stage', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='patients.patientstage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['registry', 'family_name', 'given_names', 'patient'], name='idx_listing_name'), models.Index(fields=['registry', 'date_of_birth', 'patient'], name='idx_listing_dob'), models.Index(fields=['registry', 'last_updated_overall_at', 'patient'], name='idx_listing_updated')],
+                'unique_together': {('registry', 'patient')},
+            },
+        ),
+        migrations.RunPython(
+            build_patient_listing,
+            migrations.RunPython.noop,
+            hints={'model_name': 'patientlisting'},
+        ),
+    ]
@@ -2,6 +2,7 @@ import datetime
 import json
 import logging
 import random
+import uuid
 from collections import namedtuple
 from functools import reduce
 from operator import attrgetter
@@ -9,6 +10,7 @@ from operator import attrgetter
 import pycountry
 from django.contrib.postgres.fields import ArrayField
 from django.core import serializers
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.storage import DefaultStorage
 from django.db import models
@@ -22,6 +24,7 @@ from django.db.models.signals import (
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext
 from django.utils.translation import gettext_lazy as _
 from simple_history.models import HistoricalRecords
@@ -29,12 +32,21 @@ from simple_history.models import HistoricalRecords
 import registry.groups.models
 from rdrf.db.dynamic_data import DynamicDataWrapper
 from rdrf.events.events import EventType
+from rdrf.helpers.patient_data_version import bump_patient_data_version
+from rdrf.helpers.patient_dto_scope import (
+    clear_patient_dto_scope,
+    get_scoped_dto,
+    set_scoped_dto,
+)
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.models.definition.models import (
     ClinicalData,
     ConsentQuestion,
     DataDefinitions,
+    EmailNotificationPreference,
+    EmailPreference,
     LongitudinalFollowup,
+    RDRFContext,
     Registry,
     Section,
 )
@@ -521,17 +533,27 @@ class Patient(models.Model):
             ("can_see_living_status", _("Can see Living Status column")),
         )
 
+    @cached_property
+    def working_group_names(self):
+        return list(self.working_groups.values_list("name", flat=True))
+
     def as_dto(self):
-        return PatientDTO(
-            **{
-                **{f: getattr(self, f) for f in patientdto_attr_fields},
-                **{
-                    "working_groups": list(
-                        self.working_groups.values_list("name", flat=True)
-                    )
-                },
-            }
+        # Several DTO attributes run queries, so within a patient DTO scope
+        # (eg a request) the DTO is built once for as long as the patient's
+        # fields don't change
+        state = tuple(
+            getattr(self, field.attname) for field in self._meta.concrete_fields
         )
+        dto = get_scoped_dto(self.pk, state)
+        if dto is None:
+            dto = PatientDTO(
+                **{
+                    **{f: getattr(self, f) for f in patientdto_attr_fields},
+                    **{"working_groups": list(self.working_group_names)},
+                }
+            )
+            set_scoped_dto(self.pk, state, dto)
+        return dto._replace(working_groups=list(dto.working_groups))
 
     @property
     def code_field(self):
@@ -677,14 +699,22 @@ class Patient(models.Model):
     ):
         # if clinical_data is supplied don't reload
         # ( allows faster retrieval of multiple values
-        from rdrf.db.dynamic_data import DynamicDataWrapper
+        # otherwise the value is read from the clinical data index
         from rdrf.helpers.utils import mongo_key
+        from rdrf.models.definition.models import ClinicalDataValue
 
         if clinical_data is None:
-            wrapper = DynamicDataWrapper(self, rdrf_context_id=context_id)
-            data = wrapper.load_dynamic_data(registry_code, "cdes")
-        else:
-            data = clinical_data
+            return ClinicalDataValue.objects.lookup(
+                registry_code,
+                self,
+                form_name,
+                section_code,
+                data_element_code,
+                context_id=context_id,
+                multisection=multisection,
+            )
+
+        data = clinical_data
 
         key = mongo_key(form_name, section_code, data_element_code)
 
@@ -903,7 +933,9 @@ class Patient(models.Model):
 
         # update form progress
         form_progress_calculator = FormProgress(registry_model)
-        form_progress_calculator.save_for_patient(self, context_model)
+        form_progress_calculator.save_for_patient(
+            self, context_model, changed_cde_keys=[key]
+        )
 
         if save_snapshot and user is not None:
             wrapper.save_snapshot(
@@ -1101,8 +1133,13 @@ class Patient(models.Model):
         # Does an update through the QuerySet on purpose, so if only the last updated timestamp field
         # changed (and none of the patient data) we don't execute any custom business logic
         # in save(), pre-, and post- save signals.
-        Patient.objects.filter(pk=self.pk).update(
-            last_updated_overall_at=timezone.now()
+        now = timezone.now()
+        Patient.objects.filter(pk=self.pk).update(last_updated_overall_at=now)
+        listings = PatientListing.objects.filter(patient=self)
+        listings.update(last_updated_overall_at=now)
+        # Listing pages sorted by the last update are cached per version
+        PatientListing.objects.bump_version(
+            listings.values_list("registry__code", flat=True)
         )
 
     @property
@@ -2233,3 +2270,290 @@ class LongitudinalFollowupEntry(models.Model):
     state = models.CharField(
         choices=LongitudinalFollowupQueueState.choices, max_length=1
     )
+
+
+class PatientListingManager(models.Manager):
+    VERSION_CACHE_KEY = "patient_listing_version_%s"
+
+    def get_version(self, registry_code):
+        """
+        Returns a stamp identifying the current version of the listing of
+        the registry, so results derived from it can be cached.
+        """
+        key = self.VERSION_CACHE_KEY % registry_code
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key)
+        return version or uuid.uuid4().hex
+
+    def bump_version(self, registry_codes):
+        cache.set_many(
+            {
+                self.VERSION_CACHE_KEY % code: uuid.uuid4().hex
+                for code in registry_codes
+            },
+            None,
+        )
+
+    def refresh_patient(self, patient):
+        """
+        Updates the listing rows of the patient in each of their registries
+        from the patient's current details.
+        """
+        registries = list(patient.rdrf_registry.all())
+        details = {
+            "given_names": patient.given_names,
+            "family_name": patient.family_name,
+            "date_of_birth": patient.date_of_birth,
+            "sex": patient.sex,
+            "patient_type": patient.patient_type,
+            "living_status": patient.living_status,
+            "stage_id": patient.stage_id,
+            "last_updated_overall_at": patient.last_updated_overall_at,
+            "working_group_names": ", ".join(
+                patient.working_groups.values_list("name", flat=True)
+            ),
+        }
+        self.filter(patient=patient).exclude(registry__in=registries).delete()
+        for registry_model in registries:
+            self.update_or_create(
+                registry=registry_model, patient=patient, defaults=details
+            )
+        self.bump_version(r.code for r in registries)
+
+    def update_progress(self, progress_record):
+        """
+        Updates the listing progress columns from a saved progress record,
+        if it is for the default context of the patient.
+        """
+        context = (
+            RDRFContext.objects.filter(id=progress_record.context_id)
+            .select_related("context_form_group")
+            .first()
+        )
+        if context is None or (
+            context.context_form_group
+            and not context.context_form_group.is_default
+        ):
+            return
+        updated = self.filter(
+            registry__code=progress_record.registry_code,
+            patient_id=progress_record.django_id,
+        ).update(
+            diagnosis_progress=progress_record.data.get(
+                "diagnosis_group_progress", 0
+            ),
+            diagnosis_currency=progress_record.data.get(
+                "diagnosis_group_current", False
+            ),
+        )
+        if updated:
+            self.bump_version([progress_record.registry_code])
+
+
+class PatientListing(models.Model):
+    """
+    Denormalised copy of the patient details shown in the patient listing,
+    one row per registry of the patient, so pages of the listing can be
+    sorted and read from a single table.
+    """
+
+    registry = models.ForeignKey(
+        Registry, on_delete=models.CASCADE, related_name="+"
+    )
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="listings"
+    )
+    given_names = models.CharField(max_length=100)
+    family_name = models.CharField(max_length=100)
+    date_of_birth = models.DateField()
+    sex = models.CharField(max_length=1)
+    patient_type = models.CharField(max_length=80, blank=True, null=True)
+    living_status = models.CharField(max_length=80)
+    stage = models.ForeignKey(
+        PatientStage,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    working_group_names = models.TextField(blank=True)
+    diagnosis_progress = models.IntegerField(default=0)
+    diagnosis_currency = models.BooleanField(default=False)
+    last_updated_overall_at = models.DateTimeField(blank=True, null=True)
+
+    objects = PatientListingManager()
+
+    class Meta:
+        unique_together = ("registry", "patient")
+        indexes = (
+            models.Index(
+                name="idx_listing_name",
+                fields=("registry", "family_name", "given_names", "patient"),
+            ),
+            models.Index(
+                name="idx_listing_dob",
+                fields=("registry", "date_of_birth", "patient"),
+            ),
+            models.Index(
+                name="idx_listing_updated",
+                fields=("registry", "last_updated_overall_at", "patient"),
+            ),
+        )
+
+
+@receiver(post_save, sender=Patient)
+def refresh_patient_listing(sender, instance, raw, **kwargs):
+    if not raw:
+        PatientListing.objects.refresh_patient(instance)
+
+
+@receiver(m2m_changed, sender=Patient.working_groups.through)
+@receiver(m2m_changed, sender=Patient.rdrf_registry.through)
+def refresh_patient_listing_relations(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        instance.__dict__.pop("working_group_names", None)
+        PatientListing.objects.refresh_patient(instance)
+    elif pk_set:
+        for patient in Patient.objects.filter(pk__in=pk_set):
+            PatientListing.objects.refresh_patient(patient)
+
+
+@receiver(post_save, sender=registry.groups.models.WorkingGroup)
+def refresh_working_group_listing(sender, instance, created, raw, **kwargs):
+    if not created and not raw:
+        for patient in Patient.objects.filter(working_groups=instance):
+            PatientListing.objects.refresh_patient(patient)
+
+
+@receiver(post_save, sender=ClinicalData)
+def update_patient_listing_progress(sender, instance, raw, **kwargs):
+    if (
+        not raw
+        and instance.collection == "progress"
+        and instance.django_model == "Patient"
+    ):
+        PatientListing.objects.update_progress(instance)
+
+
+def _bump_patient_data_version(patient_ids=None):
+    clear_patient_dto_scope()
+    registries = Registry.objects.all()
+    if patient_ids is not None:
+        registries = registries.filter(patients__in=patient_ids).distinct()
+    bump_patient_data_version(registries.values_list("code", flat=True))
+
+
+@receiver(post_save, sender=ConsentValue)
+@receiver(post_delete, sender=ConsentValue)
+@receiver(post_save, sender=PatientAddress)
+@receiver(post_delete, sender=PatientAddress)
+@receiver(post_save, sender=PatientGUID)
+@receiver(post_delete, sender=PatientGUID)
+def patient_details_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _bump_patient_data_version([instance.patient_id])
+
+
+@receiver(post_save, sender=ParentGuardian)
+@receiver(pre_delete, sender=ParentGuardian)
+def parent_guardian_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _bump_patient_data_version(
+            instance.patient.values_list("id", flat=True)
+        )
+
+
+@receiver(m2m_changed, sender=Patient.working_groups.through)
+@receiver(m2m_changed, sender=Patient.registered_clinicians.through)
+@receiver(m2m_changed, sender=ParentGuardian.patient.through)
+def patient_relations_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if isinstance(instance, Patient):
+        _bump_patient_data_version([instance.pk])
+    elif pk_set:
+        _bump_patient_data_version(pk_set)
+    else:
+        # The patients of a cleared relation aren't known any more
+        _bump_patient_data_version()
+
+
+@receiver(post_save, sender=PatientRelative)
+@receiver(post_delete, sender=PatientRelative)
+@receiver(m2m_changed, sender=Patient.rdrf_registry.through)
+def patient_dto_relations_changed(sender, **kwargs):
+    # is_linked, is_index and my_index depend on the relatives and the
+    # registries of the patients
+    clear_patient_dto_scope()
+
+
+def _bump_user_patient_data_version(user_id):
+    # The reports export the user accounts of patients, parents and
+    # clinicians
+    bump_patient_data_version(
+        Registry.objects.filter(
+            Q(registry=user_id)
+            | Q(patients__user=user_id)
+            | Q(patients__parentguardian__user=user_id)
+            | Q(patients__registered_clinicians=user_id)
+        )
+        .distinct()
+        .values_list("code", flat=True)
+    )
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(pre_delete, sender=CustomUser)
+def user_changed(sender, instance, raw=False, **kwargs):
+    # Also covers logins, which save the user's last_login
+    if not raw:
+        _bump_user_patient_data_version(instance.pk)
+
+
+@receiver(m2m_changed, sender=CustomUser.working_groups.through)
+@receiver(m2m_changed, sender=CustomUser.registry.through)
+def user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _bump_user_patient_data_version(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            _bump_user_patient_data_version(user_id)
+    else:
+        _bump_patient_data_version()
+
+
+@receiver(post_save, sender=EmailPreference)
+@receiver(post_delete, sender=EmailPreference)
+def email_preference_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _bump_user_patient_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=EmailNotificationPreference)
+@receiver(post_delete, sender=EmailNotificationPreference)
+def email_notification_preference_changed(
+    sender, instance, raw=False, **kwargs
+):
+    if raw:
+        return
+    user_id = (
+        EmailPreference.objects.filter(pk=instance.user_email_preference_id)
+        .values_list("user_id", flat=True)
+        .first()
+    )
+    if user_id is not None:
+        _bump_user_patient_data_version(user_id)
+
+
+@receiver(post_save, sender=registry.groups.models.WorkingGroup)
+def working_group_changed(sender, instance, created, raw, **kwargs):
+    if not created and not raw and instance.registry_id:
+        bump_patient_data_version([instance.registry.code])
@@ -0,0 +1,232 @@
+import logging
+from datetime import datetime
+
+import graphene
+from registry.patients.models import Patient
+
+from rdrf.models.definition.models import ClinicalData, RDRFContext
+from report.schema import get_schema_field_name
+
+logger = logging.getLogger(__name__)
+
+
+def _null_on_error(resolve, *args):
+    # Mirrors graphql, which resolves a field to null if resolving it fails
+    try:
+        return resolve(*args)
+    except Exception as ex:
+        logger.warning(f"Could not resolve clinical data field: {ex}")
+        return None
+
+
+def _serialize_string(value):
+    if value is None:
+        return None
+    return graphene.String.serialize(value)
+
+
+class ClinicalDataExporter:
+    """
+    Resolves the clinical data of a report for a batch of patients using a
+    fixed number of queries, rather than the per patient queries made when
+    resolving the clinicalData field of the dynamic schema.
+
+    The result for each patient has exactly the same structure and values
+    as the clinicalData field queried by ReportBuilder, so exports are the
+    same whichever way the clinical data is resolved.
+    """
+
+    def __init__(self, clinical_data_fields, include_form_timestamp):
+        self.clinical_data_fields = clinical_data_fields
+        self.include_form_timestamp = include_form_timestamp
+
+    def resolve(self, patient_ids):
+        patient_ids = list(patient_ids)
+
+        contexts = {}
+        for context in RDRFContext.objects.filter(
+            object_id__in=patient_ids,
+            context_form_group__in=[
+                cfg_fields["cfg"]
+                for cfg_fields in self.clinical_data_fields.values()
+            ],
+        ):
+            contexts.setdefault(context.object_id, []).append(context)
+
+        clinical_data = {}
+        for clinical_datum in ClinicalData.objects.filter(
+            django_id__in=patient_ids,
+            django_model="Patient",
+            collection="cdes",
+        ).order_by("created_at", "pk"):
+            clinical_data.setdefault(clinical_datum.django_id, []).append(
+                clinical_datum
+            )
+
+        patients = {}
+        if any(
+            not cfg_fields["cfg"].is_fixed
+            for cfg_fields in self.clinical_data_fields.values()
+        ):
+            # Only needed to name the contexts of longitudinal forms
+            patients = Patient.objects.in_bulk(patient_ids)
+
+        return {
+            patient_id: self._resolve_patient(
+                patients.get(patient_id),
+                contexts.get(patient_id, []),
+                clinical_data.get(patient_id, []),
+            )
+            for patient_id in patient_ids
+        }
+
+    def _resolve_patient(self, patient, contexts, clinical_data):
+        return {
+            get_schema_field_name(cfg_code): _null_on_error(
+                self._resolve_cfg, patient, contexts, clinical_data, cfg_fields
+            )
+            for cfg_code, cfg_fields in self.clinical_data_fields.items()
+        }
+
+    def _resolve_cfg(self, patient, contexts, clinical_data, cfg_fields):
+        cfg = cfg_fields["cfg"]
+        cfg_contexts = {
+            context.id: context
+            for context in contexts
+            if context.context_form_group_id == cfg.id
+        }
+
+        if not cfg_contexts:
+            return None
+
+        cfg_clinical_data = [
+            clinical_datum
+            for clinical_datum in clinical_data
+            if clinical_datum.context_id in cfg_contexts
+        ]
+
+        resolve_form = (
+            self._resolve_fixed_form
+            if cfg.is_fixed
+            else self._resolve_longitudinal_form
+        )
+        return {
+            get_schema_field_name(form_name): _null_on_error(
+                resolve_form,
+                patient,
+                cfg,
+                cfg_contexts,
+                cfg_clinical_data,
+                form_fields,
+            )
+            for form_name, form_fields in cfg_fields["forms"].items()
+        }
+
+    def _resolve_fixed_form(
+        self, _patient, _cfg, _contexts, clinical_data, form_fields
+    ):
+        if len(clinical_data) != 1:
+            # More than one record is an error when resolving the schema
+            return None
+
+        clinical_datum = clinical_data[0]
+        for form_data in clinical_datum.data["forms"]:
+            if form_data["name"] == form_fields["form"].name:
+                result = {}
+                if self.include_form_timestamp:
+                    result["meta"] = self._resolve_form_meta(
+                        clinical_datum, form_fields
+                    )
+                result.update(self._resolve_sections(form_data, form_fields))
+                return result
+
+        return None
+
+    def _resolve_longitudinal_form(
+        self, patient, cfg, contexts, clinical_data, form_fields
+    ):
+        form_data_list = []
+        for clinical_datum in clinical_data:
+            for form_data in clinical_datum.data["forms"]:
+                if form_data["name"] == form_fields["form"].name:
+                    result = {
+                        "key": _null_on_error(
+                            lambda: _serialize_string(
+                                cfg.get_name_from_cde(
+                                    patient, contexts[clinical_datum.context_id]
+                                )
+                            )
+                        )
+                    }
+                    if self.include_form_timestamp:
+                        result["meta"] = self._resolve_form_meta(
+                            clinical_datum, form_fields
+                        )
+                    result["data"] = self._resolve_sections(
+                        form_data, form_fields
+                    )
+                    form_data_list.append(result)
+
+        return form_data_list
+
+    @staticmethod
+    def _resolve_form_meta(clinical_datum, form_fields):
+        def resolve_last_updated():
+            form_timestamp = clinical_datum.data.get(
+                f"{form_fields['form'].name}_timestamp"
+            )
+            if form_timestamp is None:
+                return None
+            return graphene.DateTime.serialize(
+                datetime.fromisoformat(form_timestamp)
+            )
+
+        return {"lastUpdated": _null_on_error(resolve_last_updated)}
+
+    def _resolve_sections(self, form_data, form_fields):
+        return {
+            get_schema_field_name(section_code): _null_on_error(
+                self._resolve_section, form_data, section_fields
+            )
+            for section_code, section_fields in form_fields["sections"].items()
+        }
+
+    def _resolve_section(self, form_data, section_fields):
+        section = section_fields["section"]
+        for section_data in form_data["sections"]:
+            if section_data["code"] == section.code:
+                cdes = section_data["cdes"]
+                if cdes is None:
+                    return None
+                if section.allow_multiple:
+                    return [
+                        _null_on_error(self._resolve_cdes, item, section_fields)
+                        for item in cdes
+                    ]
+                return self._resolve_cdes(cdes, section_fields)
+
+        return None
+
+    @staticmethod
+    def _resolve_cdes(cdes, section_fields):
+        if cdes is None:
+            return None
+
+        def resolve_cde(cde_model):
+            for cde_value in cdes:
+                if cde_value["code"] == cde_model.code:
+                    value = cde_model.display_value(cde_value["value"])
+                    if value is None:
+                        return None
+                    if cde_model.allow_multiple:
+                        return [_serialize_string(item) for item in value]
+                    return _serialize_string(value)
+
+            return None
+
+        return {
+            get_schema_field_name(cde_model.code): _null_on_error(
+                resolve_cde, cde_model
+            )
+            for cde_model in section_fields["cdes"]
+        }
@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+
+from report.report_jobs import (
+    claim_next_report_job,
+    purge_expired_report_jobs,
+    requeue_stalled_report_jobs,
+    run_report_job,
+)
+
+
+class Command(BaseCommand):
+    help = "Generates queued report downloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no more queued reports",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=int,
+            default=10,
+            help="Seconds to wait between checks for queued reports",
+        )
+        parser.add_argument(
+            "--stalled-after",
+            type=int,
+            default=30 * 60,
+            help="Seconds after which a running report that hasn't made "
+            "progress is requeued",
+        )
+
+    def handle(self, *args, **options):
+        stalled_after = timedelta(seconds=options["stalled_after"])
+
+        while True:
+            requeued = requeue_stalled_report_jobs(stalled_after)
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stalled report(s)")
+            purge_expired_report_jobs()
+
+            while job := claim_next_report_job():
+                run_report_job(job)
+                self.stdout.write(
+                    f"Report job {job.id}: {job.get_state_display()}"
+                )
+
+            if options["once"]:
+                break
+            time.sleep(options["poll_interval"])
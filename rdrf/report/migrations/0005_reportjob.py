@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('report', '0004_alter_reportdesign_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('json', 'JSON')], max_length=4)),
+                ('state', models.CharField(choices=[('Q', 'Queued'), ('R', 'Running'), ('S', 'Succeeded'), ('F', 'Failed')], default='Q', max_length=1)),
+                ('cache_key', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('patients_total', models.PositiveIntegerField(blank=True, null=True)),
+                ('patients_exported', models.PositiveIntegerField(default=0)),
+                ('result', models.FileField(blank=True, null=True, upload_to='reports')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('report_design', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='report.reportdesign')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(condition=models.Q(('state__in', ['Q', 'R'])), fields=['state'], name='idx_report_job_pending')],
+            },
+        ),
+    ]
@@ -100,3 +100,65 @@ class ReportDemographicField(models.Model):
 
     class Meta:
         ordering = ["sort_order"]
+
+
+class ReportJobState(models.TextChoices):
+    QUEUED = "Q", _("Queued")
+    RUNNING = "R", _("Running")
+    SUCCEEDED = "S", _("Succeeded")
+    FAILED = "F", _("Failed")
+
+
+class ReportJob(models.Model):
+    FORMATS = (("csv", "CSV"), ("json", "JSON"))
+
+    report_design = models.ForeignKey(
+        ReportDesign, related_name="jobs", on_delete=models.CASCADE
+    )
+    user = models.ForeignKey("groups.CustomUser", on_delete=models.CASCADE)
+    format = models.CharField(max_length=4, choices=FORMATS)
+    state = models.CharField(
+        max_length=1,
+        choices=ReportJobState.choices,
+        default=ReportJobState.QUEUED,
+    )
+    # Identifies the report design and data the result was generated from
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)
+    patients_total = models.PositiveIntegerField(null=True, blank=True)
+    patients_exported = models.PositiveIntegerField(default=0)
+    result = models.FileField(upload_to="reports", null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = (
+            models.Index(
+                name="idx_report_job_pending",
+                fields=("state",),
+                condition=models.Q(
+                    state__in=[ReportJobState.QUEUED, ReportJobState.RUNNING]
+                ),
+            ),
+        )
+
+    @property
+    def is_finished(self):
+        return self.state in (ReportJobState.SUCCEEDED, ReportJobState.FAILED)
+
+    @property
+    def progress(self):
+        if self.state == ReportJobState.SUCCEEDED:
+            return 100
+        if not self.patients_total:
+            return 0
+        return min(100, 100 * self.patients_exported // self.patients_total)
+
+    @property
+    def filename(self):
+        return f"report_{self.report_design.title}.{self.format}"
+
+    def __str__(self):
+        return f"{self.report_design} ({self.format}) for {self.user}"
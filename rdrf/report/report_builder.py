@@ -19,8 +19,9 @@ from rdrf.patients.query_data import (
     get_all_patients,
 )
 from report.clinical_data_csv_util import ClinicalDataCsvUtil
+from report.clinical_data_export import ClinicalDataExporter
 from report.models import ReportCdeHeadingFormat
-from report.schema import codify, create_dynamic_schema, get_schema_field_name
+from report.schema import codify, get_dynamic_schema, get_schema_field_name
 from report.utils import (
     get_flattened_json_path,
     get_graphql_result_value,
@@ -31,12 +32,16 @@ logger = logging.getLogger(__name__)
 
 
 class ReportBuilder:
+    # Number of patients exported per query
+    export_batch_size = 1000
+
     def __init__(self, report_design):
         self.report_design = report_design
+        self.variants = {}
         self.report_config = load_report_configuration()["demographic_model"]
         self.report_fields_lookup = self.__init_report_fields_lookup()
         self.patient_filters = self.__init_patient_filters()
-        self.schema = create_dynamic_schema()
+        self.schema = get_dynamic_schema()
 
     def __init_report_fields_lookup(self):
         return {
@@ -66,6 +71,15 @@ class ReportBuilder:
         return build_patient_filters(filters)
 
     def __get_variants(self, lookup_key, request):
+        # The variants determine the report columns, so they are looked up
+        # once per report rather than for every batch of exported patients
+        if lookup_key not in self.variants:
+            self.variants[lookup_key] = self.__query_variants(
+                lookup_key, request
+            )
+        return self.variants[lookup_key]
+
+    def __query_variants(self, lookup_key, request):
         query_data_summary = build_data_summary_query([lookup_key])
         operation_input, query_input, variables = self.patient_filters
         query = build_all_patients_query(
@@ -135,65 +149,7 @@ class ReportBuilder:
                     )
         return queries
 
-    def _get_graphql_query(self, request, offset=None, limit=None):
-        # Build Pagination filters
-        pagination_args = {}
-        if offset:
-            pagination_args["offset"] = offset
-
-        if limit:
-            pagination_args["limit"] = limit
-
-        # Build simple patient demographic fields
-        patient_fields = []
-        patient_fields.extend(
-            self.report_design.reportdemographicfield_set.filter(
-                model="patient"
-            ).values_list("field", flat=True)
-        )
-
-        # Build list of other demographic fields to report on, group by model
-        other_demographic_fields = {}
-        for (
-            demographic_field
-        ) in self.report_design.reportdemographicfield_set.exclude(
-            model="patient"
-        ):
-            other_demographic_fields.setdefault(
-                demographic_field.model, []
-            ).append(demographic_field.field)
-
-        fields_nested_demographics = []
-        for model_name, fields in other_demographic_fields.items():
-            if model_name in self.report_config:
-                model_config = self.report_config[model_name]
-            else:
-                continue
-
-            if model_config.get("pivot", False):
-                # Lookup the variants of this item which will form the column header groupings
-                # e.g. for consents, returns a list of the unique consent codes
-                variants = self.__get_variants(
-                    model_config.get("variant_lookup"), request
-                )
-
-                # For each grouping, generate the query containing each of the fields selected
-                col_queries = self._build_query_from_variants(variants, fields)
-
-                if col_queries:
-                    fields_nested_demographics.append(
-                        GqlQuery()
-                        .fields(col_queries)
-                        .query(model_name)
-                        .generate()
-                    )
-            else:
-                fields_demographic = (
-                    GqlQuery().fields(fields).query(model_name).generate()
-                )
-                fields_nested_demographics.append(fields_demographic)
-
-        # Build Clinical data
+    def _get_clinical_data_fields(self):
         # Order by ID for the benefit of the unit tests to ensure the graphql query is generated in a predictable order
         # However, the order of the clinical data in a CSV export is currently determined by the order it appears in a
         # patient's clinical record. Revisit this in the future if there's a need to allow the user to set the order on
@@ -228,21 +184,21 @@ class ReportBuilder:
             if cde not in section_cdes or section not in form_sections:
                 invalid_cdes.append(cde.code)
 
-            cfg_dict = cfg_dicts.setdefault(
-                cfg.code, {"is_fixed": cfg.is_fixed, "forms": {}}
-            )
+            cfg_dict = cfg_dicts.setdefault(cfg.code, {"cfg": cfg, "forms": {}})
             form_dict = cfg_dict["forms"].setdefault(
-                form.name, {"sections": {}}
+                form.name, {"form": form, "sections": {}}
             )
             section_dict = form_dict["sections"].setdefault(
-                section.code, {"cdes": []}
+                section.code, {"section": section, "cdes": []}
             )
-            section_dict["cdes"].append(cde.code)
+            section_dict["cdes"].append(cde)
 
         if invalid_cdes:
             raise BadKeyError(invalid_cdes)
 
-        # - build the clinical data query
+        return cfg_dicts
+
+    def _get_clinical_data_query(self, cfg_dicts):
         fields_clinical_data = []
         for cfg_code, cfg in cfg_dicts.items():
             fields_form = []
@@ -255,7 +211,10 @@ class ReportBuilder:
                     field_section = (
                         GqlQuery()
                         .fields(
-                            map(get_schema_field_name, section["cdes"]),
+                            [
+                                get_schema_field_name(cde.code)
+                                for cde in section["cdes"]
+                            ],
                             name=get_schema_field_name(section_code),
                         )
                         .generate()
@@ -269,7 +228,7 @@ class ReportBuilder:
                         .generate()
                     )
 
-                if cfg["is_fixed"]:
+                if cfg["cfg"].is_fixed:
                     field_form = (
                         GqlQuery()
                         .fields(
@@ -302,10 +261,86 @@ class ReportBuilder:
             )
             fields_clinical_data.append(field_cfg)
 
+        return fields_clinical_data
+
+    def _get_graphql_query(
+        self,
+        request,
+        offset=None,
+        limit=None,
+        include_clinical_data=True,
+        include_patient_id=False,
+    ):
+        # Build Pagination filters
+        pagination_args = {}
+        if offset:
+            pagination_args["offset"] = offset
+
+        if limit:
+            pagination_args["limit"] = limit
+
+        # Build simple patient demographic fields
+        patient_fields = []
+        patient_fields.extend(
+            self.report_design.reportdemographicfield_set.filter(
+                model="patient"
+            ).values_list("field", flat=True)
+        )
+
+        # Build list of other demographic fields to report on, group by model
+        other_demographic_fields = {}
+        for (
+            demographic_field
+        ) in self.report_design.reportdemographicfield_set.exclude(
+            model="patient"
+        ):
+            other_demographic_fields.setdefault(
+                demographic_field.model, []
+            ).append(demographic_field.field)
+
+        fields_nested_demographics = []
+        for model_name, fields in other_demographic_fields.items():
+            if model_name in self.report_config:
+                model_config = self.report_config[model_name]
+            else:
+                continue
+
+            if model_config.get("pivot", False):
+                # Lookup the variants of this item which will form the column header groupings
+                # e.g. for consents, returns a list of the unique consent codes
+                variants = self.__get_variants(
+                    model_config.get("variant_lookup"), request
+                )
+
+                # For each grouping, generate the query containing each of the fields selected
+                col_queries = self._build_query_from_variants(variants, fields)
+
+                if col_queries:
+                    fields_nested_demographics.append(
+                        GqlQuery()
+                        .fields(col_queries)
+                        .query(model_name)
+                        .generate()
+                    )
+            else:
+                fields_demographic = (
+                    GqlQuery().fields(fields).query(model_name).generate()
+                )
+                fields_nested_demographics.append(fields_demographic)
+
+        # Build Clinical data
+        fields_clinical_data = []
+        if include_clinical_data:
+            fields_clinical_data = self._get_clinical_data_query(
+                self._get_clinical_data_fields()
+            )
+
         # Build query
         fields_patient = []
         fields_patient.extend(patient_fields)
         fields_patient.extend(fields_nested_demographics)
+        if include_patient_id and "id" not in patient_fields:
+            fields_patient.append("id")
         if fields_clinical_data:
             fields_patient.append(
                 GqlQuery()
@@ -512,31 +547,83 @@ class ReportBuilder:
             "duplicate_headers": duplicate_headings
         }
 
-    def export_to_json(self, request):
-        limit = 20
+    def count_patients(self, request):
+        operation_input, query_input, variables = self.patient_filters
+        query = build_all_patients_query(
+            self.report_design.registry, ["total"], query_input, operation_input
+        )
+        result = self.schema.execute(
+            query, variable_values=variables, context_value=request
+        )
+        return get_all_patients(result, self.report_design.registry).get(
+            "total"
+        )
+
+    def _export_patients(self, request, progress_callback=None):
+        """
+        Yields the report data for batches of patients.
+
+        Demographic data is queried via the graphql schema, while the
+        clinical data is resolved in bulk for each batch of patients.
+        """
+        clinical_data_fields = self._get_clinical_data_fields()
+        clinical_data_exporter = None
+        if clinical_data_fields:
+            clinical_data_exporter = ClinicalDataExporter(
+                clinical_data_fields,
+                self.report_design.cde_include_form_timestamp,
+            )
+
+        include_patient_id = (
+            self.report_design.reportdemographicfield_set.filter(
+                model="patient", field="id"
+            ).exists()
+        )
+
+        limit = self.export_batch_size
         offset = 0
 
         while True:
             variables, query = self._get_graphql_query(
-                request, offset=offset, limit=limit
+                request,
+                offset=offset,
+                limit=limit,
+                include_clinical_data=False,
+                include_patient_id=True,
             )
             result = self.schema.execute(
                 query, variable_values=variables, context_value=request
             )
-            all_patients = get_all_patients(
+            patients = get_all_patients(
                 result, self.report_design.registry
             ).get("patients")
-            num_patients = len(all_patients)
-            offset += num_patients
 
-            for patient in all_patients:
-                patient_json = json.dumps(patient)
-                yield f"{patient_json}\n"
+            if clinical_data_exporter:
+                clinical_data = clinical_data_exporter.resolve(
+                    int(patient["id"]) for patient in patients
+                )
+
+            for patient in patients:
+                patient_id = int(patient["id"])
+                if not include_patient_id:
+                    del patient["id"]
+                if clinical_data_exporter:
+                    patient["clinicalData"] = clinical_data[patient_id]
+
+            yield patients
+
+            if progress_callback:
+                progress_callback(len(patients))
 
-            if num_patients < limit:
+            offset += len(patients)
+            if len(patients) < limit:
                 break
 
-    def export_to_csv(self, request):
+    def export_to_json(self, request, progress_callback=None):
+        for patients in self._export_patients(request, progress_callback):
+            yield "".join(f"{json.dumps(patient)}\n" for patient in patients)
+
+    def export_to_csv(self, request, progress_callback=None):
         # Purpose of BOM:
         # - Required by MS Excel to correctly load content in UTF-8, otherwise encoding is ignored.
         # - Quick response back to browser to prevent cloudfront from timing out.
@@ -556,31 +643,11 @@ class ReportBuilder:
         yield output.getvalue()
 
         # Build/Chunk Patient Data
-        limit = 20
-        num_patients = 20
-        offset = 0
-
-        while num_patients >= limit:
-            variables, query = self._get_graphql_query(
-                request, offset=offset, limit=limit
-            )
-            result = self.schema.execute(
-                query, variable_values=variables, context_value=request
-            )
-            flat_patient_data = [
-                flatten(p)
-                for p in get_all_patients(
-                    result, self.report_design.registry
-                ).get("patients")
-            ]
-
-            num_patients = len(flat_patient_data)
-            offset += num_patients
-
+        for patients in self._export_patients(request, progress_callback):
             output = io.StringIO()
             data_writer = csv.DictWriter(
                 output, fieldnames=(headers.keys()), extrasaction="ignore"
             )
-            data_writer.writerows(flat_patient_data)
+            data_writer.writerows(flatten(p) for p in patients)
 
             yield output.getvalue()
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from registry.patients.models import Patient
+
+from rdrf.helpers.definition_version import (
+    definition_version_scope,
+    get_definition_version,
+)
+from rdrf.helpers.patient_data_version import get_patient_data_version
+from rdrf.models.definition.models import ClinicalData
+from report.models import ReportJob, ReportJobState
+from report.report_builder import ReportBuilder
+
+logger = logging.getLogger(__name__)
+
+
+class ReportJobContext:
+    """
+    Stands in for the request when a report is exported outside of one.
+    The report is generated with the access of the user who requested it.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+
+def _report_design_snapshot(report_design):
+    return {
+        "registry": report_design.registry_id,
+        "cde_heading_format": report_design.cde_heading_format,
+        "cde_include_form_timestamp": report_design.cde_include_form_timestamp,
+        "filter_working_groups": sorted(
+            report_design.filter_working_groups.values_list("id", flat=True)
+        ),
+        "filter_consents": sorted(
+            report_design.filter_consents.values_list("id", flat=True)
+        ),
+        "demographic_fields": list(
+            report_design.reportdemographicfield_set.order_by(
+                "sort_order", "id"
+            ).values_list("model", "field")
+        ),
+        "clinical_data_fields": list(
+            report_design.reportclinicaldatafield_set.order_by(
+                "id"
+            ).values_list("context_form_group_id", "cde_key")
+        ),
+    }
+
+
+def _data_snapshot(registry):
+    def snapshot(queryset, *timestamp_fields):
+        return queryset.aggregate(
+            count=Count("id"),
+            max_id=Max("id"),
+            **{field: Max(field) for field in timestamp_fields},
+        )
+
+    return {
+        "patients": snapshot(
+            Patient.objects.filter(rdrf_registry=registry),
+            "last_updated_at",
+            "last_updated_overall_at",
+        ),
+        "clinical_data": snapshot(
+            ClinicalData.objects.filter(
+                registry_code=registry.code, collection="cdes"
+            ),
+            "last_updated_at",
+        ),
+        # Consents, addresses, parents, working groups, user accounts,
+        # email preferences, ... don't change the patient timestamps
+        "patient_details": get_patient_data_version(registry.code),
+    }
+
+
+def report_cache_key(report_design, user, format):
+    """
+    Returns a key identifying the result of exporting the report design
+    for the user, which changes when the design, the registry definition
+    or the registry's patient details or clinical data change.
+    """
+    key = {
+        "format": format,
+        "user": user.id,
+        "definition_version": get_definition_version(),
+        "report_design": _report_design_snapshot(report_design),
+        "data": _data_snapshot(report_design.registry),
+    }
+    return hashlib.sha256(
+        json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def submit_report_job(report_design, user, format):
+    """
+    Queues a job to export the report, unless an export of the same report
+    and data is already queued, running or available for download.
+    """
+    cache_key = report_cache_key(report_design, user, format)
+    existing_job = (
+        ReportJob.objects.filter(
+            cache_key=cache_key,
+            created_at__gte=timezone.now()
+            - timedelta(seconds=settings.REPORT_JOB_MAX_AGE),
+        )
+        .exclude(state=ReportJobState.FAILED)
+        .order_by("-created_at")
+        .first()
+    )
+    if existing_job:
+        logger.info(f"Reusing report job {existing_job.id}")
+        return existing_job
+
+    return ReportJob.objects.create(
+        report_design=report_design,
+        user=user,
+        format=format,
+        cache_key=cache_key,
+    )
+
+
+def claim_next_report_job():
+    with transaction.atomic():
+        job = (
+            ReportJob.objects.select_for_update(skip_locked=True)
+            .filter(state=ReportJobState.QUEUED)
+            .order_by("created_at")
+            .first()
+        )
+        if job:
+            job.state = ReportJobState.RUNNING
+            job.save(update_fields=["state", "last_updated_at"])
+    return job
+
+
+def run_report_job(job):
+    logger.info(f"Running report job {job.id}")
+    context = ReportJobContext(job.user)
+    report = ReportBuilder(job.report_design)
+
+    def update_progress(num_patients):
+        job.patients_exported += num_patients
+        job.save(update_fields=["patients_exported", "last_updated_at"])
+
+    try:
+        job.patients_total = report.count_patients(context)
+        job.patients_exported = 0
+        job.save(
+            update_fields=[
+                "patients_total",
+                "patients_exported",
+                "last_updated_at",
+            ]
+        )
+
+        if job.format == "csv":
+            content = report.export_to_csv(context, update_progress)
+        else:
+            content = report.export_to_json(context, update_progress)
+
+        # The whole report is exported with the same registry definition
+        with (
+            tempfile.TemporaryFile() as result_file,
+            definition_version_scope(),
+        ):
+            for chunk in content:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                result_file.write(chunk)
+            result_file.seek(0)
+            job.result.save(
+                f"report_job_{job.id}.{job.format}",
+                File(result_file),
+                save=False,
+            )
+
+        job.state = ReportJobState.SUCCEEDED
+    except Exception as ex:
+        logger.exception(f"Report job {job.id} failed")
+        job.state = ReportJobState.FAILED
+        job.error = str(ex)
+
+    job.finished_at = timezone.now()
+    job.save()
+
+
+def requeue_stalled_report_jobs(stalled_after):
+    """
+    Requeues running jobs which haven't made progress for a while, which
+    happens when the worker running them stopped before they finished.
+    """
+    return ReportJob.objects.filter(
+        state=ReportJobState.RUNNING,
+        last_updated_at__lt=timezone.now() - stalled_after,
+    ).update(
+        state=ReportJobState.QUEUED,
+        patients_exported=0,
+        last_updated_at=timezone.now(),
+    )
+
+
+def purge_expired_report_jobs():
+    expired_jobs = ReportJob.objects.filter(
+        created_at__lt=timezone.now()
+        - timedelta(seconds=settings.REPORT_JOB_MAX_AGE),
+        state__in=[ReportJobState.SUCCEEDED, ReportJobState.FAILED],
+    )
+    for job in expired_jobs:
+        if job.result:
+            job.result.delete(save=False)
+        job.delete()
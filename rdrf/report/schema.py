@@ -1,5 +1,6 @@
 import logging
 import re
+import threading
 from datetime import datetime
 from functools import partial
 from importlib import import_module
@@ -28,6 +29,7 @@ from registry.patients.models import (
 from useraudit.models import LoginLog
 
 from rdrf.forms.dsl.parse_utils import prefetch_form_data
+from rdrf.helpers.definition_version import get_definition_version
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.models.definition.models import (
     ClinicalData,
@@ -593,17 +595,17 @@ def get_clinical_data_fields(registry):
 
         def cfg_resolver(parent, _info, cfg_model):
             patient, clinical_data = parent
-            contexts = RDRFContext.objects.filter(
-                object_id=patient.id, context_form_group=cfg_model.id
-            )
+            contexts = get_batch_loader(patient).contexts(patient, cfg_model)
 
             if not contexts:
                 return None
 
-            # TODO: better query
-            cfg_clinical_data = clinical_data.filter(
-                context_id__in=[context.id for context in contexts]
-            )
+            context_ids = {context.id for context in contexts}
+            cfg_clinical_data = [
+                clinical_datum
+                for clinical_datum in clinical_data
+                if clinical_datum.context_id in context_ids
+            ]
 
             return patient, contexts, cfg_clinical_data
 
@@ -703,7 +705,7 @@ def get_patient_fields():
 def get_consent_question_fields(consent_section):
     def consent_question_resolver(parent, _info, consent_question):
         patient, consents = parent
-        return consents.filter(consent_question=consent_question).first()
+        return consents.get(consent_question.id)
 
     consent_fields = {}
     for consent_question in consent_section.questions.all():
@@ -740,7 +742,11 @@ def patient_working_groups(patient):
 def create_working_group_types_fields(registry):
     def working_groups_resolver(parent, _info, working_group_type):
         patient, working_groups = parent
-        return working_groups.filter(type=working_group_type)
+        return [
+            working_group
+            for working_group in working_groups
+            if working_group.type_id == working_group_type.id
+        ]
 
     fields = {}
     for working_group_type in registry.working_group_types.all():
@@ -796,29 +802,147 @@ def create_dynamic_facet_type(registry):
     return type(f"DynamicFacet_{registry.code}", (ObjectType,), facet_fields)
 
 
+class PatientBatchLoader:
+    """
+    Loads data related to a page of patients in bulk, DataLoader style.
+
+    The first time a relation is requested for any of the patients, it is
+    loaded for all of them with a single query, so resolving a page of
+    patients doesn't take a query per patient for each relation.
+    """
+
+    def __init__(self, patients):
+        self.patients = patients
+        self._relations = {}
+
+    def _load(self, relation, load_fn):
+        if relation not in self._relations:
+            self._relations[relation] = load_fn(
+                [patient.id for patient in self.patients]
+            )
+        return self._relations[relation]
+
+    @staticmethod
+    def _load_consent_values(patient_ids):
+        consent_values = {}
+        for consent_value in ConsentValue.objects.filter(
+            patient_id__in=patient_ids
+        ):
+            consent_values.setdefault(consent_value.patient_id, {})[
+                consent_value.consent_question_id
+            ] = consent_value
+        return consent_values
+
+    @staticmethod
+    def _load_contexts(patient_ids):
+        contexts = {}
+        for context in RDRFContext.objects.filter(object_id__in=patient_ids):
+            contexts.setdefault(
+                (context.object_id, context.context_form_group_id), []
+            ).append(context)
+        return contexts
+
+    @staticmethod
+    def _load_clinical_data(patient_ids):
+        clinical_data = {}
+        for clinical_datum in ClinicalData.objects.filter(
+            django_id__in=patient_ids, django_model="Patient", collection="cdes"
+        ).order_by("created_at"):
+            clinical_data.setdefault(clinical_datum.django_id, []).append(
+                clinical_datum
+            )
+        return clinical_data
+
+    @staticmethod
+    def _load_email_preferences(user_ids):
+        return {
+            email_preference.user_id: email_preference
+            for email_preference in EmailPreference.objects.filter(
+                user_id__in=[user_id for user_id in user_ids if user_id]
+            )
+        }
+
+    @staticmethod
+    def _load_parent_user_ids(patient_ids):
+        parent_user_ids = {}
+        for patient_id, user_id in (
+            ParentGuardian.patient.through.objects.filter(
+                patient_id__in=patient_ids
+            )
+            .order_by("parentguardian_id")
+            .values_list("patient_id", "parentguardian__user_id")
+        ):
+            # Only the first parent of each patient is reported on
+            parent_user_ids.setdefault(patient_id, user_id)
+        return parent_user_ids
+
+    def consent_values(self, patient):
+        """Returns the patient's consent values by consent question id"""
+        return self._load("consent_values", self._load_consent_values).get(
+            patient.id, {}
+        )
+
+    def contexts(self, patient, context_form_group):
+        return self._load("contexts", self._load_contexts).get(
+            (patient.id, context_form_group.id), []
+        )
+
+    def clinical_data(self, patient):
+        return self._load("clinical_data", self._load_clinical_data).get(
+            patient.id, []
+        )
+
+    def patient_email_preference(self, patient):
+        return self._load(
+            "patient_email_preferences",
+            lambda _patient_ids: self._load_email_preferences(
+                [page_patient.user_id for page_patient in self.patients]
+            ),
+        ).get(patient.user_id)
+
+    def parent_email_preference(self, patient):
+        parent_user_ids = self._load("parent_users", self._load_parent_user_ids)
+        return self._load(
+            "parent_email_preferences",
+            lambda _patient_ids: self._load_email_preferences(
+                parent_user_ids.values()
+            ),
+        ).get(parent_user_ids.get(patient.id))
+
+
+def with_batch_loader(patients):
+    patients = list(patients)
+    batch_loader = PatientBatchLoader(patients)
+    for patient in patients:
+        patient.batch_loader = batch_loader
+    return patients
+
+
+def get_batch_loader(patient):
+    # Patients resolved outside of allPatients are loaded on their own
+    batch_loader = getattr(patient, "batch_loader", None)
+    if batch_loader is None:
+        batch_loader = PatientBatchLoader([patient])
+        patient.batch_loader = batch_loader
+    return batch_loader
+
+
 def create_dynamic_patient_type(registry):
     def consent_values_resolver(patient, _info):
-        return patient, ConsentValue.objects.filter(patient=patient)
+        return patient, get_batch_loader(patient).consent_values(patient)
 
     def working_group_type_values_resolver(patient, _info):
+        # Working groups are prefetched by list_patients_query
         return patient, patient.working_groups.all()
 
     def clinical_data_resolver(patient, _info):
-        return patient, ClinicalData.objects.filter(
-            django_id=patient.id, django_model="Patient", collection="cdes"
-        ).order_by("created_at").all()
+        return patient, get_batch_loader(patient).clinical_data(patient)
 
     def patient_email_preferences_resolver(patient, _info):
-        return EmailPreference.objects.get_by_user(patient.user)
+        return get_batch_loader(patient).patient_email_preference(patient)
 
     def parent_email_preferences_resolver(patient, _info):
-        parent = ParentGuardian.objects.filter(patient=patient).first()
-
-        return (
-            None
-            if parent is None
-            else EmailPreference.objects.get_by_user(parent.user)
-        )
+        return get_batch_loader(patient).parent_email_preference(patient)
 
     schema_module = import_module(settings.SCHEMA_MODULE)
     patient_fields_func = getattr(
@@ -977,7 +1101,7 @@ def create_dynamic_all_patients_type(registry):
         all_patients = parent.all_patients
 
         if id:
-            return all_patients.filter(id=id)
+            return with_batch_loader(all_patients.filter(id=id))
 
         if sort:
             validate_sort_fields(sort)
@@ -986,7 +1110,7 @@ def create_dynamic_all_patients_type(registry):
 
         if limit and offset:
             limit += offset
-        return all_patients[offset:limit]
+        return with_batch_loader(all_patients[offset:limit])
 
     dynamic_query = type(
         f"DynamicAllPatients_{registry.code}",
@@ -1034,43 +1158,43 @@ class PatientFilterType(InputObjectType):
         self.consent_checks = True
 
 
-def create_dynamic_registry_type(registry):
+def search_patients(patient_query, search):
     def sanitise_search_field(field):
         return Unaccent(Replace(field, Value("'"), Value("")))
 
+    for i, search_def in enumerate(search):
+        search_text = sanitise_search_field(Value(search_def.text))
+
+        validate_fields(search_def.fields, _valid_search_fields, "search field")
+        search_fields = [to_snake_case(field) for field in search_def.fields]
+
+        search_annotations = {
+            f"sanitised_{i}_{field}": sanitise_search_field(field)
+            for field in search_fields
+        }
+        search_annotations.update(
+            {
+                f"search_{i}": (
+                    SearchVector(*search_annotations.keys(), config="simple")
+                )
+            }
+        )
+
+        patient_query = patient_query.annotate(**search_annotations).filter(
+            **{f"search_{i}__icontains": search_text}
+        )
+
+    return patient_query
+
+
+def create_dynamic_registry_type(registry):
     def resolve_all_patients(registry, _info, filter_args=PatientFilterType()):
         all_patients = list_patients_query(
             _info.context.user, registry, filter_args
         )
 
         if filter_args.search:
-            for i, search_def in enumerate(filter_args.search):
-                search_text = sanitise_search_field(Value(search_def.text))
-
-                validate_fields(
-                    search_def.fields, _valid_search_fields, "search field"
-                )
-                search_fields = [
-                    to_snake_case(field) for field in search_def.fields
-                ]
-
-                search_annotations = {
-                    f"sanitised_{i}_{field}": sanitise_search_field(field)
-                    for field in search_fields
-                }
-                search_annotations.update(
-                    {
-                        f"search_{i}": (
-                            SearchVector(
-                                *search_annotations.keys(), config="simple"
-                            )
-                        )
-                    }
-                )
-
-                all_patients = all_patients.annotate(
-                    **search_annotations
-                ).filter(**{f"search_{i}__icontains": search_text})
+            all_patients = search_patients(all_patients, filter_args.search)
 
         return QueryResult(registry=registry, all_patients=all_patients)
 
@@ -1091,6 +1215,11 @@ def create_dynamic_registry_type(registry):
 # TODO: Replace partial resolvers with single resolve function for each level
 # TODO: Replace Metaprogramming with a low-level library like graphql-core
 def create_dynamic_schema():
+    """
+    Builds the dynamic schema from the current registry definitions.
+    This is expensive for large registries, use get_dynamic_schema to get
+    the cached schema instead.
+    """
     if not Registry.objects.all().exists():
         return None
 
@@ -1116,3 +1245,20 @@ def create_dynamic_schema():
     )
 
     return graphene.Schema(query=dynamic_query)
+
+
+_schema_cache = {}
+_schema_cache_lock = threading.Lock()
+
+
+def get_dynamic_schema():
+    """
+    Returns the dynamic schema built for the current registry definition
+    version, building it at most once per process and version.
+    """
+    version = get_definition_version()
+    with _schema_cache_lock:
+        if _schema_cache.get("version") != version:
+            _schema_cache["schema"] = create_dynamic_schema()
+            _schema_cache["version"] = version
+        return _schema_cache["schema"]
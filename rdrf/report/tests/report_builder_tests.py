@@ -1,25 +1,34 @@
+import csv
+import io
+import json
 from collections import OrderedDict
 from datetime import datetime
 
+from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
+from flatten_json import flatten
 from graphql import parse, print_ast
 
 from rdrf.models.definition.models import (
     Registry,
+    ClinicalData,
     ConsentSection,
     ConsentQuestion,
     RegistryForm,
     Section,
     CommonDataElement,
     ContextFormGroup,
+    RDRFContext,
 )
 from registry.groups.models import WorkingGroup, CustomUser
 from registry.patients.models import Patient, AddressType
 from report.models import ReportDesign, ReportCdeHeadingFormat
+from report.clinical_data_csv_util import ClinicalDataCsvUtil
 from report.report_builder import ReportBuilder
 
 
 class ReportGeneratorTestCase(TestCase):
+    databases = ["default", "clinical"]
     maxDiff = None
 
     def _remove_duplicate_spaces(self, query_str):
@@ -721,3 +730,199 @@ class ReportGeneratorTestCase(TestCase):
                 "groupB { subB { item3 { answer } } }",
             ],
         )
+
+    def test_export_matches_graphql_query(self):
+        reg_ang = Registry.objects.create(code="ang")
+        CommonDataElement.objects.create(
+            code="DayOfWeek", name="Day of Week", abbreviated_name="Day"
+        )
+        CommonDataElement.objects.create(
+            code="TimesAwoke",
+            name="Times Awoke",
+            abbreviated_name="Awoke",
+            allow_multiple=True,
+        )
+        Section.objects.create(
+            code="SleepSection",
+            elements="DayOfWeek,TimesAwoke",
+            display_name="Sleep",
+            abbreviated_name="SleepSEC",
+            allow_multiple=True,
+        )
+        sleep_form = RegistryForm.objects.create(
+            name="SleepForm",
+            sections="SleepSection",
+            abbreviated_name="SleepFRM",
+            registry=reg_ang,
+        )
+        cfg_sleep = ContextFormGroup.objects.create(
+            registry=reg_ang,
+            code="Sleep",
+            name="Sleep Group",
+            abbreviated_name="SLE",
+            context_type="M",
+        )
+        cfg_sleep.items.create(registry_form=sleep_form)
+        CommonDataElement.objects.create(
+            code="ResideNewborn", name="x", abbreviated_name="Newborn"
+        )
+        Section.objects.create(
+            code="ANGNewbornInfancyReside",
+            elements="ResideNewborn",
+            display_name="Reside Newborn/Infancy",
+            abbreviated_name="NewInfReside",
+        )
+        history_form = RegistryForm.objects.create(
+            name="NewbornAndInfancyHistory",
+            sections="ANGNewbornInfancyReside",
+            abbreviated_name="NewInfForm",
+            registry=reg_ang,
+        )
+        cfg_history = ContextFormGroup.objects.create(
+            registry=reg_ang,
+            code="History",
+            name="History of Newborn/Infancy",
+            abbreviated_name="Hist",
+        )
+        cfg_history.items.create(registry_form=history_form)
+
+        report_design = ReportDesign.objects.create(
+            registry=reg_ang, cde_include_form_timestamp=True
+        )
+        report_design.reportdemographicfield_set.create(
+            model="patient", field="familyName", sort_order=0
+        )
+        report_design.reportclinicaldatafield_set.create(
+            context_form_group=cfg_history,
+            cde_key="NewbornAndInfancyHistory____ANGNewbornInfancyReside____ResideNewborn",
+        )
+        report_design.reportclinicaldatafield_set.create(
+            context_form_group=cfg_sleep,
+            cde_key="SleepForm____SleepSection____DayOfWeek",
+        )
+        report_design.reportclinicaldatafield_set.create(
+            context_form_group=cfg_sleep,
+            cde_key="SleepForm____SleepSection____TimesAwoke",
+        )
+
+        c_type = ContentType.objects.get_for_model(Patient)
+
+        def create_clinical_data(patient, cfg, data):
+            context = RDRFContext.objects.create(
+                context_form_group=cfg,
+                registry=reg_ang,
+                content_type=c_type,
+                object_id=patient.id,
+            )
+            ClinicalData.objects.create(
+                registry_code="ang",
+                django_id=patient.id,
+                django_model="Patient",
+                collection="cdes",
+                context_id=context.id,
+                data=data,
+            )
+
+        for i in range(5):
+            patient = Patient.objects.create(
+                family_name=f"Patient {i}",
+                consent=True,
+                date_of_birth=datetime(1970, 1, 1),
+            )
+            patient.rdrf_registry.set([reg_ang])
+            if i == 0:
+                continue
+            create_clinical_data(
+                patient,
+                cfg_history,
+                {
+                    "forms": [
+                        {
+                            "name": "NewbornAndInfancyHistory",
+                            "sections": [
+                                {
+                                    "code": "ANGNewbornInfancyReside",
+                                    "allow_multiple": False,
+                                    "cdes": [
+                                        {"code": "ResideNewborn", "value": i}
+                                    ],
+                                }
+                            ],
+                        }
+                    ],
+                    "NewbornAndInfancyHistory_timestamp": "2024-01-02T03:04:05.123456",
+                },
+            )
+            for day in range(i % 3):
+                create_clinical_data(
+                    patient,
+                    cfg_sleep,
+                    {
+                        "forms": [
+                            {
+                                "name": "SleepForm",
+                                "sections": [
+                                    {
+                                        "code": "SleepSection",
+                                        "allow_multiple": True,
+                                        "cdes": [
+                                            [
+                                                {
+                                                    "code": "DayOfWeek",
+                                                    "value": f"Day {day}",
+                                                },
+                                                {
+                                                    "code": "TimesAwoke",
+                                                    "value": [day, True],
+                                                },
+                                            ],
+                                            [],
+                                        ],
+                                    }
+                                ],
+                            }
+                        ]
+                    },
+                )
+
+        request = self._request()
+        report = ReportBuilder(report_design)
+        report.export_batch_size = 2
+
+        # Query all patients and their clinical data via the graphql schema
+        variables, query = report._get_graphql_query(request)
+        result = report.schema.execute(
+            query, variable_values=variables, context_value=request
+        )
+        self.assertIsNone(result.errors)
+        patients = result.data["ang"]["allPatients"]["patients"]
+        self.assertEqual(5, len(patients))
+        self.assertIsNone(patients[0]["clinicalData"]["History"])
+        self.assertEqual(
+            {
+                "meta": {"lastUpdated": "2024-01-02T03:04:05.123456"},
+                "ANGNewbornInfancyReside": {"ResideNewborn": "2"},
+            },
+            patients[2]["clinicalData"]["History"]["NewbornAndInfancyHistory"],
+        )
+        self.assertEqual(
+            2, len(patients[2]["clinicalData"]["Sleep"]["SleepForm"])
+        )
+
+        self.assertEqual(
+            "".join(f"{json.dumps(patient)}\n" for patient in patients),
+            "".join(report.export_to_json(request)),
+        )
+
+        headers = OrderedDict()
+        headers.update(report._get_demographic_headers(request))
+        headers.update(
+            ClinicalDataCsvUtil().csv_headers(request.user, report_design)
+        )
+        expected_rows = io.StringIO()
+        csv.DictWriter(
+            expected_rows, fieldnames=headers.keys(), extrasaction="ignore"
+        ).writerows(flatten(patient) for patient in patients)
+
+        bom, header_row, *data_rows = report.export_to_csv(request)
+        self.assertEqual(expected_rows.getvalue(), "".join(data_rows))
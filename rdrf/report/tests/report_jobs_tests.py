@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rdrf.models.definition.models import EmailPreference, Registry
+from registry.groups.models import CustomUser, WorkingGroup
+from registry.patients.models import Patient
+from report.models import ReportDesign, ReportJob, ReportJobState
+from report.report_builder import ReportBuilder
+from report.report_jobs import (
+    ReportJobContext,
+    claim_next_report_job,
+    requeue_stalled_report_jobs,
+    run_report_job,
+    submit_report_job,
+)
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.InMemoryStorage"
+)
+class ReportJobTestCase(TestCase):
+    databases = ["default", "clinical"]
+
+    def setUp(self):
+        self.registry = Registry.objects.create(code="test")
+        self.user = CustomUser.objects.create(
+            username="admin", is_staff=True, is_superuser=True
+        )
+        self.report_design = ReportDesign.objects.create(
+            registry=self.registry, title="Patients"
+        )
+        self.report_design.reportdemographicfield_set.create(
+            model="patient", field="familyName", sort_order=0
+        )
+        for family_name in ["Smith", "Jones"]:
+            self.create_patient(family_name)
+
+    def create_patient(self, family_name):
+        patient = Patient.objects.create(
+            family_name=family_name,
+            consent=True,
+            date_of_birth=datetime(1970, 1, 1),
+        )
+        patient.rdrf_registry.set([self.registry])
+        return patient
+
+    def test_run_report_job(self):
+        job = submit_report_job(self.report_design, self.user, "csv")
+        self.assertEqual(ReportJobState.QUEUED, job.state)
+
+        self.assertEqual(job, claim_next_report_job())
+        self.assertIsNone(claim_next_report_job())
+
+        job.refresh_from_db()
+        run_report_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(ReportJobState.SUCCEEDED, job.state)
+        self.assertEqual(2, job.patients_total)
+        self.assertEqual(2, job.patients_exported)
+        self.assertEqual(100, job.progress)
+
+        expected = b"".join(
+            chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+            for chunk in ReportBuilder(self.report_design).export_to_csv(
+                ReportJobContext(self.user)
+            )
+        )
+        with job.result.open("rb") as result:
+            self.assertEqual(expected, result.read())
+
+    def test_submit_report_job_reuses_results(self):
+        job = submit_report_job(self.report_design, self.user, "csv")
+        self.assertEqual(
+            job, submit_report_job(self.report_design, self.user, "csv")
+        )
+
+        # Different formats and users get their own results
+        other_user = CustomUser.objects.create(
+            username="other", is_staff=True, is_superuser=True
+        )
+        self.assertNotEqual(
+            job, submit_report_job(self.report_design, self.user, "json")
+        )
+        self.assertNotEqual(
+            job, submit_report_job(self.report_design, other_user, "csv")
+        )
+
+        # Changes to the data or the report design invalidate the result
+        patient = self.create_patient("Brown")
+        data_changed_job = submit_report_job(
+            self.report_design, self.user, "csv"
+        )
+        self.assertNotEqual(job, data_changed_job)
+
+        self.report_design.reportdemographicfield_set.create(
+            model="patient", field="givenNames", sort_order=1
+        )
+        design_changed_job = submit_report_job(
+            self.report_design, self.user, "csv"
+        )
+        self.assertNotEqual(data_changed_job, design_changed_job)
+
+        patient.delete()
+        self.assertNotEqual(
+            design_changed_job,
+            submit_report_job(self.report_design, self.user, "csv"),
+        )
+
+        # Failed results are not reused
+        ReportJob.objects.update(state=ReportJobState.FAILED)
+        self.assertNotIn(
+            submit_report_job(self.report_design, self.user, "csv"),
+            ReportJob.objects.filter(state=ReportJobState.FAILED),
+        )
+
+    def test_patient_details_invalidate_results(self):
+        patient = Patient.objects.get(family_name="Smith")
+        job = submit_report_job(self.report_design, self.user, "csv")
+
+        # Working group changes don't update the patient timestamps
+        working_group = WorkingGroup.objects.create(
+            name="WA", registry=self.registry
+        )
+        patient.working_groups.add(working_group)
+        working_group_job = submit_report_job(
+            self.report_design, self.user, "csv"
+        )
+        self.assertNotEqual(job, working_group_job)
+
+        working_group.name = "NSW"
+        working_group.save()
+        self.assertNotEqual(
+            working_group_job,
+            submit_report_job(self.report_design, self.user, "csv"),
+        )
+
+    def test_user_changes_invalidate_results(self):
+        patient = Patient.objects.get(family_name="Smith")
+        patient_user = CustomUser.objects.create(username="smith")
+        patient.user = patient_user
+        patient.save()
+        job = submit_report_job(self.report_design, self.user, "csv")
+
+        # Logins save the user's last_login
+        patient_user.last_login = timezone.now()
+        patient_user.save(update_fields=["last_login"])
+        login_job = submit_report_job(self.report_design, self.user, "csv")
+        self.assertNotEqual(job, login_job)
+
+        EmailPreference.objects.create(user=patient_user, unsubscribe_all=True)
+        self.assertNotEqual(
+            login_job,
+            submit_report_job(self.report_design, self.user, "csv"),
+        )
+
+    def test_requeue_stalled_report_jobs(self):
+        job = submit_report_job(self.report_design, self.user, "csv")
+        claim_next_report_job()
+
+        self.assertEqual(0, requeue_stalled_report_jobs(timedelta(hours=1)))
+
+        ReportJob.objects.filter(pk=job.pk).update(
+            last_updated_at=timezone.now() - timedelta(hours=2),
+            patients_exported=1000,
+        )
+        self.assertEqual(1, requeue_stalled_report_jobs(timedelta(hours=1)))
+
+        job.refresh_from_db()
+        self.assertEqual(ReportJobState.QUEUED, job.state)
+        self.assertEqual(0, job.patients_exported)
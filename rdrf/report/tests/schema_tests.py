@@ -4,9 +4,12 @@ from datetime import datetime
 import pytest
 from django.contrib.auth.models import Group
 from django.contrib.contenttypes.models import ContentType
+from django.db import connections
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from graphene.test import Client
 
+from rdrf.helpers.definition_version import bump_definition_version
 from rdrf.helpers.registry_features import RegistryFeatures
 from rdrf.models.definition.models import (
     Registry,
@@ -21,13 +24,20 @@ from rdrf.models.definition.models import (
     CDEPermittedValueGroup,
     CDEPermittedValue,
     ConsentRule,
+    EmailPreference,
 )
 from registry.groups import GROUPS as RDRF_GROUPS
-from registry.groups.models import CustomUser, WorkingGroup
-from registry.patients.models import Patient, AddressType, ConsentValue
+from registry.groups.models import CustomUser, WorkingGroup, WorkingGroupType
+from registry.patients.models import (
+    Patient,
+    AddressType,
+    ConsentValue,
+    ParentGuardian,
+)
 from report.TrrfGraphQLView import PublicGraphQLError
 from report.schema import (
     create_dynamic_schema,
+    get_dynamic_schema,
     to_snake_case,
     to_camel_case,
     validate_fields,
@@ -1561,6 +1571,163 @@ class SchemaTest(TestCase):
 
         self.assertEqual(fields, ["CDE1", "CDE2"])
 
+    def test_dynamic_schema_is_cached(self):
+        schema = get_dynamic_schema()
+        self.assertIs(schema, get_dynamic_schema())
+
+        # Changes to the registry definition invalidate the cached schema
+        CommonDataElement.objects.create(
+            code="CDE1", abbreviated_name="CDE-1", name="CDE-1"
+        )
+        changed_schema = get_dynamic_schema()
+        self.assertIsNot(schema, changed_schema)
+        self.assertIs(changed_schema, get_dynamic_schema())
+
+        # As does explicit invalidation
+        bump_definition_version()
+        self.assertIsNot(changed_schema, get_dynamic_schema())
+
+    def test_query_patients_batches_related_data(self):
+        CommonDataElement.objects.create(
+            code="CDE1", abbreviated_name="CDE-1", name="CDE-1"
+        )
+        Section.objects.create(
+            code="SEC1",
+            elements="CDE1",
+            abbreviated_name="SEC1",
+            display_name="SEC1",
+        )
+        form = RegistryForm.objects.create(
+            name="FORM1",
+            sections="SEC1",
+            registry=self.registry,
+            abbreviated_name="FORM1",
+        )
+        cfg = ContextFormGroup.objects.create(
+            code="CFG1",
+            registry=self.registry,
+            name="CFG1",
+            context_type="F",
+            abbreviated_name="CFG1",
+            sort_order=1,
+        )
+        cfg.items.create(registry_form=form)
+        consent_section = ConsentSection.objects.create(
+            code="CS1", section_label="CS1", registry=self.registry
+        )
+        consent_question = ConsentQuestion.objects.create(
+            code="CQ1", section=consent_section
+        )
+        wg_type = WorkingGroupType.objects.create(name="Clinic")
+        working_group = WorkingGroup.objects.create(
+            name="Clinic A", type=wg_type, registry=self.registry
+        )
+        c_type = ContentType.objects.get_for_model(Patient)
+
+        def create_patient(i):
+            patient_user = CustomUser.objects.create(username=f"patient{i}")
+            EmailPreference.objects.create(
+                user=patient_user, unsubscribe_all=bool(i % 2)
+            )
+            parent_user = CustomUser.objects.create(username=f"parent{i}")
+            EmailPreference.objects.create(
+                user=parent_user, unsubscribe_all=True
+            )
+            patient = Patient.objects.create(
+                consent=True,
+                date_of_birth=datetime(1970, 1, 1),
+                user=patient_user,
+            )
+            patient.rdrf_registry.set([self.registry])
+            patient.working_groups.set([working_group])
+            ParentGuardian.objects.create(user=parent_user).patient.set(
+                [patient]
+            )
+            ConsentValue.objects.create(
+                patient=patient, consent_question=consent_question, answer=True
+            )
+            context = RDRFContext.objects.create(
+                context_form_group=cfg,
+                registry=self.registry,
+                content_type=c_type,
+                object_id=patient.id,
+            )
+            ClinicalData.objects.create(
+                registry_code="test",
+                django_id=patient.id,
+                django_model="Patient",
+                collection="cdes",
+                context_id=context.id,
+                data={
+                    "forms": [
+                        {
+                            "name": "FORM1",
+                            "sections": [
+                                {
+                                    "code": "SEC1",
+                                    "allow_multiple": False,
+                                    "cdes": [{"code": "CDE1", "value": str(i)}],
+                                }
+                            ],
+                        }
+                    ]
+                },
+            )
+
+        for i in range(6):
+            create_patient(i)
+
+        client = Client(create_dynamic_schema())
+
+        def query_patients(limit):
+            query = (
+                """
+            {
+                test {
+                    allPatients {
+                        patients(sort: ["id"], limit: %d) {
+                            consents { CS1 { CQ1 { answer } } }
+                            workingGroupTypes { Clinic { name } }
+                            clinicalData { CFG1 { FORM1 { SEC1 { CDE1 } } } }
+                            patientEmailPreferences { unsubscribeAll }
+                            parentEmailPreferences { unsubscribeAll }
+                        }
+                    }
+                }
+            }
+            """
+                % limit
+            )
+            with (
+                CaptureQueriesContext(
+                    connections["default"]
+                ) as default_queries,
+                CaptureQueriesContext(
+                    connections["clinical"]
+                ) as clinical_queries,
+            ):
+                result = client.execute(query, context_value=self.query_context)
+            self.assertNotIn("errors", result)
+            patients = result["data"]["test"]["allPatients"]["patients"]
+            return patients, len(default_queries) + len(clinical_queries)
+
+        patients, small_page_queries = query_patients(2)
+        self.assertEqual(2, len(patients))
+        patients, large_page_queries = query_patients(6)
+        self.assertEqual(6, len(patients))
+        self.assertEqual(small_page_queries, large_page_queries)
+
+        self.assertEqual(
+            {
+                "consents": {"CS1": {"CQ1": {"answer": True}}},
+                "workingGroupTypes": {"Clinic": [{"name": "Clinic A"}]},
+                "clinicalData": {"CFG1": {"FORM1": {"SEC1": {"CDE1": "5"}}}},
+                "patientEmailPreferences": {"unsubscribeAll": True},
+                "parentEmailPreferences": {"unsubscribeAll": True},
+            },
+            patients[5],
+        )
+
     def test_to_snake_case(self):
         self.assertEqual(to_snake_case("givenNames"), "given_names")
         self.assertEqual(to_snake_case("stage"), "stage")
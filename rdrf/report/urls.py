@@ -1,11 +1,31 @@
 from django.urls import re_path
 
-from report.views import ReportDesignView, ReportDownloadView, ReportsView
+from report.views import (
+    ReportDesignView,
+    ReportDownloadView,
+    ReportJobDownloadView,
+    ReportJobSubmitView,
+    ReportJobView,
+    ReportsView,
+)
 
 app_name = "report"
 
 urlpatterns = [
     re_path(r"^list$", ReportsView.as_view(), name="reports_list"),
+    re_path(
+        r"^jobs/(?P<job_id>\d+)/?$", ReportJobView.as_view(), name="report_job"
+    ),
+    re_path(
+        r"^jobs/(?P<job_id>\d+)/download/?$",
+        ReportJobDownloadView.as_view(),
+        name="report_job_download",
+    ),
+    re_path(
+        r"^submit/(?P<report_id>\w+)/(?P<format>\w+)/?$",
+        ReportJobSubmitView.as_view(),
+        name="report_job_submit",
+    ),
     re_path(
         r"^(?P<report_id>\w+)/?$",
         ReportDesignView.as_view(),
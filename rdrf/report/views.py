@@ -1,17 +1,24 @@
 import logging
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse, StreamingHttpResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views import View
 
 from rdrf.models.definition.models import ContextFormGroup, Registry
 from rdrf.security.mixins import SuperuserRequiredMixin
 from report.forms import ReportDesignerForm
-from report.models import ReportDesign
+from report.models import ReportDesign, ReportJob, ReportJobState
 from report.report_builder import ReportBuilder
+from report.report_jobs import submit_report_job
 
 logger = logging.getLogger(__name__)
 
@@ -34,43 +41,116 @@ class ReportsView(PermissionRequiredMixin, View):
         return render(
             request,
             "reports_list.html",
-            {"reports": ReportDesign.objects.reports_for_user(request.user)},
+            {
+                "reports": ReportDesign.objects.reports_for_user(request.user),
+                "run_in_background": settings.REPORTS_RUN_IN_BACKGROUND,
+            },
         )
 
 
+REPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    # Line delimited json to support streaming of data
+    "json": "application/json-seq",
+}
+
+
+def _validate_report(request, report, format):
+    is_valid, errors = report.validate_query(request)
+    if not is_valid:
+        logger.error(errors)
+        return errors
+
+    if format == "csv":
+        is_valid, errors = report.validate_for_csv_export()
+        if not is_valid:
+            return errors
+
+    return None
+
+
 class ReportDownloadView(ReportDownloadAccessCheckMixin, View):
     def get(self, request, report_id, format):
         report_design = get_object_or_404(ReportDesign, pk=report_id)
         report = ReportBuilder(report_design=report_design)
 
-        is_valid, errors = report.validate_query(request)
-        if not is_valid:
-            logger.error(errors)
+        if format not in REPORT_CONTENT_TYPES:
+            raise Exception("Unsupported download format")
+
+        errors = _validate_report(request, report, format)
+        if errors:
             return render(
                 request, "report_download_errors.html", {"errors": errors}
             )
 
         if format == "csv":
-            is_valid, errors = report.validate_for_csv_export()
-            if not is_valid:
-                return render(
-                    request, "report_download_errors.html", {"errors": errors}
-                )
-            content_type = "text/csv; charset=utf-8"
             content = report.export_to_csv(request)
-        elif format == "json":
-            # Line delimited json to support streaming of data
-            content_type = "application/json-seq"
-            content = report.export_to_json(request)
         else:
-            raise Exception("Unsupported download format")
+            content = report.export_to_json(request)
 
         filename = f"report_{report_design.title}.{format}"
-        response = StreamingHttpResponse(content, content_type=content_type)
+        response = StreamingHttpResponse(
+            content, content_type=REPORT_CONTENT_TYPES[format]
+        )
         response["Content-Disposition"] = f'attachment; filename="{filename}"'
         return response
 
 
+class ReportJobSubmitView(ReportDownloadAccessCheckMixin, View):
+    def post(self, request, report_id, format):
+        report_design = get_object_or_404(ReportDesign, pk=report_id)
+
+        if format not in REPORT_CONTENT_TYPES:
+            raise Exception("Unsupported download format")
+
+        errors = _validate_report(
+            request, ReportBuilder(report_design=report_design), format
+        )
+        if errors:
+            return render(
+                request, "report_download_errors.html", {"errors": errors}
+            )
+
+        job = submit_report_job(report_design, request.user, format)
+        return redirect("report:report_job", job_id=job.id)
+
+
+class ReportJobAccessCheckMixin:
+    def get_job(self, request, job_id):
+        job = get_object_or_404(ReportJob, pk=job_id)
+        has_report_access = (
+            ReportDesign.objects.reports_for_user(request.user)
+            .filter(pk=job.report_design_id)
+            .exists()
+        )
+        if job.user != request.user or not has_report_access:
+            raise PermissionDenied
+        return job
+
+
+class ReportJobView(ReportJobAccessCheckMixin, View):
+    def get(self, request, job_id):
+        return render(
+            request,
+            "report_job.html",
+            {"job": self.get_job(request, job_id), "states": ReportJobState},
+        )
+
+
+class ReportJobDownloadView(ReportJobAccessCheckMixin, View):
+    def get(self, request, job_id):
+        job = self.get_job(request, job_id)
+        if job.state != ReportJobState.SUCCEEDED or not job.result:
+            raise Http404("Report is not available for download")
+
+        return FileResponse(
+            job.result.open("rb"),
+            as_attachment=True,
+            filename=job.filename,
+            content_type=REPORT_CONTENT_TYPES[job.format],
+        )
+
+
 class ReportDesignView(SuperuserRequiredMixin, View):
     def get(self, request, report_id=None):
         if report_id:
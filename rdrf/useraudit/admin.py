@@ -20,6 +20,20 @@ class LogAdmin(admin.ModelAdmin):
     )
     list_display_links = None
 
+    # The log is append only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class LoginLogSummaryAdmin(LogAdmin):
+    model = m.LoginLogSummary
+
+    list_filter = ["date"]
+    list_display = ("date", "username", "logins", "failed_logins")
+
 
 class LoginAttemptAdmin(admin.ModelAdmin):
     model = m.LoginAttempt
@@ -46,4 +60,5 @@ class LoginAttemptAdmin(admin.ModelAdmin):
 
 admin.site.register(m.LoginLog, LogAdmin)
 admin.site.register(m.FailedLoginLog, LogAdmin)
+admin.site.register(m.LoginLogSummary, LoginLogSummaryAdmin)
 admin.site.register(m.LoginAttempt, LoginAttemptAdmin)
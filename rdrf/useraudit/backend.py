@@ -7,57 +7,74 @@ from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.views.decorators.debug import sensitive_variables
 
-from .models import LoginAttempt, LoginAttemptLogger, LoginLogger
+from .models import login_attempt_logger, login_logger
 from .signals import login_failure_limit_reached
 
 logger = logging.getLogger("django.security")
 
 
 @receiver(pre_save, sender=settings.AUTH_USER_MODEL)
-def user_pre_save(sender, instance=None, raw=False, **kwargs):
+def user_pre_save(
+    sender, instance=None, raw=False, update_fields=None, **kwargs
+):
     user = instance
     is_new_user = user.pk is None
-    if is_new_user or raw:
+    if is_new_user or raw or not user.is_active:
+        return
+    if update_fields is not None and "is_active" not in update_fields:
         return
 
-    # User has been re-activated. Ensure the failed login counter is set to 0 so
-    # that the user isn't inactivated on next login by the AuthFailedLoggerBackend
-    current_user = sender.objects.get(pk=user.pk)
-    if not current_user.is_active and user.is_active:
-        LoginAttemptLogger().reset(user.username)
+    # An active user who has reached the failed login limit has been
+    # re-activated. Ensure the failed login counter is set to 0 so that the
+    # user isn't inactivated on next login by the AuthFailedLoggerBackend.
+    # Checking the count saves re-reading the user on every save.
+    login_failure_limit = getattr(settings, "LOGIN_FAILURE_LIMIT", None) or 0
+    username = user.get_username()
+    if (
+        login_failure_limit > 0
+        and login_attempt_logger.get_count(username) >= login_failure_limit
+    ):
+        login_attempt_logger.reset(username)
 
 
 class AuthFailedLoggerBackend(object):
     def __init__(self):
-        self.login_logger = LoginLogger()
+        self.login_logger = login_logger
         self.login_failure_limit = (
             getattr(settings, "LOGIN_FAILURE_LIMIT", None) or 0
         )
-        self.login_attempt_logger = LoginAttemptLogger()
+        self.login_attempt_logger = login_attempt_logger
 
     @sensitive_variables("credentials")
     def authenticate(self, request=None, **credentials):
         UserModel = get_user_model()
         self.username = credentials.get(UserModel.USERNAME_FIELD)
         self.login_logger.log_failed_login(self.username, request)
-        if self._get_user() is not None:
-            self.login_attempt_logger.increment(self.username)
-            self.block_user_if_needed()
+        # Only the failed logins of existing users are counted
+        user = self._get_user() if self.username is not None else None
+        if user is not None:
+            self.count = self.login_attempt_logger.increment(
+                user.get_username()
+            )
+            self.block_user_if_needed(user)
 
         return None
 
-    def block_user_if_needed(self):
+    def block_user_if_needed(self, user):
         if not self.is_login_failure_limit_enabled():
             return
-        if self.is_attempts_exceeded():
-            self._deactivate_user()
-            user = self._get_user()
-            login_failure_limit_reached.send(sender=user.__class__, user=user)
-            logger.info(
-                "Login Prevented for user '%s'! Maximum failed logins %d reached!",
-                self.username,
-                self.login_failure_limit,
-            )
+        if self.is_attempts_limit_reached():
+            # Users already blocked by an earlier failed login are left as is
+            if user.is_active:
+                self._deactivate_user(user)
+                login_failure_limit_reached.send(
+                    sender=user.__class__, user=user
+                )
+                logger.info(
+                    "Login Prevented for user '%s'! Maximum failed logins %d reached!",
+                    self.username,
+                    self.login_failure_limit,
+                )
             raise PermissionDenied(
                 "Username '%s' has been blocked" % self.username
             )
@@ -65,20 +82,8 @@ class AuthFailedLoggerBackend(object):
     def is_login_failure_limit_enabled(self):
         return self.login_failure_limit > 0
 
-    def is_attempts_exceeded(
-        self,
-    ):
-        count = self._get_count()
-        if count and count >= self.login_failure_limit:
-            return True
-        return False
-
-    def _get_count(self):
-        try:
-            obj = LoginAttempt.objects.get(username=self.username)
-            return obj.count
-        except LoginAttempt.DoesNotExist:
-            return None
+    def is_attempts_limit_reached(self):
+        return self.count >= self.login_failure_limit
 
     def _get_user(self):
         UserModel = get_user_model()
@@ -90,11 +95,7 @@ class AuthFailedLoggerBackend(object):
             )
             return None
 
-    def _deactivate_user(self):
-        user = self._get_user()
-        if user:
-            user.is_active = False
-            user.save(update_fields=["is_active"])
-            logger.warning("Username '%s' has been blocked" % self.username)
-            return True
-        return False
+    def _deactivate_user(self, user):
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        logger.warning("Username '%s' has been blocked" % self.username)
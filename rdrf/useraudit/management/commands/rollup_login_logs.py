@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ...retention import rollup_login_logs
+
+
+class Command(BaseCommand):
+    help = """
+       Summarises the login log entries older than the retention period
+       into daily totals per username and deletes them.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Number of days of entries to keep, defaults to LOGIN_LOG_RETENTION_DAYS",
+        )
+
+    def handle(self, *args, **options):
+        deleted = rollup_login_logs(days=options["days"])
+        self.stdout.write("Summarised %s login log entries" % deleted)
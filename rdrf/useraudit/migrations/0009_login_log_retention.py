@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-17 10:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('useraudit', '0008_useraudit_unique_attempt_username'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='failedloginlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='loginlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='failedloginlog',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['timestamp'], name='failedloginlog_timestamp_brin'),
+        ),
+        migrations.AddIndex(
+            model_name='loginlog',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['timestamp'], name='loginlog_timestamp_brin'),
+        ),
+        migrations.CreateModel(
+            name='LoginLogSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('username', models.CharField(blank=True, max_length=255)),
+                ('logins', models.PositiveIntegerField(default=0)),
+                ('failed_logins', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date', 'username'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='loginlogsummary',
+            constraint=models.UniqueConstraint(fields=('date', 'username'), name='unique_login_log_summary'),
+        ),
+    ]
@@ -1,10 +1,16 @@
 from __future__ import unicode_literals
 
-import datetime
+import atexit
 import logging
+import threading
+import time
 
+from django.conf import settings
 from django.contrib.auth.signals import user_logged_in
-from django.db import models
+from django.contrib.postgres.indexes import BrinIndex
+from django.core.signals import request_finished
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 
 from .signals import (
     account_has_expired,
@@ -24,23 +30,57 @@ class LoginAttempt(models.Model):
 
 
 class LoginAttemptLogger(object):
+    """
+    Counts the failed logins of existing users in their LoginAttempt. The
+    count is updated in place, so concurrent failed logins are all counted
+    and nothing is lost when caches are cleared.
+    """
+
     def reset(self, username):
-        defaults = {"count": 0, "timestamp": datetime.datetime.now()}
-        LoginAttempt.objects.update_or_create(
-            username=username, defaults=defaults
+        LoginAttempt.objects.filter(username=username).exclude(count=0).update(
+            count=0, timestamp=timezone.now()
         )
 
     def increment(self, username):
-        obj, created = LoginAttempt.objects.get_or_create(username=username)
-        obj.count += 1
-        obj.timestamp = datetime.datetime.now()
-        obj.save()
+        attempts = LoginAttempt.objects.filter(username=username)
+        if not attempts.update(
+            count=models.F("count") + 1, timestamp=timezone.now()
+        ):
+            try:
+                with transaction.atomic():
+                    LoginAttempt.objects.create(username=username, count=1)
+                return 1
+            except IntegrityError:
+                # Created by a concurrent failed login
+                attempts.update(
+                    count=models.F("count") + 1, timestamp=timezone.now()
+                )
+        return attempts.values_list("count", flat=True).get()
+
+    def get_count(self, username):
+        count = (
+            LoginAttempt.objects.filter(username=username)
+            .values_list("count", flat=True)
+            .first()
+        )
+        return count or 0
 
 
 class Log(models.Model):
+    """
+    Append only audit log. The entries are never changed, and are
+    summarised into LoginLogSummary and deleted by the rollup_login_logs
+    command once they are older than LOGIN_LOG_RETENTION_DAYS.
+    """
+
     class Meta:
         abstract = True
         ordering = ["-timestamp"]
+        # The rows are inserted in timestamp order, so a small BRIN index
+        # is enough for the time range queries and the retention deletes
+        indexes = [
+            BrinIndex(fields=["timestamp"], name="%(class)s_timestamp_brin")
+        ]
 
     username = models.CharField(max_length=255, null=True, blank=True)
     ip_address = models.CharField(
@@ -48,7 +88,8 @@ class Log(models.Model):
     )
     forwarded_by = models.CharField(max_length=1000, null=True, blank=True)
     user_agent = models.CharField(max_length=1000, null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the login happens, the entry may be written later in a batch
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return "%s|%s|%s|%s|%s" % (
@@ -59,6 +100,13 @@ class Log(models.Model):
             self.timestamp,
         )
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError(
+                "%s entries can't be changed" % type(self).__name__
+            )
+        super().save(*args, **kwargs)
+
 
 class UserDeactivation(models.Model):
     ACCOUNT_EXPIRED = "AE"
@@ -86,14 +134,79 @@ class LoginLog(Log):
     pass
 
 
+class LoginLogSummary(models.Model):
+    """
+    Daily number of logins and failed logins per username, kept once the
+    log entries have been deleted.
+    """
+
+    date = models.DateField()
+    username = models.CharField(max_length=255, blank=True)
+    logins = models.PositiveIntegerField(default=0)
+    failed_logins = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-date", "username"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "username"], name="unique_login_log_summary"
+            )
+        ]
+
+    def __str__(self):
+        return "%s|%s|%s|%s" % (
+            self.date,
+            self.username,
+            self.logins,
+            self.failed_logins,
+        )
+
+
 class LoginLogger(object):
+    """
+    Buffers the log entries and writes them in batches of
+    LOGIN_LOG_BATCH_SIZE, or once the oldest buffered entry is
+    LOGIN_LOG_FLUSH_INTERVAL seconds old. Whatever is buffered is always
+    written at the end of a request and when the process exits, so entries
+    are never held between requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._oldest = None
+
     def log_failed_login(self, username, request):
-        fields = self.extract_log_info(username, request)
-        FailedLoginLog.objects.create(**fields)
+        self._log(FailedLoginLog, username, request)
 
     def log_login(self, username, request):
+        self._log(LoginLog, username, request)
+
+    def _log(self, model, username, request):
         fields = self.extract_log_info(username, request)
-        LoginLog.objects.create(**fields)
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(model(**fields))
+        self.flush()
+
+    def _is_flush_due(self):
+        batch_size = getattr(settings, "LOGIN_LOG_BATCH_SIZE", 1)
+        interval = getattr(settings, "LOGIN_LOG_FLUSH_INTERVAL", 5)
+        return bool(self._pending) and (
+            len(self._pending) >= batch_size
+            or time.monotonic() - self._oldest >= interval
+        )
+
+    def flush(self, force=False):
+        with self._lock:
+            if not (force or self._is_flush_due()):
+                return
+            pending, self._pending = self._pending, []
+        for model in (LoginLog, FailedLoginLog):
+            entries = [entry for entry in pending if type(entry) is model]
+            if entries:
+                model.objects.bulk_create(entries)
 
     def extract_log_info(self, username, request):
         USER_AGENT_MAX_LENGTH = Log._meta.get_field("user_agent").max_length
@@ -138,6 +251,23 @@ login_logger = LoginLogger()
 login_attempt_logger = LoginAttemptLogger()
 
 
+def flush_login_log(sender, **kwargs):
+    # Nothing is left in memory after a request, where it could be lost
+    # with the process
+    login_logger.flush(force=True)
+
+
+def flush_login_log_on_exit():
+    try:
+        login_logger.flush(force=True)
+    except Exception:
+        logger.exception("Could not write the buffered login log entries")
+
+
+request_finished.connect(flush_login_log)
+atexit.register(flush_login_log_on_exit)
+
+
 def login_callback(sender, user, request, **kwargs):
     username = user.get_username()
     login_logger.log_login(username, request)
@@ -0,0 +1,90 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import FailedLoginLog, LoginLog, LoginLogSummary
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ((LoginLog, "logins"), (FailedLoginLog, "failed_logins"))
+
+
+def _start_of_day(date):
+    start = datetime.datetime.combine(date, datetime.time.min)
+    if settings.USE_TZ:
+        start = timezone.make_aware(start)
+    return start
+
+
+def _today():
+    return timezone.localdate() if settings.USE_TZ else datetime.date.today()
+
+
+def _rollup_day(date):
+    start = _start_of_day(date)
+    end = _start_of_day(date + datetime.timedelta(days=1))
+    summaries = {
+        summary.username: summary
+        for summary in LoginLogSummary.objects.filter(date=date)
+    }
+    deleted = 0
+    for model, field in SUMMARY_FIELDS:
+        entries = model.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        for row in (
+            entries.values("username").annotate(count=Count("id")).order_by()
+        ):
+            username = row["username"] or ""
+            if username not in summaries:
+                summaries[username] = LoginLogSummary(
+                    date=date, username=username
+                )
+            summary = summaries[username]
+            setattr(summary, field, getattr(summary, field) + row["count"])
+        deleted += entries.delete()[0]
+
+    LoginLogSummary.objects.bulk_create(
+        [summary for summary in summaries.values() if summary.pk is None]
+    )
+    LoginLogSummary.objects.bulk_update(
+        [summary for summary in summaries.values() if summary.pk is not None],
+        [field for __, field in SUMMARY_FIELDS],
+    )
+    return deleted
+
+
+def rollup_login_logs(days=None):
+    """
+    Summarises the login log entries older than `days` (by default
+    LOGIN_LOG_RETENTION_DAYS) into daily LoginLogSummary rows and deletes
+    them. Each day is handled in its own transaction, so the deletes
+    don't hold long locks. Returns the number of deleted entries.
+    """
+    if days is None:
+        days = getattr(settings, "LOGIN_LOG_RETENTION_DAYS", 365)
+    before = _start_of_day(_today() - datetime.timedelta(days=days))
+
+    dates = set()
+    for model, __ in SUMMARY_FIELDS:
+        dates.update(
+            model.objects.filter(timestamp__lt=before)
+            .annotate(date=TruncDate("timestamp"))
+            .values_list("date", flat=True)
+            .distinct()
+            .order_by()
+        )
+
+    deleted = 0
+    for date in sorted(dates):
+        with transaction.atomic():
+            deleted += _rollup_day(date)
+
+    logger.info(
+        "Summarised and deleted %s login log entries older than %s"
+        % (deleted, before)
+    )
+    return deleted
@@ -20,7 +20,7 @@ from useraudit.signals import (
     account_has_expired,
     password_will_expire_warning,
 )
-from useraudit.models import UserDeactivation
+from useraudit.models import LoginAttempt, UserDeactivation
 
 # Saving a reference to the USER_MODEL set in the settings.py file
 # Our pre_save handler in password_expiry.py gets registered just for this sender
@@ -444,6 +444,30 @@ class FailedLoginAttemtpsTestCase(TestCase):
         self.assertIsNone(u)
         self.assertEqual(uds, 0)
 
+    def test_attempts_saved_for_existing_users(self):
+        _ = authenticate(username=self.username, password="INCORRECT")
+        attempt = LoginAttempt.objects.get()
+        self.assertEqual(attempt.username, self.username)
+        self.assertEqual(attempt.count, 1)
+        _ = authenticate(username=self.username.upper(), password="INCORRECT")
+        self.assertEqual(LoginAttempt.objects.get().count, 2)
+        self.assertFalse(self.user2.is_active)
+
+        _ = authenticate(username="doesnotexist", password="INCORRECT")
+        self.assertEqual(LoginAttempt.objects.count(), 1)
+
+    def test_saved_attempts_count_towards_limit(self):
+        LoginAttempt.objects.create(username=self.username, count=1)
+        _ = authenticate(username=self.username, password="INCORRECT")
+        self.assertFalse(self.user2.is_active)
+
+        # Failed logins of the blocked user don't deactivate it again
+        _ = authenticate(username=self.username, password="INCORRECT")
+        self.assertEqual(LoginAttempt.objects.get().count, 3)
+        self.assertEqual(
+            UserDeactivation.objects.filter(username=self.username).count(), 1
+        )
+
     def test_failure_counter_reset_when_reactivated(self):
         _ = authenticate(username=self.username, password="INCORRECT")
         _ = authenticate(username=self.username, password="INCORRECT")
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from django.core import management
+from django.test import TestCase, override_settings
+
+from .. import models as m
+from ..backend import AuthFailedLoggerBackend
+
+
+class LoginLogRetentionTest(TestCase):
+    def log(self, model, username, days_ago):
+        model.objects.create(
+            username=username,
+            timestamp=datetime.now() - timedelta(days=days_ago),
+        )
+
+    def test_old_entries_are_summarised(self):
+        self.log(m.LoginLog, "john", 40)
+        self.log(m.LoginLog, "john", 40)
+        self.log(m.FailedLoginLog, "john", 40)
+        self.log(m.FailedLoginLog, None, 40)
+        self.log(m.FailedLoginLog, "sue", 35)
+        self.log(m.LoginLog, "john", 10)
+
+        management.call_command("rollup_login_logs", days=30)
+
+        self.assertEqual(m.LoginLog.objects.count(), 1)
+        self.assertEqual(m.FailedLoginLog.objects.count(), 0)
+        summaries = {
+            (s.username, s.logins, s.failed_logins)
+            for s in m.LoginLogSummary.objects.all()
+        }
+        self.assertEqual(summaries, {("john", 2, 1), ("", 0, 1), ("sue", 0, 1)})
+
+        # Later entries of the same day are added to the summary
+        self.log(m.LoginLog, "john", 40)
+        management.call_command("rollup_login_logs", days=30)
+        summary = m.LoginLogSummary.objects.get(username="john")
+        self.assertEqual(summary.logins, 3)
+
+    def test_entries_are_append_only(self):
+        log = m.LoginLog.objects.create(username="john")
+        log.username = "sue"
+        with self.assertRaises(ValueError):
+            log.save()
+
+
+class LoginLogBatchTest(TestCase):
+    def tearDown(self):
+        m.login_logger.flush(force=True)
+
+    @override_settings(LOGIN_LOG_BATCH_SIZE=3, LOGIN_LOG_FLUSH_INTERVAL=60)
+    def test_entries_are_written_in_batches(self):
+        backend = AuthFailedLoggerBackend()
+        backend.authenticate(username="user1")
+        backend.authenticate(username="user2")
+        self.assertEqual(m.FailedLoginLog.objects.count(), 0)
+
+        with self.assertNumQueries(1):
+            m.login_logger.log_failed_login("user3", None)
+        self.assertEqual(
+            sorted(m.FailedLoginLog.objects.values_list("username", flat=True)),
+            ["user1", "user2", "user3"],
+        )
+
+    @override_settings(LOGIN_LOG_BATCH_SIZE=3, LOGIN_LOG_FLUSH_INTERVAL=60)
+    def test_entries_written_at_end_of_request(self):
+        m.login_logger.log_failed_login("user1", None)
+        self.assertEqual(m.FailedLoginLog.objects.count(), 0)
+        m.flush_login_log(sender=None)
+        self.assertEqual(m.FailedLoginLog.objects.count(), 1)